@@ -1,23 +1,61 @@
 """Application factory for the Lentivirus tracker."""
 from __future__ import annotations
 
+import os
 from pathlib import Path
+from typing import Optional
 
 from flask import Flask
 
-from .database import db, migrate, prepare_database_paths
-from .schema import ensure_sqlite_schema
+from .analytics import register_analytics_hooks
+from .cache import cache_settings, init_experiment_cache, register_cache_hooks
+from .charts import init_chart_cache
+from .cli import register_commands
+from .database import (
+    apply_sqlite_pragmas,
+    concurrency_settings,
+    db,
+    init_read_pool,
+    init_write_queue,
+    migrate,
+    prepare_database_paths,
+    storage_profile,
+)
+from .prediction import init_titer_model
+from .profiling import init_profiling, profiling_enabled, query_watch_settings
+from .rollups import register_rollup_hooks
+from .schema import AUTO_MIGRATE_ENV, migrate_schema, pending_migrations
+from .serializers import init_json_backend, json_backend
+from .sync import register_sync_hooks
 
 
-def create_app() -> Flask:
+def create_app(database_path: Optional[Path] = None) -> Flask:
+    """Build the app; ``database_path`` overrides ``LENTI_DATABASE_PATH`` and the instance file."""
     app = Flask(__name__)
 
-    db_path = prepare_database_paths(Path(app.root_path))
+    db_path = Path(database_path).resolve() if database_path else prepare_database_paths(Path(app.root_path))
+    profile_name, pragmas = storage_profile()
+    concurrency = concurrency_settings()
+    cache_enabled, cache_max_bytes = cache_settings()
+    backend = json_backend()
+    watch_mode, repeat_limit = query_watch_settings()
     app.config.update(
         SQLALCHEMY_DATABASE_URI=f'sqlite:///{db_path}',
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'check_same_thread': False}},
+        SQLITE_STORAGE_PROFILE=profile_name,
+        SQLITE_PRAGMAS=pragmas,
+        SQLITE_CONCURRENCY=concurrency,
+        SCHEMA_AUTO_MIGRATE=os.environ.get(AUTO_MIGRATE_ENV, '1').strip().lower()
+        not in {'0', 'false', 'no', 'off'},
+        EXPERIMENT_CACHE_ENABLED=cache_enabled,
+        EXPERIMENT_CACHE_MAX_BYTES=cache_max_bytes,
+        JSON_BACKEND=backend,
+        REQUEST_PROFILING=profiling_enabled(),
+        QUERY_WATCH=watch_mode,
+        QUERY_REPEAT_LIMIT=repeat_limit,
     )
+    init_json_backend(app, backend)
 
     db.init_app(app)
     migrate.init_app(app, db)
@@ -27,9 +65,26 @@ def create_app() -> Flask:
     from .routes import bp as main_bp
 
     app.register_blueprint(main_bp)
+    register_commands(app)
+    register_rollup_hooks()
+    register_analytics_hooks()
+    register_sync_hooks()
+    register_cache_hooks()
 
     with app.app_context():
-        db.create_all()
-        ensure_sqlite_schema()
+        apply_sqlite_pragmas(db.engine, pragmas)
+        if app.config['SCHEMA_AUTO_MIGRATE']:
+            migrate_schema()
+        elif pending_migrations():
+            app.logger.warning(
+                'Database schema is behind; run `flask --app app.app migrate-schema` before serving.'
+            )
+    read_engine = init_read_pool(app, db_path, pragmas, concurrency['read_pool_size'])
+    init_write_queue(app, concurrency['write_wait_seconds'], concurrency['write_retries'])
+    init_experiment_cache(app)
+    init_chart_cache(app)
+    init_titer_model(app)
+    with app.app_context():
+        init_profiling(app, (db.engine, read_engine))
 
     return app
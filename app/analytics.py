@@ -0,0 +1,305 @@
+"""Titer analytics over per-run facts maintained from titer writes.
+
+``titer_run_stats`` holds one row per titer run with at least one recorded
+titer. Each row stores the run's mean sample titer together with the
+dimensions dashboards group by: transfer plasmid, producer cell line and
+producer vessel. A session flush hook rewrites the rows of every run touched
+by a titer sample, titer run, prep, transfection, media change or experiment
+write, so :func:`titer_analytics` aggregates that table and never reads raw
+samples. Each rewrite stamps a higher ``revision``, which lets
+:mod:`app.prediction` retrain on just the runs that changed.
+:func:`rebuild_titer_run_stats` repairs drift.
+"""
+from __future__ import annotations
+
+import math
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import and_, case, delete, event, func, inspect, null, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .database import db
+from .models import (
+    Experiment,
+    LentivirusPrep,
+    MediaChange,
+    TiterRun,
+    TiterRunStats,
+    TiterSample,
+    Transfection,
+)
+from .utils import parse_shorthand_number, round_titer_average
+
+ANALYTICS_DIMENSIONS = ('transfer_name', 'cell_line', 'vessel_type')
+ANALYTICS_BUCKETS = ('week', 'month', 'all')
+DEFAULT_BUCKET = 'month'
+DEFAULT_TITER_THRESHOLD = 1e7
+
+_PENDING_KEY = 'pending_titer_run_stats'
+_CHUNK_SIZE = 500
+# Columns a run's stats row or its prediction inputs are derived from.
+_PREP_COLUMNS = ('transfer_name', 'cell_line_used', 'plasmid_size_bp', 'transfer_concentration')
+_EXPERIMENT_COLUMNS = ('cell_line', 'vessel_type', 'media_type')
+
+_stats = TiterRunStats.__table__
+_experiments = Experiment.__table__
+_preps = LentivirusPrep.__table__
+_runs = TiterRun.__table__
+_samples = TiterSample.__table__
+
+
+def _chunks(values: list[int]) -> Iterable[list[int]]:
+    for start in range(0, len(values), _CHUNK_SIZE):
+        yield values[start:start + _CHUNK_SIZE]
+
+
+def _changed(instance, columns: tuple[str, ...]) -> bool:
+    attrs = inspect(instance).attrs
+    return any(attrs[column].history.has_changes() for column in columns)
+
+
+def compute_titer_run_stats(connection, run_ids: list[int]) -> list[dict]:
+    """``titer_run_stats`` rows for the runs in ``run_ids`` that have a titer."""
+    rows = connection.execute(
+        select(
+            _runs.c.id,
+            _runs.c.prep_id,
+            _preps.c.experiment_id,
+            _preps.c.transfer_name,
+            func.coalesce(_preps.c.cell_line_used, _experiments.c.cell_line),
+            _experiments.c.vessel_type,
+            _runs.c.created_at,
+            func.count(_samples.c.id),
+            func.avg(_samples.c.titer_tu_ml),
+        )
+        .select_from(
+            _runs.join(_preps, _preps.c.id == _runs.c.prep_id)
+            .join(_experiments, _experiments.c.id == _preps.c.experiment_id)
+            .join(_samples, and_(_samples.c.titer_run_id == _runs.c.id, _samples.c.titer_tu_ml.is_not(None)))
+        )
+        .where(_runs.c.id.in_(run_ids))
+        .group_by(_runs.c.id)
+    )
+    return [
+        {
+            'run_id': run_id,
+            'prep_id': prep_id,
+            'experiment_id': experiment_id,
+            'transfer_name': transfer_name,
+            'cell_line': cell_line,
+            'vessel_type': vessel_type,
+            'run_created_at': created_at,
+            'sample_count': sample_count,
+            'titer_tu_ml': titer,
+            'log_titer': math.log(titer) if titer > 0 else None,
+        }
+        for run_id, prep_id, experiment_id, transfer_name, cell_line, vessel_type, created_at, sample_count, titer
+        in rows
+    ]
+
+
+def write_titer_run_stats(connection, run_ids: Iterable[int]) -> int:
+    """Replace the stats rows of ``run_ids``; returns rows written."""
+    # Evaluated per row while the row being replaced still exists, so every
+    # rewrite gets a revision above all earlier ones, its own included.
+    next_revision = select(func.coalesce(func.max(_stats.c.revision), 0) + 1).scalar_subquery()
+    written = 0
+    for chunk in _chunks(sorted(set(run_ids))):
+        rows = compute_titer_run_stats(connection, chunk)
+        connection.execute(
+            delete(_stats).where(
+                _stats.c.run_id.in_(chunk),
+                _stats.c.run_id.not_in([row['run_id'] for row in rows]),
+            )
+        )
+        if rows:
+            statement = sqlite_insert(_stats).values(revision=next_revision)
+            connection.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[_stats.c.run_id],
+                    set_={column.name: column for column in statement.excluded if column.name != 'run_id'},
+                ),
+                rows,
+            )
+        written += len(rows)
+    return written
+
+
+def rebuild_titer_run_stats(connection, experiment_ids: Optional[Iterable[int]] = None) -> int:
+    """Rebuild stats for the given experiments' runs, or for every run."""
+    statement = select(_runs.c.id)
+    if experiment_ids is None:
+        connection.execute(delete(_stats))
+    else:
+        experiment_ids = list(experiment_ids)
+        connection.execute(delete(_stats).where(_stats.c.experiment_id.in_(experiment_ids)))
+        statement = statement.join(_preps, _preps.c.id == _runs.c.prep_id).where(
+            _preps.c.experiment_id.in_(experiment_ids)
+        )
+    return write_titer_run_stats(connection, connection.execute(statement).scalars().all())
+
+
+def _affected_run_ids(session: Session, instances: Iterable[object]) -> set[int]:
+    run_ids: set[int] = set()
+    prep_ids: set[int] = set()
+    experiment_ids: set[int] = set()
+    for instance in instances:
+        if isinstance(instance, TiterSample):
+            if instance.titer_run_id is not None:
+                run_ids.add(instance.titer_run_id)
+        elif isinstance(instance, TiterRun):
+            if instance.id is not None:
+                run_ids.add(instance.id)
+        elif isinstance(instance, (Transfection, MediaChange)):
+            if instance.prep_id is not None:
+                prep_ids.add(instance.prep_id)
+        elif isinstance(instance, LentivirusPrep):
+            if instance.id is not None and _changed(instance, _PREP_COLUMNS):
+                prep_ids.add(instance.id)
+        elif isinstance(instance, Experiment):
+            if instance.id is not None and _changed(instance, _EXPERIMENT_COLUMNS):
+                experiment_ids.add(instance.id)
+    connection = session.connection()
+    for chunk in _chunks(sorted(prep_ids)):
+        run_ids.update(connection.execute(select(_runs.c.id).where(_runs.c.prep_id.in_(chunk))).scalars())
+    for chunk in _chunks(sorted(experiment_ids)):
+        run_ids.update(
+            connection.execute(
+                select(_runs.c.id)
+                .join(_preps, _preps.c.id == _runs.c.prep_id)
+                .where(_preps.c.experiment_id.in_(chunk))
+            ).scalars()
+        )
+    return run_ids
+
+
+def _collect_after_flush(session: Session, flush_context) -> None:
+    new_or_deleted = [*session.new, *session.deleted]
+    dirty = [instance for instance in session.dirty if session.is_modified(instance)]
+    instances = [
+        instance
+        for instance in new_or_deleted
+        if isinstance(instance, (TiterRun, TiterSample, Transfection, MediaChange))
+    ] + [
+        instance
+        for instance in dirty
+        if isinstance(instance, (TiterRun, TiterSample, Transfection, MediaChange, LentivirusPrep, Experiment))
+    ]
+    if not instances:
+        return
+    run_ids = _affected_run_ids(session, instances)
+    if run_ids:
+        session.info.setdefault(_PENDING_KEY, set()).update(run_ids)
+
+
+def _apply_after_flush_postexec(session: Session, flush_context) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        write_titer_run_stats(session.connection(), pending)
+
+
+def register_analytics_hooks() -> None:
+    """Keep ``titer_run_stats`` current on every ORM flush."""
+    if not event.contains(Session, 'after_flush', _collect_after_flush):
+        event.listen(Session, 'after_flush', _collect_after_flush)
+        event.listen(Session, 'after_flush_postexec', _apply_after_flush_postexec)
+
+
+def _parse_date(args, name: str) -> Optional[datetime]:
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError as exc:
+        raise ValueError(f'{name} must be a YYYY-MM-DD date') from exc
+
+
+def titer_analytics(args) -> dict:
+    """Aggregate run titers by ``group_by`` dimensions and time ``bucket``.
+
+    Each group reports its run and sample counts, the mean, median and
+    geometric mean of run titers, and the percentage of runs at or above
+    ``threshold``. Raises ``ValueError`` for invalid arguments.
+    """
+    group_by = [value.strip() for value in args.get('group_by', 'transfer_name').split(',') if value.strip()]
+    unknown = set(group_by) - set(ANALYTICS_DIMENSIONS)
+    if unknown or len(set(group_by)) != len(group_by):
+        raise ValueError(f'group_by accepts distinct values from {", ".join(ANALYTICS_DIMENSIONS)}')
+    bucket = args.get('bucket', DEFAULT_BUCKET)
+    if bucket not in ANALYTICS_BUCKETS:
+        raise ValueError(f'bucket must be one of {", ".join(ANALYTICS_BUCKETS)}')
+    threshold = DEFAULT_TITER_THRESHOLD
+    if args.get('threshold'):
+        threshold = parse_shorthand_number(args.get('threshold'))
+        if threshold is None or threshold <= 0:
+            raise ValueError('threshold must be a positive number')
+
+    conditions = []
+    date_from = _parse_date(args, 'date_from')
+    if date_from is not None:
+        conditions.append(_stats.c.run_created_at >= date_from)
+    date_to = _parse_date(args, 'date_to')
+    if date_to is not None:
+        conditions.append(_stats.c.run_created_at < date_to + timedelta(days=1))
+    for dimension in ANALYTICS_DIMENSIONS:
+        if args.get(dimension):
+            conditions.append(_stats.c[dimension] == args.get(dimension))
+
+    if bucket == 'week':
+        period = func.date(_stats.c.run_created_at, 'weekday 0', '-6 days')
+    elif bucket == 'month':
+        period = func.strftime('%Y-%m', _stats.c.run_created_at)
+    else:
+        period = None
+    partition = [_stats.c[dimension] for dimension in group_by]
+    if period is not None:
+        partition.append(period)
+    ranked = (
+        select(
+            *(_stats.c[dimension] for dimension in group_by),
+            (period if period is not None else null()).label('period'),
+            _stats.c.sample_count,
+            _stats.c.titer_tu_ml,
+            _stats.c.log_titer,
+            func.row_number().over(partition_by=partition or None, order_by=_stats.c.titer_tu_ml).label('position'),
+            func.count().over(partition_by=partition or None).label('total'),
+        )
+        .where(*conditions)
+        .subquery()
+    )
+    # The middle row, or the two middle rows of an even-sized group.
+    middle = and_(2 * ranked.c.position >= ranked.c.total, 2 * ranked.c.position <= ranked.c.total + 2)
+    keys = [ranked.c[dimension] for dimension in group_by]
+    rows = db.session.execute(
+        select(
+            *keys,
+            ranked.c.period,
+            func.count(),
+            func.sum(ranked.c.sample_count),
+            func.avg(ranked.c.titer_tu_ml),
+            func.avg(case((middle, ranked.c.titer_tu_ml))),
+            func.avg(ranked.c.log_titer),
+            func.avg(case((ranked.c.titer_tu_ml >= threshold, 100.0), else_=0.0)),
+        )
+        .group_by(*keys, ranked.c.period)
+        .order_by(ranked.c.period, *keys)
+    )
+
+    groups = []
+    for row in rows:
+        values = dict(zip(group_by, row[:len(group_by)]))
+        period_value, runs, samples, mean, median, mean_log, above = row[len(group_by):]
+        groups.append({
+            **values,
+            'period': period_value,
+            'runs': runs,
+            'samples': samples,
+            'mean_titer': round_titer_average(mean),
+            'median_titer': round_titer_average(median),
+            'geometric_mean_titer': round_titer_average(math.exp(mean_log)) if mean_log is not None else None,
+            'percent_above_threshold': round(above, 1),
+        })
+    return {'group_by': group_by, 'bucket': bucket, 'threshold': threshold, 'groups': groups}
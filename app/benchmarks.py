@@ -0,0 +1,488 @@
+"""Endpoint benchmarks driven through the Flask test client.
+
+:data:`BENCHMARK_CASES` exercises every route in :mod:`app.routes` against the
+configured database, ideally a scratch file filled by ``generate-data``
+(``LENTI_DATABASE_PATH``). Write cases change that database. For each case
+:func:`run_benchmarks` records p50/p95/mean/max latency, the SQL statement
+count reported by the query watch, the response size, and peak traced
+memory. Peak memory is measured in a separate pass, because ``tracemalloc``
+slows every allocation. Reports are plain JSON, so :func:`compare_reports`
+can diff runs taken at different commits.
+
+Streamed CSV exports are timed until their body is fully read. Their SQL
+runs after the response hooks, however, so it is not included in the
+statement count.
+"""
+from __future__ import annotations
+
+import json
+import math
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from .cache import CACHE_KEY
+from .charts import CHART_CACHE_KEY
+from .database import db
+from .models import Experiment, LentivirusPrep, TiterRun
+from .profiling import METRICS_KEY, enable_query_watch
+from .schema import SCHEMA_VERSION
+from .sync import current_sync_sequence, encode_sync_token
+from .synthetic import synthetic_experiments
+
+REPORT_FORMAT = 1
+DEFAULT_ITERATIONS = 20
+MEMORY_ITERATIONS = 3
+_ID_SAMPLE_SIZE = 200
+_COUNTED_TABLES = (
+    'experiments',
+    'lentivirus_preps',
+    'transfections',
+    'media_changes',
+    'harvests',
+    'titer_runs',
+    'titer_samples',
+)
+
+
+class BenchmarkContext:
+    """Client, seeded RNG and sample ids shared by the case ``prepare`` hooks."""
+
+    def __init__(self, app, seed: int) -> None:
+        self.app = app
+        self.client = app.test_client()
+        self.rng = random.Random(seed)
+        self._seed = seed
+        with app.app_context():
+            self.experiment_ids = self._sample_ids(Experiment.id)
+            self.prep_ids = self._sample_ids(LentivirusPrep.id)
+            self.run_ids = self._sample_ids(TiterRun.id)
+            self.sync_token = encode_sync_token(current_sync_sequence(db.session))
+
+    def _sample_ids(self, column) -> list[int]:
+        ids = list(db.session.execute(db.select(column).order_by(column)).scalars())
+        if len(ids) > _ID_SAMPLE_SIZE:
+            ids = self.rng.sample(ids, _ID_SAMPLE_SIZE)
+        return ids
+
+    def pick(self, ids: list[int], count: int = 1) -> Optional[list[int]]:
+        if not ids:
+            return None
+        return self.rng.sample(ids, min(count, len(ids)))
+
+    def clear_cache(self) -> None:
+        for key in (CACHE_KEY, CHART_CACHE_KEY):
+            cache = self.app.extensions.get(key)
+            if cache is not None:
+                cache.clear()
+
+    def new_experiment(self, vessels_seeded: int = 50) -> int:
+        response = self.client.post('/api/experiments', json={
+            'name': 'benchmark scratch',
+            'cell_line': 'HEK293T',
+            'vessel_type': 'T175',
+            'cells_to_seed': '15M',
+            'vessels_seeded': vessels_seeded,
+        })
+        return response.get_json()['experiment']['id']
+
+    def new_prep(self) -> int:
+        experiment_id = self.new_experiment()
+        response = self.client.post(f'/api/experiments/{experiment_id}/preps', json={
+            'transfer_name': 'benchmark scratch',
+            'plate_count': 1,
+        })
+        return response.get_json()['prep']['id']
+
+    def import_body(self) -> str:
+        self._seed += 1
+        records = synthetic_experiments(5, seed=self._seed, days=30)
+        return '\n'.join(json.dumps(record) for record in records)
+
+
+Prepare = Callable[[BenchmarkContext], Optional[tuple[str, dict]]]
+
+
+class BenchmarkCase:
+    """One request shape; ``prepare`` returns ``(url, client kwargs)`` or ``None`` to skip."""
+
+    def __init__(self, name: str, method: str, route: str, prepare: Prepare) -> None:
+        self.name = name
+        self.method = method
+        self.route = route
+        self.prepare = prepare
+
+
+def _one(ids_attr: str, template: str, **kwargs) -> Prepare:
+    def prepare(context: BenchmarkContext):
+        picked = context.pick(getattr(context, ids_attr))
+        if picked is None:
+            return None
+        return template.format(id=picked[0]), kwargs
+
+    return prepare
+
+
+def _cold_detail(context: BenchmarkContext):
+    picked = context.pick(context.experiment_ids)
+    if picked is None:
+        return None
+    context.clear_cache()
+    return f'/api/experiments/{picked[0]}', {}
+
+
+def _cached_detail(context: BenchmarkContext):
+    # Always the same experiment, so every timed request is a cache hit.
+    if not context.experiment_ids:
+        return None
+    return f'/api/experiments/{context.experiment_ids[0]}', {}
+
+
+def _cold_moi_chart(context: BenchmarkContext):
+    context.clear_cache()
+    return '/api/charts/moi', {'query_string': {'group_by': 'cell_line'}}
+
+
+def _changes(context: BenchmarkContext):
+    # An open session polling since the run began sees only the benchmark's writes.
+    return '/api/changes', {'query_string': {'since': context.sync_token}}
+
+
+def _bulk_export(context: BenchmarkContext):
+    picked = context.pick(context.experiment_ids, 20)
+    if picked is None:
+        return None
+    return '/api/experiments/export', {'query_string': {'ids': ','.join(map(str, picked))}}
+
+
+def _metrics_page(context: BenchmarkContext):
+    return ('/api/_metrics', {}) if METRICS_KEY in context.app.extensions else None
+
+
+def _delete_experiment(context: BenchmarkContext):
+    return f'/api/experiments/{context.new_experiment()}', {}
+
+
+def _create_prep(context: BenchmarkContext):
+    return f'/api/experiments/{context.new_experiment()}/preps', {
+        'json': {'transfer_name': 'pLKO.1-bench', 'plate_count': 2, 'plasmid_size_bp': 7052,
+                 'transfer_concentration': 850},
+    }
+
+
+def _delete_prep(context: BenchmarkContext):
+    return f'/api/preps/{context.new_prep()}', {}
+
+
+def _create_titer_run(context: BenchmarkContext):
+    picked = context.pick(context.prep_ids)
+    if picked is None:
+        return None
+    samples = [
+        {'label': f'{2 ** index} uL', 'virus_volume_ul': 2 ** index, 'selection_used': index > 0}
+        for index in range(8)
+    ]
+    return f'/api/preps/{picked[0]}/titer-runs', {
+        'json': {'cell_line': 'HeLa', 'cells_seeded': '100K', 'vessel_type': '6-well', 'samples': samples},
+    }
+
+
+def _run_results(context: BenchmarkContext, run_id: int) -> dict:
+    with context.app.app_context():
+        sample_ids = [
+            row[0]
+            for row in db.session.execute(
+                db.text('SELECT id FROM titer_samples WHERE titer_run_id = :run ORDER BY id'),
+                {'run': run_id},
+            )
+        ]
+    return {
+        'run_id': run_id,
+        'measurement_media_ml': 2,
+        'samples': [
+            {'id': sample_id, 'cell_concentration': 400_000 if index == 0 else 400_000 / (index + 1)}
+            for index, sample_id in enumerate(sample_ids)
+        ],
+    }
+
+
+def _titer_results(context: BenchmarkContext):
+    picked = context.pick(context.run_ids)
+    if picked is None:
+        return None
+    payload = _run_results(context, picked[0])
+    return f'/api/titer-runs/{picked[0]}/results', {'json': payload}
+
+
+def _titer_results_batch(context: BenchmarkContext):
+    picked = context.pick(context.run_ids, 10)
+    if picked is None:
+        return None
+    return '/api/titer-runs/results', {'json': {'runs': [_run_results(context, run_id) for run_id in picked]}}
+
+
+_TRANSFECTION_BATCH = {
+    'items': [
+        {'vessel_type': vessel, 'transfer_concentration_ng_ul': 850, 'packaging_concentration_ng_ul': 1000,
+         'envelope_concentration_ng_ul': 1000}
+        for vessel in ('T175', 'T75', 'T25', '10 cm dish', '6-well') * 4
+    ]
+}
+
+_PREDICTION_BATCH = {
+    'items': [
+        {'vessel_type': vessel, 'ratio': ratio, 'plasmid_size_bp': 9500, 'transfer_concentration_ng_ul': 850}
+        for vessel in ('T175', 'T75', 'T25', '10 cm dish', '6-well')
+        for ratio in ((1, 1, 1), (2, 1, 1), (1, 2, 1), (4, 3, 1))
+    ]
+}
+
+
+def _predict_experiment(context: BenchmarkContext):
+    picked = context.pick(context.experiment_ids)
+    if picked is None:
+        return None
+    return '/api/predict/titer', {'query_string': {'experiment_id': picked[0]}}
+
+
+BENCHMARK_CASES: tuple[BenchmarkCase, ...] = (
+    BenchmarkCase('index', 'GET', '/', lambda context: ('/', {})),
+    BenchmarkCase('experiment list', 'GET', '/api/experiments', lambda context: ('/api/experiments', {})),
+    BenchmarkCase('experiment list filtered', 'GET', '/api/experiments', lambda context: (
+        '/api/experiments', {'query_string': {'status': 'active', 'cell_line': 'HEK293T', 'limit': 100}},
+    )),
+    BenchmarkCase('experiment list sparse', 'GET', '/api/experiments', lambda context: (
+        '/api/experiments', {'query_string': {'fields': 'name,status,prep_count', 'limit': 200}},
+    )),
+    BenchmarkCase('create experiment', 'POST', '/api/experiments', lambda context: ('/api/experiments', {
+        'json': {'cell_line': 'HEK293T', 'vessel_type': 'T175', 'cells_to_seed': '15M', 'vessels_seeded': 4},
+    })),
+    BenchmarkCase('storage diagnostics', 'GET', '/api/_diagnostics/storage',
+                  lambda context: ('/api/_diagnostics/storage', {})),
+    BenchmarkCase('cache diagnostics', 'GET', '/api/_diagnostics/cache',
+                  lambda context: ('/api/_diagnostics/cache', {})),
+    BenchmarkCase('metrics', 'GET', '/api/_metrics', _metrics_page),
+    BenchmarkCase('changes poll', 'GET', '/api/changes', _changes),
+    BenchmarkCase('search', 'GET', '/api/search', lambda context: (
+        '/api/search', {'query_string': {'q': 'pLKO'}},
+    )),
+    BenchmarkCase('search filtered', 'GET', '/api/search', lambda context: (
+        '/api/search', {'query_string': {'q': 'puro', 'type': 'titer_run', 'limit': 100}},
+    )),
+    BenchmarkCase('experiment detail cold', 'GET', '/api/experiments/<id>', _cold_detail),
+    BenchmarkCase('experiment detail cached', 'GET', '/api/experiments/<id>', _cached_detail),
+    BenchmarkCase('experiment detail sparse', 'GET', '/api/experiments/<id>', _one(
+        'experiment_ids', '/api/experiments/{id}',
+        query_string={'fields': 'name,status', 'include': 'preps', 'fields[prep]': 'transfer_name,status'},
+    )),
+    BenchmarkCase('update experiment', 'PUT', '/api/experiments/<id>', _one(
+        'experiment_ids', '/api/experiments/{id}', json={'passage_number': 'P12'},
+    )),
+    BenchmarkCase('delete experiment', 'DELETE', '/api/experiments/<id>', _delete_experiment),
+    BenchmarkCase('export experiment', 'GET', '/api/experiments/<id>/export',
+                  _one('experiment_ids', '/api/experiments/{id}/export')),
+    BenchmarkCase('bulk export', 'GET', '/api/experiments/export', _bulk_export),
+    BenchmarkCase('import', 'POST', '/api/import', lambda context: (
+        '/api/import', {'data': context.import_body(), 'content_type': 'application/x-ndjson'},
+    )),
+    BenchmarkCase('list preps', 'GET', '/api/experiments/<id>/preps',
+                  _one('experiment_ids', '/api/experiments/{id}/preps')),
+    BenchmarkCase('create prep', 'POST', '/api/experiments/<id>/preps', _create_prep),
+    BenchmarkCase('update prep', 'PUT', '/api/preps/<id>', _one(
+        'prep_ids', '/api/preps/{id}', json={'transfer_concentration': 910.5},
+    )),
+    BenchmarkCase('delete prep', 'DELETE', '/api/preps/<id>', _delete_prep),
+    BenchmarkCase('record transfection', 'POST', '/api/preps/<id>/transfection', _one(
+        'prep_ids', '/api/preps/{id}/transfection',
+        json={'packaging_concentration_ng_ul': 1000, 'envelope_concentration_ng_ul': 1000},
+    )),
+    BenchmarkCase('record media change', 'POST', '/api/preps/<id>/media-change', _one(
+        'prep_ids', '/api/preps/{id}/media-change', json={'volume_ml': 20},
+    )),
+    BenchmarkCase('record harvest', 'POST', '/api/preps/<id>/harvest', _one(
+        'prep_ids', '/api/preps/{id}/harvest', json={'harvest_date': '2024-05-01', 'volume_ml': 19.5},
+    )),
+    BenchmarkCase('list titer runs', 'GET', '/api/preps/<id>/titer-runs',
+                  _one('prep_ids', '/api/preps/{id}/titer-runs')),
+    BenchmarkCase('create titer run', 'POST', '/api/preps/<id>/titer-runs', _create_titer_run),
+    BenchmarkCase('record titer results', 'POST', '/api/titer-runs/<id>/results', _titer_results),
+    BenchmarkCase('record titer results batch', 'POST', '/api/titer-runs/results', _titer_results_batch),
+    BenchmarkCase('fit titer run', 'GET', '/api/titer-runs/<id>/fit',
+                  _one('run_ids', '/api/titer-runs/{id}/fit')),
+    BenchmarkCase('fit all titer runs', 'GET', '/api/titer-runs/fits',
+                  lambda context: ('/api/titer-runs/fits', {})),
+    BenchmarkCase('titer analytics', 'GET', '/api/analytics/titers', lambda context: (
+        '/api/analytics/titers', {'query_string': {'group_by': 'cell_line,vessel_type', 'bucket': 'month'}},
+    )),
+    BenchmarkCase('titer analytics overall', 'GET', '/api/analytics/titers', lambda context: (
+        '/api/analytics/titers', {'query_string': {'group_by': '', 'bucket': 'all'}},
+    )),
+    BenchmarkCase('predict experiment titers', 'GET', '/api/predict/titer', _predict_experiment),
+    BenchmarkCase('predict titer batch', 'POST', '/api/predict/titer',
+                  lambda context: ('/api/predict/titer', {'json': _PREDICTION_BATCH})),
+    BenchmarkCase('moi chart cold', 'GET', '/api/charts/moi', _cold_moi_chart),
+    BenchmarkCase('moi chart cached', 'GET', '/api/charts/moi',
+                  lambda context: ('/api/charts/moi', {'query_string': {'group_by': 'run', 'limit': 500}})),
+    BenchmarkCase('moi chart binned', 'GET', '/api/charts/moi', lambda context: (
+        '/api/charts/moi', {'query_string': {'group_by': 'transfer_name', 'downsample': 'bins', 'limit': 50}},
+    )),
+    BenchmarkCase('scaling table', 'GET', '/api/metrics/scaling-table',
+                  lambda context: ('/api/metrics/scaling-table', {})),
+    BenchmarkCase('transfection metrics batch', 'POST', '/api/metrics/transfection',
+                  lambda context: ('/api/metrics/transfection', {'json': _TRANSFECTION_BATCH})),
+    BenchmarkCase('seeding metrics', 'POST', '/api/metrics/seeding', lambda context: (
+        '/api/metrics/seeding', {'json': {'vessel_type': 'T75', 'target_cells': 5_000_000}},
+    )),
+    BenchmarkCase('moi', 'POST', '/api/metrics/moi',
+                  lambda context: ('/api/metrics/moi', {'json': {'fraction_infected': 0.3}})),
+    BenchmarkCase('titer', 'POST', '/api/metrics/titer', lambda context: (
+        '/api/metrics/titer', {'json': {'cells': 100_000, 'moi': 0.36, 'virus_volume_ul': 4}},
+    )),
+)
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _request(context: BenchmarkContext, case: BenchmarkCase, url: str, kwargs: dict):
+    # Requests made under an outer app context (the CLI) would otherwise share
+    # one session and identity map.
+    db.session.remove()
+    started = time.perf_counter()
+    response = context.client.open(url, method=case.method, **kwargs)
+    body = response.get_data()
+    elapsed = time.perf_counter() - started
+    return response, body, elapsed
+
+
+def run_case(context: BenchmarkContext, case: BenchmarkCase, iterations: int) -> Optional[dict]:
+    """Time ``iterations`` requests of ``case`` after one warm-up request."""
+    prepared = case.prepare(context)
+    if prepared is None:
+        return None
+    _request(context, case, *prepared)
+
+    timings, queries, sizes, statuses = [], [], [], {}
+    for _ in range(iterations):
+        response, body, elapsed = _request(context, case, *case.prepare(context))
+        timings.append(elapsed * 1000)
+        queries.append(int(response.headers.get('X-Query-Count', 0)))
+        sizes.append(len(body))
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(min(MEMORY_ITERATIONS, iterations)):
+            url, kwargs = case.prepare(context)
+            tracemalloc.reset_peak()
+            _request(context, case, url, kwargs)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    queries.sort()
+    sizes.sort()
+    return {
+        'method': case.method,
+        'route': case.route,
+        'iterations': iterations,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'p50_ms': round(_percentile(timings, 0.5), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': _percentile(queries, 0.5),
+        'max_queries': queries[-1],
+        'response_bytes': _percentile(sizes, 0.5),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def _dataset_counts(app) -> dict:
+    with app.app_context():
+        return {
+            table: db.session.execute(db.text(f'SELECT COUNT(*) FROM {table}')).scalar()
+            for table in _COUNTED_TABLES
+        }
+
+
+def _git_commit(app) -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=app.root_path, capture_output=True, text=True, timeout=5, check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_benchmarks(
+    app,
+    iterations: int = DEFAULT_ITERATIONS,
+    seed: int = 0,
+    only: Optional[Iterable[str]] = None,
+    progress: Optional[Callable[[str], None]] = None,
+) -> dict:
+    """Run the selected cases (all by default) and return the JSON report."""
+    enable_query_watch(app)
+    selected = set(only) if only else None
+    dataset = _dataset_counts(app)
+    context = BenchmarkContext(app, seed)
+    results = {}
+    for case in BENCHMARK_CASES:
+        if selected is not None and case.name not in selected:
+            continue
+        if progress is not None:
+            progress(case.name)
+        result = run_case(context, case, iterations)
+        if result is not None:
+            results[case.name] = result
+    return {
+        'format': REPORT_FORMAT,
+        'created_at': datetime.utcnow().replace(microsecond=0).isoformat(),
+        'commit': _git_commit(app),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'schema_version': SCHEMA_VERSION,
+        'json_backend': app.config.get('JSON_BACKEND'),
+        'storage_profile': app.config.get('SQLITE_STORAGE_PROFILE'),
+        'iterations': iterations,
+        'seed': seed,
+        'dataset': dataset,
+        'results': results,
+    }
+
+
+def compare_reports(baseline: dict, current: dict) -> list[dict]:
+    """Per-case p50/p95 ratios and query count changes between two reports."""
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        rows.append({
+            'name': name,
+            'p50_ms': (before['p50_ms'], result['p50_ms']),
+            'p95_ms': (before['p95_ms'], result['p95_ms']),
+            'p50_change': _change(before['p50_ms'], result['p50_ms']),
+            'p95_change': _change(before['p95_ms'], result['p95_ms']),
+            'queries': (before['queries'], result['queries']),
+            'peak_kib': (before['peak_kib'], result['peak_kib']),
+        })
+    return rows
+
+
+def _change(before: float, after: float) -> Optional[float]:
+    if not before:
+        return None
+    return round((after - before) / before, 4)
@@ -0,0 +1,178 @@
+"""In-process LRU cache of serialized experiment detail payloads.
+
+Entries hold the exact JSON body of ``GET /api/experiments/<id>`` together with
+the :func:`experiment_version` token it was built for. A session flush hook
+drops the entry of every experiment whose row or descendants were written in
+this process. The hook fires again after commit, so a read that raced the
+write cannot leave a stale body behind. The version check on lookup also
+catches writes made by other processes.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Mapping, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .models import (
+    Experiment,
+    Harvest,
+    LentivirusPrep,
+    MediaChange,
+    TiterRun,
+    TiterSample,
+    Transfection,
+)
+from .rollups import affected_experiment_ids
+
+CACHE_KEY = 'lenti_experiment_cache'
+CACHE_ENABLED_ENV = 'LENTI_EXPERIMENT_CACHE'
+CACHE_SIZE_ENV = 'LENTI_EXPERIMENT_CACHE_MB'
+DEFAULT_CACHE_MB = 64
+
+_PENDING_KEY = 'pending_cache_invalidations'
+_GRAPH_MODELS = (
+    Experiment,
+    LentivirusPrep,
+    Transfection,
+    MediaChange,
+    Harvest,
+    TiterRun,
+    TiterSample,
+)
+
+
+class PayloadCache:
+    """Byte-capped LRU mapping a key to ``(version, body)``."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[str, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, version: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (version, body)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, keys) -> None:
+        with self._lock:
+            for key in keys:
+                if self._discard(key):
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _discard(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry[1])
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def cache_settings(environ: Optional[Mapping[str, str]] = None) -> tuple[bool, int]:
+    """``(enabled, max_bytes)`` from ``LENTI_EXPERIMENT_CACHE``/``..._MB``."""
+    environ = os.environ if environ is None else environ
+    enabled = (environ.get(CACHE_ENABLED_ENV) or '1').strip().lower() not in {'0', 'false', 'no', 'off'}
+    raw = (environ.get(CACHE_SIZE_ENV) or '').strip()
+    try:
+        megabytes = float(raw) if raw else DEFAULT_CACHE_MB
+    except ValueError as exc:
+        raise ValueError(f'{CACHE_SIZE_ENV} must be a number') from exc
+    return enabled, int(megabytes * 1024 * 1024)
+
+
+def init_experiment_cache(app) -> Optional[PayloadCache]:
+    if not app.config.get('EXPERIMENT_CACHE_ENABLED'):
+        return None
+    cache = PayloadCache(app.config['EXPERIMENT_CACHE_MAX_BYTES'])
+    app.extensions[CACHE_KEY] = cache
+    return cache
+
+
+def experiment_cache() -> Optional[PayloadCache]:
+    if not has_app_context():
+        return None
+    return current_app.extensions.get(CACHE_KEY)
+
+
+def _invalidate_after_flush(session: Session, flush_context) -> None:
+    cache = experiment_cache()
+    if cache is None:
+        return
+    instances = [
+        instance
+        for instance in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(instance, _GRAPH_MODELS)
+    ]
+    if not instances:
+        return
+    experiment_ids = {
+        instance.id for instance in instances if isinstance(instance, Experiment)
+    }
+    experiment_ids |= affected_experiment_ids(session, instances)
+    cache.invalidate(experiment_ids)
+    session.info.setdefault(_PENDING_KEY, set()).update(experiment_ids)
+
+
+def _invalidate_after_commit(session: Session) -> None:
+    experiment_ids = session.info.pop(_PENDING_KEY, None)
+    cache = experiment_cache()
+    if experiment_ids and cache is not None:
+        cache.invalidate(experiment_ids)
+
+
+def _discard_pending(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def register_cache_hooks() -> None:
+    """Evict cached payloads for experiments touched by each flush and commit."""
+    if not event.contains(Session, 'after_flush', _invalidate_after_flush):
+        event.listen(Session, 'after_flush', _invalidate_after_flush)
+        event.listen(Session, 'after_commit', _invalidate_after_commit)
+        event.listen(Session, 'after_soft_rollback', _discard_pending)
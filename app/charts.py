@@ -0,0 +1,234 @@
+"""MOI response curves across many titer runs for charting.
+
+:func:`moi_chart` returns one MOI vs. percent-infected series per run, prep,
+transfer plasmid or target cell line, for every run matching the filters.
+One grouped query picks the newest series and a second reads their
+samples in MOI order. Series are then cut to a total point budget
+with largest-triangle-three-buckets (LTTB) or with log-MOI bins shared by
+every series, so hundreds of overlaid runs stay cheap to draw.
+
+MOI spans decades, so both downsamplers work on ``log10(MOI)``. Samples
+without infection (MOI 0) cannot sit on that axis and are left out. Bodies
+are cached per query and keyed to the ``titer_run_stats`` count and highest
+revision. Any sample, run, prep or experiment write that can move a point
+changes that token.
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional, Sequence
+
+from flask import current_app, has_app_context
+from sqlalchemy import func, select
+
+from .cache import PayloadCache
+from .database import db
+from .models import LentivirusPrep, TiterRun, TiterRunStats, TiterSample
+from .utils import parse_positive_int
+
+CHART_CACHE_KEY = 'lenti_chart_cache'
+CHART_CACHE_MB = 16
+MOI_CHART_GROUPS = ('run', 'prep', 'transfer_name', 'cell_line')
+MOI_CHART_DOWNSAMPLERS = ('lttb', 'bins')
+DEFAULT_MAX_POINTS = 2000
+MAX_POINTS_LIMIT = 20000
+DEFAULT_SERIES_LIMIT = 200
+SERIES_LIMIT_MAX = 1000
+# Every series keeps at least its first, last and one interior point.
+MIN_SERIES_POINTS = 3
+_FILTERS = ('transfer_name', 'cell_line', 'experiment_id', 'prep_id')
+
+_stats = TiterRunStats.__table__
+_preps = LentivirusPrep.__table__
+_runs = TiterRun.__table__
+_samples = TiterSample.__table__
+
+# group -> (row fields identifying a series, in response order)
+_SERIES_KEYS = {
+    'run': ('run_id', 'prep_id', 'experiment_id', 'transfer_name', 'cell_line'),
+    'prep': ('prep_id', 'experiment_id', 'transfer_name'),
+    'transfer_name': ('transfer_name',),
+    'cell_line': ('cell_line',),
+}
+
+
+def lttb(points: Sequence[tuple[float, float]], threshold: int) -> list[tuple[float, float]]:
+    """Largest-triangle-three-buckets downsampling of x-sorted ``points``.
+
+    Keeps the first and last points and, from each of ``threshold - 2``
+    buckets between them, the point spanning the largest triangle with the
+    previous pick and the next bucket's mean.
+    """
+    if threshold >= len(points) or threshold < MIN_SERIES_POINTS:
+        return list(points)
+    sampled = [points[0]]
+    every = (len(points) - 2) / (threshold - 2)
+    previous = points[0]
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        following = points[end:min(int((bucket + 2) * every) + 1, len(points) - 1)] or [points[-1]]
+        mean_x = sum(x for x, _ in following) / len(following)
+        mean_y = sum(y for _, y in following) / len(following)
+        chosen, largest = points[start], -1.0
+        for point in points[start:end]:
+            area = abs(
+                (previous[0] - mean_x) * (point[1] - previous[1])
+                - (previous[0] - point[0]) * (mean_y - previous[1])
+            )
+            if area > largest:
+                chosen, largest = point, area
+        sampled.append(chosen)
+        previous = chosen
+    sampled.append(points[-1])
+    return sampled
+
+
+def bin_points(points: Sequence[tuple[float, float]], low: float, width: float,
+               bins: int) -> tuple[list[tuple[float, float]], list[int]]:
+    """Mean point of each occupied bin of width ``width`` from ``low``, with sample counts."""
+    totals: dict[int, list[float]] = {}
+    for x, y in points:
+        index = min(int((x - low) / width), bins - 1) if width else 0
+        total = totals.setdefault(index, [0.0, 0.0, 0])
+        total[0] += x
+        total[1] += y
+        total[2] += 1
+    merged, counts = [], []
+    for index in sorted(totals):
+        sum_x, sum_y, count = totals[index]
+        merged.append((sum_x / count, sum_y / count))
+        counts.append(count)
+    return merged, counts
+
+
+def moi_chart_query(args) -> tuple:
+    """Normalized chart arguments, also the cache key; raises ``ValueError``."""
+    group_by = args.get('group_by', 'run')
+    if group_by not in MOI_CHART_GROUPS:
+        raise ValueError(f'group_by must be one of {", ".join(MOI_CHART_GROUPS)}')
+    downsample = args.get('downsample', 'lttb')
+    if downsample not in MOI_CHART_DOWNSAMPLERS:
+        raise ValueError(f'downsample must be one of {", ".join(MOI_CHART_DOWNSAMPLERS)}')
+    max_points = min(parse_positive_int(args.get('max_points'), default=DEFAULT_MAX_POINTS), MAX_POINTS_LIMIT)
+    limit = min(parse_positive_int(args.get('limit'), default=DEFAULT_SERIES_LIMIT), SERIES_LIMIT_MAX)
+    filters = []
+    for name in _FILTERS:
+        value = args.get(name)
+        if not value:
+            continue
+        if name.endswith('_id'):
+            value = parse_positive_int(value)
+            if value is None:
+                raise ValueError(f'{name} must be a positive integer')
+        filters.append((name, value))
+    return group_by, downsample, max_points, limit, tuple(filters)
+
+
+_SAMPLES_FROM = (
+    _samples.join(_runs, _runs.c.id == _samples.c.titer_run_id)
+    .join(_preps, _preps.c.id == _runs.c.prep_id)
+)
+_COLUMNS = {
+    'run_id': _runs.c.id,
+    'prep_id': _runs.c.prep_id,
+    'experiment_id': _preps.c.experiment_id,
+    'transfer_name': _preps.c.transfer_name,
+    'cell_line': _runs.c.cell_line,
+}
+
+
+def _conditions(filters: tuple) -> list:
+    return [
+        _samples.c.moi > 0,
+        _samples.c.measured_percent.is_not(None),
+        *(_COLUMNS[name] == value for name, value in filters),
+    ]
+
+
+def moi_chart(query: tuple) -> dict:
+    """MOI vs. percent-infected series for the runs a :func:`moi_chart_query` matches.
+
+    ``group_by`` picks the series (``run``, ``prep``, ``transfer_name`` or the
+    titer run's target ``cell_line``); filters narrow the runs. The newest
+    ``limit`` series are kept, and their points are downsampled with
+    ``downsample`` (``lttb`` or ``bins``) to about ``max_points`` in total.
+    """
+    group_by, downsample, max_points, limit, filters = query
+    keys = _SERIES_KEYS[group_by]
+    key_columns = [_COLUMNS[name] for name in keys]
+    conditions = _conditions(filters)
+    series = db.session.execute(
+        select(*key_columns, func.count(func.distinct(_runs.c.id)))
+        .select_from(_SAMPLES_FROM)
+        .where(*conditions)
+        .group_by(*key_columns)
+        .order_by(func.max(_runs.c.created_at).desc(), key_columns[0].desc())
+        .limit(limit + 1)
+    ).all()
+    truncated = len(series) > limit
+    series = series[:limit]
+    if truncated:
+        conditions.append(key_columns[0].in_([row[0] for row in series]))
+
+    points: dict = {row[0]: [] for row in series}
+    if series:
+        rows = db.session.execute(
+            select(key_columns[0], _samples.c.moi, 100 - _samples.c.measured_percent)
+            .select_from(_SAMPLES_FROM)
+            .where(*conditions)
+            .order_by(key_columns[0], _samples.c.moi)
+        )
+        log10 = math.log10
+        for ident, moi, percent_infected in rows:
+            points[ident].append((log10(moi), percent_infected))
+
+    per_series = max(MIN_SERIES_POINTS, max_points // len(series)) if series else 0
+    if downsample == 'bins' and series:
+        low = min(values[0][0] for values in points.values())
+        high = max(values[-1][0] for values in points.values())
+        width = (high - low) / per_series
+
+    results = []
+    for *key, runs in series:
+        values = points[key[0]]
+        result = dict(zip(keys, key))
+        result['runs'] = runs
+        result['samples'] = len(values)
+        if downsample == 'bins':
+            values, result['counts'] = bin_points(values, low, width, per_series)
+        else:
+            values = lttb(values, per_series)
+        result['points'] = [[round(10 ** x, 4), round(y, 2)] for x, y in values]
+        results.append(result)
+    return {
+        'group_by': group_by,
+        'downsample': downsample,
+        'max_points': max_points,
+        'points_per_series': per_series,
+        'truncated': truncated,
+        'series': results,
+    }
+
+
+def moi_chart_version(session) -> str:
+    """Token that changes whenever any charted sample can have changed."""
+    count, revision = session.execute(
+        select(func.count(), func.coalesce(func.max(_stats.c.revision), 0))
+    ).one()
+    return f'{count}:{revision}'
+
+
+def init_chart_cache(app) -> Optional[PayloadCache]:
+    """Register the chart body cache; it follows the experiment cache switch."""
+    if not app.config.get('EXPERIMENT_CACHE_ENABLED'):
+        return None
+    cache = PayloadCache(CHART_CACHE_MB * 1024 * 1024)
+    app.extensions[CHART_CACHE_KEY] = cache
+    return cache
+
+
+def chart_cache() -> Optional[PayloadCache]:
+    if not has_app_context():
+        return None
+    return current_app.extensions.get(CHART_CACHE_KEY)
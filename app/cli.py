@@ -0,0 +1,269 @@
+"""Flask CLI commands for maintaining the Lentivirus tracker database."""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+import click
+from flask import Flask
+
+from .analytics import rebuild_titer_run_stats
+from .benchmarks import DEFAULT_ITERATIONS, compare_reports, run_benchmarks
+from .database import DATABASE_PATH_ENV, db, default_database_path
+from .imports import IMPORT_BATCH_SIZE, IMPORT_FORMATS, import_records, parse_import
+from .models import Experiment
+from .parity import DEFAULT_PARITY_LIMIT, check_serializer_parity
+from .prediction import check_titer_model
+from .profiling import check_query_budgets
+from .query_plans import check_query_plans
+from .rollups import rebuild_experiment_rollups
+from .schema import SCHEMA_VERSION, migrate_schema, pending_migrations
+from .search import rebuild_search_index
+from .stress import DEFAULT_ATTEMPTS, DEFAULT_CAPACITY, DEFAULT_THREADS, stress_plate_allocation
+from .synthetic import generate_dataset
+from .utils import np
+
+
+def _count_range(ctx, param, value: str) -> tuple[int, int]:
+    """Parse ``N`` or ``LOW-HIGH`` into an inclusive range."""
+    low, _, high = value.partition('-')
+    try:
+        bounds = (int(low), int(high or low))
+    except ValueError as exc:
+        raise click.BadParameter('expected N or LOW-HIGH') from exc
+    if bounds[0] < 0 or bounds[0] > bounds[1]:
+        raise click.BadParameter('expected 0 <= LOW <= HIGH')
+    return bounds
+
+
+def _require_scratch_database(app: Flask, command: str) -> None:
+    """Exit unless the configured database is a scratch file or holds no experiments.
+
+    ``generate-data`` and ``benchmark`` write synthetic rows (and tombstones
+    for the ones they delete), which must never land in the lab's records.
+    """
+    path = Path(db.engine.url.database).resolve()
+    live = default_database_path(Path(app.root_path)).resolve()
+    if (os.environ.get(DATABASE_PATH_ENV) or '').strip() and path != live:
+        return
+    if db.session.execute(db.select(Experiment.id).limit(1)).first() is None:
+        return
+    click.echo(
+        f'{command} writes synthetic records, but {path} already holds experiments. '
+        f'Point {DATABASE_PATH_ENV} at a scratch database file first.',
+        err=True,
+    )
+    raise SystemExit(1)
+
+
+def register_commands(app: Flask) -> None:
+    @app.cli.command('rebuild-rollups')
+    @click.option('--experiment-id', 'experiment_ids', type=int, multiple=True,
+                  help='Limit the rebuild to these experiments (repeatable).')
+    def rebuild_rollups_command(experiment_ids: tuple[int, ...]) -> None:
+        """Recompute experiment summary and titer analytics rollups from child records."""
+        with db.engine.begin() as connection:
+            written = rebuild_experiment_rollups(connection, experiment_ids or None)
+            runs = rebuild_titer_run_stats(connection, experiment_ids or None)
+        click.echo(f'Rebuilt rollups for {written} experiment(s) and {runs} titered run(s).')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command() -> None:
+        """Reindex experiments, preps and titer runs for full-text search."""
+        with db.engine.begin() as connection:
+            indexed = rebuild_search_index(connection)
+        click.echo(f'Indexed {indexed} record(s) for search.')
+
+    @app.cli.command('migrate-schema')
+    @click.option('--status', is_flag=True, help='List pending migrations without applying them.')
+    def migrate_schema_command(status: bool) -> None:
+        """Apply pending schema migrations (run once per deploy)."""
+        if status:
+            pending = pending_migrations()
+            for version, description in pending:
+                click.echo(f'pending {version}: {description}')
+            click.echo(f'Schema version {SCHEMA_VERSION - len(pending)} of {SCHEMA_VERSION}.')
+            return
+        applied = migrate_schema()
+        for version, description in applied:
+            click.echo(f'applied {version}: {description}')
+        click.echo(f'Schema is at version {SCHEMA_VERSION}.')
+
+    @app.cli.command('check-query-plans')
+    @click.option('--verbose', is_flag=True, help='Print the full plan of every query.')
+    def check_query_plans_command(verbose: bool) -> None:
+        """Fail when a hot query's plan scans a table or sorts without an index."""
+        with db.engine.connect() as connection:
+            results = check_query_plans(connection)
+        failures = [result for result in results if result['problems']]
+        for result in results:
+            if verbose or result['problems']:
+                status = 'FAIL' if result['problems'] else 'ok'
+                click.echo(f"{status:4} {result['name']}")
+                for step in result['plan']:
+                    click.echo(f'       {step}')
+        click.echo(f'{len(results) - len(failures)} of {len(results)} hot queries use indexes.')
+        if failures:
+            raise SystemExit(1)
+
+    @app.cli.command('check-query-budgets')
+    @click.option('--verbose', is_flag=True, help='Print every route, not only failures.')
+    def check_query_budgets_command(verbose: bool) -> None:
+        """Fail when a budgeted GET route runs more SQL than it declares."""
+        results = check_query_budgets(app)
+        checked = [result for result in results if not result['skipped']]
+        failures = [result for result in checked if not result['ok']]
+        for result in results:
+            if result['skipped']:
+                if verbose:
+                    click.echo(f"skip {result['route']} (no rows to request)")
+                continue
+            if verbose or not result['ok']:
+                status = 'ok' if result['ok'] else 'FAIL'
+                detail = f"{result['statements']}/{result['budget']} statements"
+                if result['repeated']:
+                    detail += f", {result['repeated']} repeated statement shape(s)"
+                if result['status'] >= 400:
+                    detail += f", HTTP {result['status']}"
+                click.echo(f"{status:4} {result['route']}: {detail}")
+        click.echo(f'{len(checked) - len(failures)} of {len(checked)} budgeted routes within budget.')
+        if failures:
+            raise SystemExit(1)
+
+    @app.cli.command('check-serializers')
+    @click.option('--limit', type=click.IntRange(min=1), default=DEFAULT_PARITY_LIMIT, show_default=True,
+                  help='Experiments whose full graphs are compared.')
+    def check_serializers_command(limit: int) -> None:
+        """Fail when model payloads or the stdlib JSON body drift from the legacy serializers."""
+        results = check_serializer_parity(app, limit)
+        failures = [result for result in results if not result['ok']]
+        for result in results:
+            status = 'ok' if result['ok'] else 'FAIL'
+            detail = f"{result['checked'] - result['failed']}/{result['checked']} match"
+            if 'bytes_identical' in result:
+                detail += f", {result['bytes_identical']} byte-identical"
+            click.echo(f"{status:4} {result['check']}: {detail}")
+            for mismatch in result['mismatches']:
+                click.echo(f'       {json.dumps(mismatch)}')
+        click.echo(f'{len(results) - len(failures)} of {len(results)} parity checks pass.')
+        if failures:
+            raise SystemExit(1)
+
+    @app.cli.command('check-titer-model')
+    def check_titer_model_command() -> None:
+        """Fail when incremental titer model refreshes drift from a fresh fit (changes are rolled back)."""
+        if np is None:
+            click.echo('NumPy is not installed; titer prediction is disabled.')
+            raise SystemExit(1)
+        results = check_titer_model(db.engine)
+        failures = [result for result in results if not result['ok']]
+        for result in results:
+            status = 'ok' if result['ok'] else 'FAIL'
+            click.echo(
+                f"{status:4} {result['scenario']}: {result['training_runs']} run(s), "
+                f"{result['full_fits']} full / {result['incremental_fits']} incremental fit(s)"
+            )
+        click.echo(f'{len(results) - len(failures)} of {len(results)} scenarios match a fresh fit.')
+        if failures:
+            raise SystemExit(1)
+
+    @app.cli.command('generate-data')
+    @click.option('--experiments', type=click.IntRange(min=1), default=2000, show_default=True)
+    @click.option('--preps', default='1-4', show_default=True, callback=_count_range,
+                  help='Preps per experiment (N or LOW-HIGH).')
+    @click.option('--titer-runs', default='1-2', show_default=True, callback=_count_range,
+                  help='Titer runs per completed prep.')
+    @click.option('--samples', default='4-12', show_default=True, callback=_count_range,
+                  help='Samples per titer run, including the no-virus control.')
+    @click.option('--days', type=click.IntRange(min=1), default=730, show_default=True,
+                  help='Spread experiment creation dates over this many days.')
+    @click.option('--seed', type=int, default=0, show_default=True)
+    def generate_data_command(experiments: int, preps, titer_runs, samples, days: int, seed: int) -> None:
+        """Fill the database with seeded synthetic experiments for benchmarking."""
+        _require_scratch_database(app, 'generate-data')
+        report = generate_dataset(
+            experiments, preps=preps, titer_runs=titer_runs, samples=samples, days=days, seed=seed
+        )
+        for error in report['errors']:
+            click.echo(json.dumps(error), err=True)
+        click.echo(f"Generated {report['imported']} experiment(s); {report['failed']} rejected.")
+
+    @app.cli.command('benchmark')
+    @click.option('--iterations', type=click.IntRange(min=1), default=DEFAULT_ITERATIONS, show_default=True,
+                  help='Timed requests per case.')
+    @click.option('--seed', type=int, default=0, show_default=True)
+    @click.option('--case', 'cases', multiple=True, help='Only run the named case (repeatable).')
+    @click.option('--output', type=click.Path(dir_okay=False, path_type=Path),
+                  help='Write the JSON report here.')
+    @click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+                  help='Print changes against an earlier JSON report.')
+    def benchmark_command(iterations: int, seed: int, cases: tuple[str, ...], output: Path | None,
+                          baseline_path: Path | None) -> None:
+        """Time every API route through the test client (writes to the database)."""
+        _require_scratch_database(app, 'benchmark')
+        report = run_benchmarks(
+            app, iterations=iterations, seed=seed, only=cases,
+            progress=lambda name: click.echo(f'  {name}', err=True),
+        )
+        click.echo(f"{'case':34} {'p50 ms':>9} {'p95 ms':>9} {'queries':>7} {'peak KiB':>9}")
+        for name, result in report['results'].items():
+            click.echo(
+                f"{name:34} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} "
+                f"{result['queries']:7} {result['peak_kib']:9.1f}"
+            )
+        if output is not None:
+            output.write_text(json.dumps(report, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+            click.echo(f'Wrote {output}')
+        if baseline_path is not None:
+            baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+            click.echo(f"Against {baseline_path} ({baseline.get('commit') or 'unknown commit'}):")
+            for row in compare_reports(baseline, report):
+                changes = ' '.join(
+                    f"{label} {row[key] * 100:+.1f}%" if row[key] is not None else f'{label} n/a'
+                    for label, key in (('p50', 'p50_change'), ('p95', 'p95_change'))
+                )
+                queries = '' if row['queries'][0] == row['queries'][1] else (
+                    f"  queries {row['queries'][0]} -> {row['queries'][1]}"
+                )
+                click.echo(f"{row['name']:34} {changes}{queries}")
+
+    @app.cli.command('stress-allocation')
+    @click.option('--threads', type=click.IntRange(min=1), default=DEFAULT_THREADS, show_default=True,
+                  help='Concurrent writers.')
+    @click.option('--attempts', type=click.IntRange(min=1), default=DEFAULT_ATTEMPTS, show_default=True,
+                  help='Prep create/resize requests across all writers.')
+    @click.option('--capacity', type=click.IntRange(min=1), default=DEFAULT_CAPACITY, show_default=True,
+                  help='Plates seeded for the scratch experiment.')
+    @click.option('--seed', type=int, default=0, show_default=True, help='Random seed for the request mix.')
+    def stress_allocation_command(threads: int, attempts: int, capacity: int, seed: int) -> None:
+        """Fail when concurrent prep writes over-allocate an experiment's plates."""
+        report = stress_plate_allocation(threads=threads, attempts=attempts, capacity=capacity, seed=seed)
+        requests = report['requests']
+        click.echo(
+            f"{requests['created']} created, {requests['resized']} resized, {requests['rejected']} rejected, "
+            f"{requests['failed']} failed in {report['elapsed_seconds']:.2f}s across {threads} thread(s)."
+        )
+        click.echo(f"{report['allocated']}/{capacity} plates allocated; rollup records {report['rollup']}.")
+        for failure in report['failures']:
+            click.echo(json.dumps(failure), err=True)
+        if not report['ok']:
+            raise SystemExit(1)
+
+    @app.cli.command('import-records')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+    @click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS),
+                  help='Input format; inferred from the file extension when omitted.')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=IMPORT_BATCH_SIZE, show_default=True,
+                  help='Experiments inserted per transaction.')
+    @click.option('--dry-run', is_flag=True, help='Validate the file without writing anything.')
+    def import_records_command(path: Path, fmt: str | None, batch_size: int, dry_run: bool) -> None:
+        """Bulk import experiments with nested preps, stages and titer data."""
+        if fmt is None:
+            fmt = 'csv' if path.suffix.lower() == '.csv' else 'ndjson'
+        records, errors = parse_import(path.read_text(encoding='utf-8-sig'), fmt)
+        report = import_records(records, errors, batch_size=batch_size, dry_run=dry_run)
+        for error in report['errors']:
+            click.echo(json.dumps(error), err=True)
+        verb = 'Validated' if dry_run else 'Imported'
+        click.echo(f"{verb} {report['imported']} experiment(s); {report['failed']} record(s) rejected.")
@@ -1,26 +1,285 @@
 """Database helpers and extension instances."""
 from __future__ import annotations
 
+import os
+import threading
+import time
+from functools import wraps
 from pathlib import Path
+from typing import Callable, Iterable, Mapping, Optional
 
+from flask import current_app, has_request_context, jsonify, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as BaseSession
 from flask_migrate import Migrate
 
 INSTANCE_RELATIVE = Path('instance')
 DB_FILENAME = 'lenti_tracker.db'
+DATABASE_PATH_ENV = 'LENTI_DATABASE_PATH'
 
 
-db = SQLAlchemy()
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+READ_ENGINE_KEY = 'lenti_read_engine'
+WRITE_QUEUE_KEY = 'lenti_write_queue'
+
+
+class RoutingSession(BaseSession):
+    """Session that sends read-only requests to the read-only connection pool.
+
+    Queries issued while handling ``GET``/``HEAD`` use the ``mode=ro`` engine
+    registered by :func:`init_read_pool`. Flushes and everything outside a
+    read request (writes, CLI commands, startup) use the primary engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            read_engine = current_app.extensions.get(READ_ENGINE_KEY)
+            if read_engine is not None and request.method in READ_METHODS:
+                return read_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 
 
+def default_database_path(root_path: Path) -> Path:
+    """The instance database the app uses when ``LENTI_DATABASE_PATH`` is unset."""
+    return root_path / INSTANCE_RELATIVE / DB_FILENAME
+
+
 def prepare_database_paths(root_path: Path) -> Path:
-    """Ensure the SQLite database lives in the package instance directory."""
-    instance_path = root_path / INSTANCE_RELATIVE
-    instance_path.mkdir(parents=True, exist_ok=True)
+    """Ensure the SQLite database lives in the package instance directory.
+
+    ``LENTI_DATABASE_PATH`` points the app at another file instead, such as a
+    scratch database filled by ``generate-data`` for benchmarking.
+    """
+    override = (os.environ.get(DATABASE_PATH_ENV) or '').strip()
+    if override:
+        db_path = Path(override).expanduser().resolve()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        return db_path
 
-    db_path = instance_path / DB_FILENAME
+    db_path = default_database_path(root_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
     legacy_path = root_path / DB_FILENAME
     if legacy_path.exists() and not db_path.exists():
         legacy_path.replace(db_path)
     return db_path
+
+
+STORAGE_PROFILE_ENV = 'LENTI_SQLITE_PROFILE'
+DEFAULT_STORAGE_PROFILE = 'production'
+
+# Connection pragmas applied by each profile. ``legacy`` keeps SQLite's own
+# defaults (rollback journal, FULL sync) apart from foreign key enforcement.
+STORAGE_PROFILES = {
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 268_435_456,
+        'cache_size': -65_536,
+        'foreign_keys': 'ON',
+    },
+    'legacy': {
+        'foreign_keys': 'ON',
+    },
+}
+
+# Per-pragma overrides, e.g. ``LENTI_SQLITE_BUSY_TIMEOUT=10000``.
+PRAGMA_ENV_PREFIX = 'LENTI_SQLITE_'
+_INTEGER_PRAGMAS = {'busy_timeout', 'mmap_size', 'cache_size'}
+_PRAGMA_CHOICES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'foreign_keys': {'ON', 'OFF'},
+}
+
+
+def storage_profile(environ: Optional[Mapping[str, str]] = None) -> tuple[str, dict]:
+    """Resolve the storage profile name and its pragmas from the environment.
+
+    Raises ``ValueError`` for an unknown profile or an invalid override.
+    """
+    environ = os.environ if environ is None else environ
+    name = environ.get(STORAGE_PROFILE_ENV, DEFAULT_STORAGE_PROFILE).strip().lower()
+    if name not in STORAGE_PROFILES:
+        raise ValueError(
+            f'{STORAGE_PROFILE_ENV} must be one of: {", ".join(sorted(STORAGE_PROFILES))}'
+        )
+    pragmas = dict(STORAGE_PROFILES[name])
+    for pragma in (*_INTEGER_PRAGMAS, *_PRAGMA_CHOICES):
+        raw = environ.get(f'{PRAGMA_ENV_PREFIX}{pragma.upper()}')
+        if raw is None or not raw.strip():
+            continue
+        raw = raw.strip()
+        if pragma in _INTEGER_PRAGMAS:
+            try:
+                pragmas[pragma] = int(raw)
+            except ValueError as exc:
+                raise ValueError(f'{PRAGMA_ENV_PREFIX}{pragma.upper()} must be an integer') from exc
+        else:
+            value = raw.upper()
+            if value not in _PRAGMA_CHOICES[pragma]:
+                raise ValueError(
+                    f'{PRAGMA_ENV_PREFIX}{pragma.upper()} must be one of: '
+                    f'{", ".join(sorted(_PRAGMA_CHOICES[pragma]))}'
+                )
+            pragmas[pragma] = value
+    return name, pragmas
+
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: Mapping[str, object]) -> None:
+    """Run ``pragmas`` on every new DBAPI connection of a SQLite ``engine``."""
+    if not engine.url.drivername.startswith('sqlite') or not pragmas:
+        return
+
+    def set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma, value in pragmas.items():
+                cursor.execute(f'PRAGMA {pragma} = {value}')
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
+
+
+def active_sqlite_pragmas(connection, pragmas: Iterable[str]) -> dict:
+    """Read back the values SQLite reports for ``pragmas`` on ``connection``."""
+    return {
+        pragma: connection.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+        for pragma in pragmas
+    }
+
+
+READ_POOL_SIZE_ENV = 'LENTI_SQLITE_READ_POOL_SIZE'
+WRITE_WAIT_ENV = 'LENTI_SQLITE_WRITE_WAIT'
+WRITE_RETRIES_ENV = 'LENTI_SQLITE_WRITE_RETRIES'
+DEFAULT_READ_POOL_SIZE = 8
+DEFAULT_WRITE_WAIT_SECONDS = 10.0
+DEFAULT_WRITE_RETRIES = 3
+WRITE_RETRY_BACKOFF_SECONDS = 0.05
+
+
+def concurrency_settings(environ: Optional[Mapping[str, str]] = None) -> dict:
+    """Read pool size and writer queue limits from the environment.
+
+    ``LENTI_SQLITE_READ_POOL_SIZE=0`` disables the read-only pool.
+    """
+    environ = os.environ if environ is None else environ
+    settings = {}
+    for key, env_name, default, parse in (
+        ('read_pool_size', READ_POOL_SIZE_ENV, DEFAULT_READ_POOL_SIZE, int),
+        ('write_wait_seconds', WRITE_WAIT_ENV, DEFAULT_WRITE_WAIT_SECONDS, float),
+        ('write_retries', WRITE_RETRIES_ENV, DEFAULT_WRITE_RETRIES, int),
+    ):
+        raw = (environ.get(env_name) or '').strip()
+        try:
+            value = parse(raw) if raw else default
+        except ValueError as exc:
+            raise ValueError(f'{env_name} must be a number') from exc
+        if value < 0:
+            raise ValueError(f'{env_name} must not be negative')
+        settings[key] = value
+    return settings
+
+
+def init_read_pool(app, db_path: Path, pragmas: Mapping[str, object], pool_size: int) -> Optional[Engine]:
+    """Create the ``mode=ro`` engine that serves read-only requests."""
+    if pool_size <= 0:
+        return None
+    engine = create_engine(
+        f'sqlite:///file:{db_path}?mode=ro&uri=true',
+        connect_args={'check_same_thread': False},
+        pool_size=pool_size,
+        max_overflow=pool_size,
+    )
+    # The journal mode belongs to the writer; readers only tune their own cache.
+    read_pragmas = {key: value for key, value in pragmas.items() if key != 'journal_mode'}
+    read_pragmas['query_only'] = 'ON'
+    apply_sqlite_pragmas(engine, read_pragmas)
+    app.extensions[READ_ENGINE_KEY] = engine
+    return engine
+
+
+def begin_immediate(session=None) -> None:
+    """Take SQLite's write lock now instead of at the transaction's first write.
+
+    A deferred transaction that reads and then writes can act on data another
+    connection changes in between. ``BEGIN IMMEDIATE`` holds the reserved lock
+    from the first statement, so reads made after it stay valid until commit.
+    Does nothing if the session's connection is already in a transaction.
+    """
+    connection = (session or db.session).connection()
+    if connection.dialect.name != 'sqlite':
+        return
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def _is_busy_error(exc: OperationalError) -> bool:
+    message = str(exc.orig).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+class WriterBusyError(RuntimeError):
+    """Raised when the writer queue cannot be entered within its wait limit."""
+
+
+class WriteQueue:
+    """Serialize write requests through one writer per process.
+
+    Callers wait at most ``wait_seconds`` for the writer. ``SQLITE_BUSY``
+    failures (another process holding the lock) are rolled back and retried
+    ``retries`` times with exponential backoff before the error is raised.
+    """
+
+    def __init__(self, wait_seconds: float, retries: int) -> None:
+        self.wait_seconds = wait_seconds
+        self.retries = retries
+        self._lock = threading.Lock()
+
+    def run(self, func: Callable, *args, **kwargs):
+        if not self._lock.acquire(timeout=self.wait_seconds):
+            raise WriterBusyError('Timed out waiting for the database writer')
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    db.session.rollback()
+                    if not _is_busy_error(exc) or attempt == self.retries:
+                        raise
+                    time.sleep(WRITE_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        finally:
+            self._lock.release()
+
+
+def init_write_queue(app, wait_seconds: float, retries: int) -> WriteQueue:
+    queue = WriteQueue(wait_seconds, retries)
+    app.extensions[WRITE_QUEUE_KEY] = queue
+    return queue
+
+
+def serialized_write(view: Callable) -> Callable:
+    """Run a view's non-read requests through the application's write queue."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        queue = current_app.extensions.get(WRITE_QUEUE_KEY)
+        if queue is None or request.method in READ_METHODS:
+            return view(*args, **kwargs)
+        try:
+            return queue.run(view, *args, **kwargs)
+        except WriterBusyError as exc:
+            response = jsonify({'error': str(exc)})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+
+    return wrapper
@@ -0,0 +1,181 @@
+"""CSV export of experiment records, streamed row by row."""
+from __future__ import annotations
+
+import csv
+import math
+from typing import Iterable, Iterator, Optional
+
+from .database import db
+from .models import Experiment
+from .queries import experiment_detail_options, filter_experiments
+from .utils import round_titer_average
+
+EXPORT_HEADER = ['Section', 'Preparation', 'Field', 'Value']
+BULK_EXPORT_HEADER = ['Experiment ID', *EXPORT_HEADER]
+BULK_EXPORT_CHUNK_SIZE = 50
+
+
+class _LineBuffer:
+    """File-like sink that hands back what ``csv.writer`` writes."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def format_number(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return ''
+        rounded = round(value, 4)
+        if rounded.is_integer():
+            return str(int(rounded))
+        return f"{rounded:.4f}".rstrip('0').rstrip('.')
+    return str(value)
+
+
+def _row(section: str, prep_name: str | None, field: str, value: str | float | None) -> list:
+    return [section, prep_name or '', field, value if isinstance(value, str) else format_number(value)]
+
+
+def experiment_rows(experiment: Experiment) -> Iterator[list]:
+    """Yield the ``Section, Preparation, Field, Value`` rows for one experiment."""
+    yield _row('Experiment', None, 'ID', experiment.id)
+    yield _row('Experiment', None, 'Name', experiment.name)
+    yield _row('Experiment', None, 'Status', experiment.status)
+    yield _row('Experiment', None, 'Cell line', experiment.cell_line)
+    yield _row('Experiment', None, 'Seeding date', experiment.seeding_date.isoformat() if experiment.seeding_date else '')
+    yield _row('Experiment', None, 'Cells to seed', format_number(experiment.cells_to_seed))
+    yield _row('Experiment', None, 'Vessel type', experiment.vessel_type)
+    yield _row('Experiment', None, 'Vessels seeded', format_number(experiment.vessels_seeded))
+    yield _row('Experiment', None, 'Media type', experiment.media_type)
+    yield _row('Experiment', None, 'Created at', experiment.created_at.isoformat())
+    if experiment.finished_at:
+        yield _row('Experiment', None, 'Finished at', experiment.finished_at.isoformat())
+
+    for prep in experiment.preps:
+        prep_name = prep.transfer_name
+        yield _row('Preparation', prep_name, 'Plate count', format_number(prep.plate_count))
+        yield _row('Preparation', prep_name, 'Transfer concentration (ng/µL)', format_number(prep.transfer_concentration))
+        yield _row('Preparation', prep_name, 'Plasmid size (bp)', format_number(prep.plasmid_size_bp))
+        status_labels = ['Logged']
+        if prep.transfection:
+            status_labels.append('Transfected')
+        if prep.media_change:
+            status_labels.append('Media changed')
+        if prep.harvest:
+            status_labels.append('Harvested')
+        if prep.titer_runs:
+            status_labels.append('Titered')
+        yield _row('Preparation', prep_name, 'Status', ' · '.join(status_labels))
+
+        if prep.transfection:
+            tx = prep.transfection
+            yield _row('Transfection', prep_name, 'Vessel type', tx.vessel_type)
+            yield _row('Transfection', prep_name, 'Surface area (cm²)', format_number(tx.surface_area))
+            yield _row('Transfection', prep_name, 'Opti-MEM (mL)', format_number(tx.opti_mem_ml))
+            yield _row('Transfection', prep_name, 'X-tremeGene 9 (µL)', format_number(tx.xtremegene_ul))
+            yield _row('Transfection', prep_name, 'Total plasmid (µg)', format_number(tx.total_plasmid_ug))
+            yield _row('Transfection', prep_name, 'Ratio display', tx.ratio_display)
+            yield _row('Transfection', prep_name, 'Transfer DNA (µg)', format_number(tx.transfer_mass_ug))
+            yield _row('Transfection', prep_name, 'Packaging DNA (µg)', format_number(tx.packaging_mass_ug))
+            yield _row('Transfection', prep_name, 'Envelope DNA (µg)', format_number(tx.envelope_mass_ug))
+            yield _row('Transfection', prep_name, 'Transfer concentration (ng/µL)', format_number(tx.transfer_concentration_ng_ul))
+            yield _row('Transfection', prep_name, 'Packaging concentration (ng/µL)', format_number(tx.packaging_concentration_ng_ul))
+            yield _row('Transfection', prep_name, 'Envelope concentration (ng/µL)', format_number(tx.envelope_concentration_ng_ul))
+            yield _row('Transfection', prep_name, 'Transfer volume (µL)', format_number(tx.transfer_volume_ul))
+            yield _row('Transfection', prep_name, 'Packaging volume (µL)', format_number(tx.packaging_volume_ul))
+            yield _row('Transfection', prep_name, 'Envelope volume (µL)', format_number(tx.envelope_volume_ul))
+            yield _row('Transfection', prep_name, 'Recorded at', tx.created_at.isoformat())
+
+        if prep.media_change:
+            media = prep.media_change
+            yield _row('Media change', prep_name, 'Media type', media.media_type)
+            yield _row('Media change', prep_name, 'Volume (mL)', format_number(media.volume_ml))
+            yield _row('Media change', prep_name, 'Recorded at', media.created_at.isoformat())
+
+        if prep.harvest:
+            harvest = prep.harvest
+            yield _row('Harvest', prep_name, 'Harvest date', harvest.harvest_date.isoformat() if harvest.harvest_date else '')
+            yield _row('Harvest', prep_name, 'Volume (mL)', format_number(harvest.volume_ml))
+            yield _row('Harvest', prep_name, 'Recorded at', harvest.created_at.isoformat())
+
+        for run in sorted(prep.titer_runs, key=lambda item: item.created_at):
+            yield _row('Titer run', prep_name, 'Run created', run.created_at.isoformat())
+            yield _row('Titer run', prep_name, 'Cell line', run.cell_line)
+            yield _row('Titer run', prep_name, 'Cells seeded', format_number(run.cells_seeded))
+            yield _row('Titer run', prep_name, 'Vessel type', run.vessel_type)
+            yield _row('Titer run', prep_name, 'Selection reagent', run.selection_reagent)
+            yield _row('Titer run', prep_name, 'Selection concentration', run.selection_concentration)
+            yield _row('Titer run', prep_name, 'Polybrene (µg/mL)', format_number(run.polybrene_ug_ml))
+            yield _row('Titer run', prep_name, 'Measurement media (mL)', format_number(run.measurement_media_ml))
+            yield _row('Titer run', prep_name, 'Control cell concentration', format_number(run.control_cell_concentration))
+            valid_titers = [sample.titer_tu_ml for sample in run.samples if sample.titer_tu_ml is not None]
+            average_titer = (
+                round_titer_average(sum(valid_titers) / len(valid_titers)) if valid_titers else None
+            )
+            yield _row('Titer run', prep_name, 'Average titer (TU/mL)', format_number(average_titer))
+            for sample in run.samples:
+                selection_label = 'With selection' if sample.selection_used else 'No selection'
+                if sample.selection_used and run.selection_reagent:
+                    selection_label = f"{selection_label} ({run.selection_reagent})"
+                parts = [
+                    f"Virus volume: {format_number(sample.virus_volume_ul)} µL" if sample.virus_volume_ul is not None else None,
+                    selection_label,
+                    f"Measured %: {format_number(sample.measured_percent)}" if sample.measured_percent is not None else None,
+                    f"MOI: {format_number(sample.moi)}" if sample.moi is not None else None,
+                    f"Titer: {format_number(sample.titer_tu_ml)} TU/mL" if sample.titer_tu_ml is not None else None,
+                ]
+                value = '; '.join(part for part in parts if part)
+                if sample.cell_concentration is not None:
+                    value = f"{value}; Cell concentration: {format_number(sample.cell_concentration)}"
+                yield _row('Titer sample', prep_name, sample.label, value)
+
+
+def stream_csv(rows: Iterable[list]) -> Iterator[str]:
+    """Encode ``rows`` as CSV lines without buffering the whole document."""
+    writer = csv.writer(_LineBuffer())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def experiment_csv_filename(experiment: Experiment) -> str:
+    filename_base = ''.join(char for char in experiment.name if char.isalnum() or char in (' ', '-', '_')).strip()
+    return filename_base.replace(' ', '_') or f'experiment_{experiment.id}'
+
+
+def experiment_csv_lines(experiment: Experiment) -> Iterator[str]:
+    yield from stream_csv([EXPORT_HEADER])
+    yield from stream_csv(experiment_rows(experiment))
+
+
+def bulk_export_query(args, experiment_ids: Optional[list[int]] = None):
+    """Experiments matching the bulk export filters, ordered by id."""
+    query = filter_experiments(Experiment.query, args)
+    if experiment_ids:
+        query = query.filter(Experiment.id.in_(experiment_ids))
+    return query.order_by(Experiment.id)
+
+
+def bulk_csv_lines(query, chunk_size: int = BULK_EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """Stream every experiment from ``query`` in id-ordered chunks.
+
+    Each chunk eagerly loads its graph, is written out, and is then expunged
+    from the session so memory stays bounded by ``chunk_size``.
+    """
+    yield from stream_csv([BULK_EXPORT_HEADER])
+    last_id = 0
+    while True:
+        chunk = (
+            query.options(*experiment_detail_options())
+            .filter(Experiment.id > last_id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not chunk:
+            return
+        for experiment in chunk:
+            yield from stream_csv([experiment.id, *row] for row in experiment_rows(experiment))
+        last_id = chunk[-1].id
+        db.session.expunge_all()
@@ -0,0 +1,112 @@
+"""Parsing of ``?fields=`` / ``?include=`` into a :class:`Projection`.
+
+``fields`` limits the keys emitted for the endpoint's primary resource, and
+``fields[<type>]`` does the same for nested resources (``prep``,
+``transfection``, ``media_change``, ``harvest``, ``titer_run``, ``sample``).
+``include`` names the child collections to inline. Naming a nested child
+also inlines its parent, so ``include=samples`` implies ``titer_runs``.
+Without ``include`` every child the endpoint normally returns is inlined. ``id``
+is always emitted.
+"""
+from __future__ import annotations
+
+from sqlalchemy.orm import load_only
+
+from .models import (
+    Experiment,
+    Harvest,
+    LentivirusPrep,
+    MediaChange,
+    TiterRun,
+    TiterSample,
+    Transfection,
+)
+from .serializers import FULL_PROJECTION, Projection
+
+# Resource type -> (model, computed keys added on top of the table columns).
+RESOURCES = {
+    'experiment': (Experiment, ('titer_summaries',)),
+    'prep': (LentivirusPrep, ('vessel_type', 'status', 'latest_titer')),
+    'transfection': (Transfection, ()),
+    'media_change': (MediaChange, ()),
+    'harvest': (Harvest, ()),
+    'titer_run': (TiterRun, ()),
+    'sample': (TiterSample, ()),
+}
+
+INCLUDE_PARENTS = {
+    'preps': None,
+    'transfection': 'preps',
+    'media_change': 'preps',
+    'harvest': 'preps',
+    'titer_runs': 'preps',
+    'samples': 'titer_runs',
+}
+
+# Columns a computed key is derived from.
+_COMPUTED_SOURCES = {
+    ('experiment', 'titer_summaries'): ('titer_summaries_json',),
+    ('prep', 'vessel_type'): ('experiment_id',),
+}
+
+
+def resource_fields(resource_type: str) -> tuple[str, ...]:
+    model, computed = RESOURCES[resource_type]
+    return model.serialized_columns() + computed
+
+
+def _split(value: str) -> list[str]:
+    return [token.strip() for token in value.split(',') if token.strip()]
+
+
+def parse_projection(args, primary: str, includes: tuple[str, ...] = ()) -> Projection:
+    """Build a projection from request ``args``; raises ``ValueError`` when invalid.
+
+    ``includes`` lists the child collections the endpoint can inline.
+    """
+    fields = {}
+    for key in args:
+        if key == 'fields':
+            resource_type = primary
+        elif key.startswith('fields[') and key.endswith(']'):
+            resource_type = key[len('fields['):-1]
+            if resource_type not in RESOURCES:
+                raise ValueError(f'unknown resource type in {key}')
+        else:
+            continue
+        requested = set(_split(','.join(args.getlist(key))))
+        unknown = requested - set(resource_fields(resource_type))
+        if unknown:
+            raise ValueError(f'unknown {resource_type} field(s): {", ".join(sorted(unknown))}')
+        fields[resource_type] = frozenset(requested | {'id'})
+
+    included = None
+    if 'include' in args:
+        requested = set(_split(','.join(args.getlist('include'))))
+        unknown = requested - set(includes)
+        if unknown:
+            allowed = ', '.join(includes) or 'nothing'
+            raise ValueError(f'include accepts {allowed}; got {", ".join(sorted(unknown))}')
+        for name in list(requested):
+            parent = INCLUDE_PARENTS[name]
+            while parent is not None and parent in includes:
+                requested.add(parent)
+                parent = INCLUDE_PARENTS[parent]
+        included = frozenset(requested)
+
+    if not fields and included is None:
+        return FULL_PROJECTION
+    return Projection(fields, included)
+
+
+def column_load_options(resource_type: str, projection: Projection, required: tuple[str, ...] = ()) -> tuple:
+    """``load_only`` for the columns a projected primary resource needs."""
+    fields = projection.fields_for(resource_type)
+    if fields is None:
+        return ()
+    model, _ = RESOURCES[resource_type]
+    keys = {'id', *required}
+    for field in fields:
+        keys.update(_COMPUTED_SOURCES.get((resource_type, field), (field,)))
+    columns = [getattr(model, key) for key in model.__table__.columns.keys() if key in keys]
+    return (load_only(*columns),)
@@ -0,0 +1,448 @@
+"""Bulk import of experiments with nested preps, stages and titer data.
+
+Two input formats are accepted:
+
+* **NDJSON** – one experiment per line, shaped like the detail payload of
+  ``GET /api/experiments/<id>`` (``preps`` holding ``transfection``,
+  ``media_change``, ``harvest`` and ``titer_runs`` with ``samples``).
+* **CSV** – one record per row. ``record_type`` names the record
+  (``experiment``, ``prep``, ``transfection``, ``media_change``, ``harvest``,
+  ``titer_run`` or ``titer_sample``), ``ref`` labels it and ``parent_ref``
+  points at the row it belongs to. Remaining columns are field values.
+
+Every experiment is validated with the same parsers as the REST endpoints
+before anything is written; valid experiments are inserted in batches, one
+transaction per batch, and every rejected row is listed in the report.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import math
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from .database import db
+from .models import (
+    Experiment,
+    Harvest,
+    LentivirusPrep,
+    MediaChange,
+    TiterRun,
+    TiterSample,
+    Transfection,
+)
+from .utils import (
+    compute_moi,
+    compute_titer,
+    parse_optional_float,
+    parse_positive_int,
+    parse_shorthand_number,
+)
+
+IMPORT_BATCH_SIZE = 200
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+
+class ImportRowError(ValueError):
+    """A record that failed validation, tagged with its source row."""
+
+    def __init__(self, row: Optional[int], record_type: str, message: str):
+        super().__init__(message)
+        self.row = row
+        self.record_type = record_type
+
+    def to_dict(self) -> dict:
+        return {'row': self.row, 'record': self.record_type, 'error': str(self)}
+
+
+def _text(value, field: str) -> Optional[str]:
+    text = str(value).strip() if value is not None else ''
+    return text or None
+
+
+def _number(value, field: str) -> Optional[float]:
+    number = parse_shorthand_number(value)
+    if number is None and value not in (None, ''):
+        raise ValueError(f'{field} must be a number')
+    return number
+
+
+def _float(value, field: str) -> Optional[float]:
+    number = parse_optional_float(value)
+    if number is None and value not in (None, ''):
+        raise ValueError(f'{field} must be a number')
+    return number
+
+
+def _positive_int(value, field: str) -> Optional[int]:
+    number = parse_positive_int(value)
+    if number is None and value not in (None, ''):
+        raise ValueError(f'{field} must be a positive integer')
+    return number
+
+
+def _date(value, field: str):
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.strptime(str(value).strip()[:10], '%Y-%m-%d').date()
+    except ValueError as exc:
+        raise ValueError(f'{field} must be formatted as YYYY-MM-DD') from exc
+
+
+def _datetime(value, field: str) -> Optional[datetime]:
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError as exc:
+        raise ValueError(f'{field} must be an ISO 8601 timestamp') from exc
+
+
+def _status(value, field: str) -> Optional[str]:
+    status = (_text(value, field) or '').lower()
+    if not status:
+        return None
+    if status not in {'active', 'finished'}:
+        raise ValueError("status must be 'active' or 'finished'")
+    return status
+
+
+def _bool(value, field: str) -> Optional[bool]:
+    if value in (None, ''):
+        return None
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in {'1', 'true', 'yes', 'y'}:
+        return True
+    if text in {'0', 'false', 'no', 'n'}:
+        return False
+    raise ValueError(f'{field} must be true or false')
+
+
+FieldParsers = dict[str, Callable]
+
+RECORD_FIELDS: dict[str, FieldParsers] = {
+    'experiment': {
+        'name': _text,
+        'status': _status,
+        'finished_at': _datetime,
+        'cell_line': _text,
+        'passage_number': _text,
+        'cell_concentration': _number,
+        'cells_to_seed': _number,
+        'vessel_type': _text,
+        'seeding_volume_ml': _number,
+        'media_type': _text,
+        'vessels_seeded': _positive_int,
+        'seeding_date': _date,
+        'created_at': _datetime,
+    },
+    'prep': {
+        'transfer_name': _text,
+        'transfer_concentration': _float,
+        'plasmid_size_bp': _positive_int,
+        'cell_line_used': _text,
+        'plate_count': _positive_int,
+        'created_at': _datetime,
+    },
+    'transfection': {
+        'vessel_type': _text,
+        'surface_area': _float,
+        'opti_mem_ml': _float,
+        'xtremegene_ul': _float,
+        'total_plasmid_ug': _float,
+        'transfer_ratio': _float,
+        'packaging_ratio': _float,
+        'envelope_ratio': _float,
+        'transfer_mass_ug': _float,
+        'packaging_mass_ug': _float,
+        'envelope_mass_ug': _float,
+        'ratio_mode': _text,
+        'transfer_volume_ul': _float,
+        'packaging_volume_ul': _float,
+        'envelope_volume_ul': _float,
+        'transfer_concentration_ng_ul': _float,
+        'packaging_concentration_ng_ul': _float,
+        'envelope_concentration_ng_ul': _float,
+        'ratio_display': _text,
+        'created_at': _datetime,
+    },
+    'media_change': {
+        'media_type': _text,
+        'volume_ml': _float,
+        'created_at': _datetime,
+    },
+    'harvest': {
+        'harvest_date': _date,
+        'volume_ml': _float,
+        'created_at': _datetime,
+    },
+    'titer_run': {
+        'cell_line': _text,
+        'cells_seeded': _number,
+        'vessel_type': _text,
+        'selection_reagent': _text,
+        'selection_concentration': _text,
+        'tests_count': _positive_int,
+        'notes': _text,
+        'polybrene_ug_ml': _number,
+        'measurement_media_ml': _number,
+        'control_cell_concentration': _number,
+        'created_at': _datetime,
+    },
+    'titer_sample': {
+        'label': _text,
+        'virus_volume_ul': _float,
+        'selection_used': _bool,
+        'measured_percent': _float,
+        'moi': _float,
+        'titer_tu_ml': _float,
+        'cell_concentration': _number,
+    },
+}
+
+REQUIRED_FIELDS = {
+    'experiment': ('cell_line', 'vessel_type', 'cells_to_seed'),
+    'prep': ('transfer_name',),
+    'media_change': ('volume_ml',),
+    'harvest': ('volume_ml',),
+    'titer_run': ('cell_line', 'cells_seeded', 'vessel_type'),
+    'titer_sample': ('label', 'virus_volume_ul'),
+}
+
+# CSV record type -> (parent record type, key on the parent, holds a list)
+CSV_PARENTS = {
+    'prep': ('experiment', 'preps', True),
+    'transfection': ('prep', 'transfection', False),
+    'media_change': ('prep', 'media_change', False),
+    'harvest': ('prep', 'harvest', False),
+    'titer_run': ('prep', 'titer_runs', True),
+    'titer_sample': ('titer_run', 'samples', True),
+}
+
+
+def _parse_fields(record_type: str, record: dict, row: Optional[int]) -> dict:
+    if not isinstance(record, dict):
+        raise ImportRowError(row, record_type, f'{record_type} must be an object')
+    row = record.get('_row', row)
+    values = {}
+    for field, parser in RECORD_FIELDS[record_type].items():
+        if field not in record:
+            continue
+        try:
+            values[field] = parser(record[field], field)
+        except ValueError as exc:
+            raise ImportRowError(row, record_type, str(exc)) from exc
+    missing = [field for field in REQUIRED_FIELDS.get(record_type, ()) if values.get(field) is None]
+    if missing:
+        raise ImportRowError(row, record_type, f"missing required field(s): {', '.join(missing)}")
+    return {field: value for field, value in values.items() if value is not None}
+
+
+def _children(record: dict, key: str, record_type: str, row: Optional[int]) -> list:
+    """The nested ``key`` list of ``record``; raises when it is not a list."""
+    children = record.get(key)
+    if not children:
+        return []
+    if not isinstance(children, list):
+        raise ImportRowError(row, record_type, f'{key} must be a list')
+    return children
+
+
+def _build_sample(record: dict, run_values: dict, row: Optional[int]) -> TiterSample:
+    values = _parse_fields('titer_sample', record, row)
+    values.setdefault('selection_used', True)
+    measured_percent = values.get('measured_percent')
+    if measured_percent is not None and 'titer_tu_ml' not in values:
+        # Same survival-percent convention as the titer results endpoint.
+        fraction_infected = max(0.0, min(1.0, 1 - measured_percent / 100))
+        moi = compute_moi(fraction_infected)
+        titer = compute_titer(run_values['cells_seeded'], moi, values['virus_volume_ul'])
+        values['moi'] = round(moi, 4) if math.isfinite(moi) else None
+        values['titer_tu_ml'] = round(titer, 2) if math.isfinite(titer) else None
+    return TiterSample(**values)
+
+
+def _build_prep(record: dict, experiment_values: dict, row: Optional[int]) -> LentivirusPrep:
+    values = _parse_fields('prep', record, row)
+    values.setdefault('plate_count', 1)
+    prep = LentivirusPrep(**values)
+    row = record.get('_row', row)
+
+    transfection_record = record.get('transfection')
+    if transfection_record:
+        transfection_values = _parse_fields('transfection', transfection_record, row)
+        transfection_values.setdefault('vessel_type', experiment_values['vessel_type'])
+        ratios = [transfection_values.get(f'{part}_ratio') for part in ('transfer', 'packaging', 'envelope')]
+        if 'ratio_display' not in transfection_values and all(value is not None for value in ratios):
+            transfection_values['ratio_display'] = ':'.join(f'{value:g}' for value in ratios)
+        prep.transfection = Transfection(**transfection_values)
+
+    media_record = record.get('media_change')
+    if media_record:
+        media_values = _parse_fields('media_change', media_record, row)
+        media_values.setdefault('media_type', experiment_values.get('media_type'))
+        prep.media_change = MediaChange(**media_values)
+
+    harvest_record = record.get('harvest')
+    if harvest_record:
+        prep.harvest = Harvest(**_parse_fields('harvest', harvest_record, row))
+
+    for run_record in _children(record, 'titer_runs', 'prep', row):
+        run_values = _parse_fields('titer_run', run_record, row)
+        run_values.setdefault('tests_count', 1)
+        run = TiterRun(**run_values)
+        run_row = run_record.get('_row', row)
+        for sample_record in _children(run_record, 'samples', 'titer_run', run_row):
+            run.samples.append(_build_sample(sample_record, run_values, run_row))
+        prep.titer_runs.append(run)
+    return prep
+
+
+def build_experiment(record: dict, row: Optional[int] = None) -> Experiment:
+    """Validate one nested experiment record and build its ORM graph.
+
+    Defaults mirror ``POST /api/experiments``. Raises :class:`ImportRowError`.
+    """
+    values = _parse_fields('experiment', record, row)
+    row = record.get('_row', row)
+    values.setdefault('seeding_date', datetime.utcnow().date())
+    values.setdefault('status', 'active')
+    values.setdefault('media_type', 'DMEM + 10% FBS')
+    values.setdefault('vessels_seeded', 1)
+    values.setdefault('name', f"{values['cell_line']} · {values['seeding_date'].isoformat()}")
+    if values['status'] == 'finished':
+        values.setdefault('finished_at', datetime.utcnow())
+
+    experiment = Experiment(**values)
+    for prep_record in _children(record, 'preps', 'experiment', row):
+        experiment.preps.append(_build_prep(prep_record, values, row))
+
+    plates = sum(prep.plate_count for prep in experiment.preps)
+    if plates > values['vessels_seeded']:
+        raise ImportRowError(
+            row,
+            'experiment',
+            f"preps allocate {plates} plate(s) but only {values['vessels_seeded']} were seeded",
+        )
+    return experiment
+
+
+def records_from_ndjson(text: str) -> tuple[list[dict], list[dict]]:
+    records, errors = [], []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as exc:
+            errors.append(ImportRowError(line_number, 'experiment', f'invalid JSON: {exc.msg}').to_dict())
+            continue
+        if not isinstance(record, dict):
+            errors.append(ImportRowError(line_number, 'experiment', 'each line must be a JSON object').to_dict())
+            continue
+        record['_row'] = line_number
+        records.append(record)
+    return records, errors
+
+
+def records_from_csv(text: str) -> tuple[list[dict], list[dict]]:
+    """Assemble nested experiment records from ``record_type``/``ref``/``parent_ref`` rows."""
+    records, errors = [], []
+    refs: dict[str, tuple[str, dict]] = {}
+    reader = csv.DictReader(io.StringIO(text))
+    for line_number, row in enumerate(reader, start=2):
+        record_type = (row.pop('record_type', '') or '').strip().lower()
+        ref = (row.pop('ref', '') or '').strip()
+        parent_ref = (row.pop('parent_ref', '') or '').strip()
+        record = {key: value for key, value in row.items() if key and value not in (None, '')}
+        record['_row'] = line_number
+
+        if record_type == 'experiment':
+            records.append(record)
+        elif record_type in CSV_PARENTS:
+            parent_type, key, many = CSV_PARENTS[record_type]
+            parent = refs.get(parent_ref)
+            if parent is None or parent[0] != parent_type:
+                errors.append(
+                    ImportRowError(
+                        line_number, record_type, f'parent_ref {parent_ref!r} does not name a {parent_type} row'
+                    ).to_dict()
+                )
+                continue
+            if many:
+                parent[1].setdefault(key, []).append(record)
+            else:
+                parent[1][key] = record
+        else:
+            errors.append(
+                ImportRowError(line_number, record_type or 'unknown', f'unknown record_type {record_type!r}').to_dict()
+            )
+            continue
+        if ref:
+            refs[ref] = (record_type, record)
+    return records, errors
+
+
+def parse_import(text: str, fmt: str) -> tuple[list[dict], list[dict]]:
+    if fmt == 'csv':
+        return records_from_csv(text)
+    if fmt == 'ndjson':
+        return records_from_ndjson(text)
+    raise ValueError(f"format must be one of: {', '.join(IMPORT_FORMATS)}")
+
+
+def import_records(
+    records: Iterable[dict],
+    errors: Optional[list[dict]] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    dry_run: bool = False,
+) -> dict:
+    """Insert valid experiment records in batched transactions and report the rest."""
+    report = {'imported': 0, 'failed': 0, 'errors': list(errors or []), 'experiment_ids': []}
+    report['failed'] = len(report['errors'])
+    batch: list[tuple[Optional[int], Experiment]] = []
+
+    def write_batch() -> None:
+        if not batch:
+            return
+        if dry_run:
+            report['imported'] += len(batch)
+            batch.clear()
+            return
+        try:
+            db.session.add_all(experiment for _, experiment in batch)
+            db.session.flush()
+            experiment_ids = [experiment.id for _, experiment in batch]
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            report['failed'] += len(batch)
+            report['errors'].extend(
+                ImportRowError(row, 'experiment', f'database error: {exc.__class__.__name__}').to_dict()
+                for row, _ in batch
+            )
+        else:
+            report['imported'] += len(batch)
+            report['experiment_ids'].extend(experiment_ids)
+        db.session.expunge_all()
+        batch.clear()
+
+    for record in records:
+        row = record.get('_row') if isinstance(record, dict) else None
+        try:
+            batch.append((row, build_experiment(record, row)))
+        except ImportRowError as exc:
+            report['failed'] += 1
+            report['errors'].append(exc.to_dict())
+            continue
+        if len(batch) >= batch_size:
+            write_batch()
+    write_batch()
+    return report
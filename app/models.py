@@ -1,20 +1,34 @@
 """SQLAlchemy model definitions for the Lentivirus tracker."""
 from __future__ import annotations
 
+import json
 from datetime import datetime
 from typing import Optional
 
 from .database import db
+from .serializers import FULL_PROJECTION, Projection, SerializerMixin
 from .utils import round_titer_average
 
 
 class TimestampMixin:
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Stamped from sync_counter by SQLite triggers on every insert and update (app.sync).
+    change_seq = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0', index=True, info={'serialize': False}
+    )
 
 
-class Experiment(db.Model, TimestampMixin):
+class Experiment(db.Model, TimestampMixin, SerializerMixin):
     __tablename__ = 'experiments'
+    __serializer_exclude__ = frozenset({'titer_summaries_json'})
+    __table_args__ = (
+        db.Index('ix_experiments_created_at_id', 'created_at', 'id'),
+        db.Index('ix_experiments_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_experiments_cell_line_created_at_id', 'cell_line', 'created_at', 'id'),
+        db.Index('ix_experiments_vessel_type_created_at_id', 'vessel_type', 'created_at', 'id'),
+        db.Index('ix_experiments_seeding_date', 'seeding_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False, default='Untitled Experiment')
@@ -29,45 +43,31 @@ class Experiment(db.Model, TimestampMixin):
     media_type = db.Column(db.String(128))
     vessels_seeded = db.Column(db.Integer)
     seeding_date = db.Column(db.Date)
+    # Rollups of child records, kept current by app.rollups on every flush.
+    prep_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_preps = db.Column(db.Integer, nullable=False, default=0)
+    plates_allocated = db.Column(db.Integer, nullable=False, default=0)
+    titer_summaries_json = db.Column(db.Text, nullable=False, default='[]')
 
     preps = db.relationship('LentivirusPrep', backref='experiment', cascade='all, delete-orphan')
 
-    def to_dict(self, include_children: bool = False) -> dict:
-        plates_allocated = sum((prep.plate_count or 0) for prep in self.preps)
-        completed_preps = sum(1 for prep in self.preps if prep.transfection is not None)
-        data = {
-            'id': self.id,
-            'name': self.name,
-            'status': self.status,
-            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
-            'cell_line': self.cell_line,
-            'passage_number': self.passage_number,
-            'cell_concentration': self.cell_concentration,
-            'cells_to_seed': self.cells_to_seed,
-            'vessel_type': self.vessel_type,
-            'seeding_volume_ml': self.seeding_volume_ml,
-            'media_type': self.media_type,
-            'vessels_seeded': self.vessels_seeded,
-            'seeding_date': self.seeding_date.isoformat() if self.seeding_date else None,
-            'prep_count': len(self.preps),
-            'completed_preps': completed_preps,
-            'plates_allocated': plates_allocated,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'titer_summaries': [
-                summary for summary in (prep.latest_titer_summary() for prep in self.preps) if summary
-            ],
-        }
-        if include_children:
-            data['preps'] = [prep.to_dict(include_children=True) for prep in self.preps]
+    def to_dict(self, include_children: bool = False, projection: Projection = FULL_PROJECTION) -> dict:
+        data = self.column_dict(projection.fields_for('experiment'))
+        if projection.wants('experiment', 'titer_summaries'):
+            data['titer_summaries'] = json.loads(self.titer_summaries_json or '[]')
+        if include_children and projection.include('preps'):
+            data['preps'] = [
+                prep.to_dict(include_children=True, projection=projection) for prep in self.preps
+            ]
         return data
 
 
-class LentivirusPrep(db.Model, TimestampMixin):
+class LentivirusPrep(db.Model, TimestampMixin, SerializerMixin):
     __tablename__ = 'lentivirus_preps'
+    __serializer_exclude__ = frozenset({'cell_line_used'})
 
     id = db.Column(db.Integer, primary_key=True)
-    experiment_id = db.Column(db.Integer, db.ForeignKey('experiments.id'), nullable=False)
+    experiment_id = db.Column(db.Integer, db.ForeignKey('experiments.id'), nullable=False, index=True)
     transfer_name = db.Column(db.String(128), nullable=False)
     transfer_concentration = db.Column(db.Float)
     plasmid_size_bp = db.Column(db.Integer)
@@ -95,40 +95,38 @@ class LentivirusPrep(db.Model, TimestampMixin):
             'run_created_at': latest_run.created_at.isoformat(),
         }
 
-    def to_dict(self, include_children: bool = False) -> dict:
-        status = {
-            'logged': True,
-            'transfected': self.transfection is not None,
-            'media_changed': self.media_change is not None,
-            'harvested': self.harvest is not None,
-            'titered': bool(self.titer_runs),
-        }
-        data = {
-            'id': self.id,
-            'experiment_id': self.experiment_id,
-            'transfer_name': self.transfer_name,
-            'transfer_concentration': self.transfer_concentration,
-            'plasmid_size_bp': self.plasmid_size_bp,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'vessel_type': self.experiment.vessel_type if self.experiment else None,
-            'plate_count': self.plate_count,
-            'status': status,
-            'latest_titer': self.latest_titer_summary(),
-        }
+    def to_dict(self, include_children: bool = False, projection: Projection = FULL_PROJECTION) -> dict:
+        data = self.column_dict(projection.fields_for('prep'))
+        if projection.wants('prep', 'vessel_type'):
+            data['vessel_type'] = self.experiment.vessel_type if self.experiment else None
+        if projection.wants('prep', 'status'):
+            data['status'] = {
+                'logged': True,
+                'transfected': self.transfection is not None,
+                'media_changed': self.media_change is not None,
+                'harvested': self.harvest is not None,
+                'titered': bool(self.titer_runs),
+            }
+        if projection.wants('prep', 'latest_titer'):
+            data['latest_titer'] = self.latest_titer_summary()
         if include_children:
-            data['transfection'] = self.transfection.to_dict() if self.transfection else None
-            data['media_change'] = self.media_change.to_dict() if self.media_change else None
-            data['harvest'] = self.harvest.to_dict() if self.harvest else None
-            data['titer_runs'] = [run.to_dict(include_samples=True) for run in self.titer_runs]
+            for name in ('transfection', 'media_change', 'harvest'):
+                if projection.include(name):
+                    stage = getattr(self, name)
+                    data[name] = stage.to_dict(projection.fields_for(name)) if stage else None
+            if projection.include('titer_runs'):
+                data['titer_runs'] = [
+                    run.to_dict(include_samples=True, projection=projection) for run in self.titer_runs
+                ]
         return data
 
 
-class Transfection(db.Model, TimestampMixin):
+class Transfection(db.Model, TimestampMixin, SerializerMixin):
     __tablename__ = 'transfections'
+    __serializer_exclude__ = frozenset({'updated_at'})
 
     id = db.Column(db.Integer, primary_key=True)
-    prep_id = db.Column(db.Integer, db.ForeignKey('lentivirus_preps.id'), nullable=False)
+    prep_id = db.Column(db.Integer, db.ForeignKey('lentivirus_preps.id'), nullable=False, index=True)
     vessel_type = db.Column(db.String(64), nullable=False)
     surface_area = db.Column(db.Float)
     opti_mem_ml = db.Column(db.Float)
@@ -149,74 +147,42 @@ class Transfection(db.Model, TimestampMixin):
     envelope_concentration_ng_ul = db.Column(db.Float)
     ratio_display = db.Column(db.String(64))
 
-    def to_dict(self) -> dict:
-        return {
-            'id': self.id,
-            'prep_id': self.prep_id,
-            'vessel_type': self.vessel_type,
-            'surface_area': self.surface_area,
-            'opti_mem_ml': self.opti_mem_ml,
-            'xtremegene_ul': self.xtremegene_ul,
-            'total_plasmid_ug': self.total_plasmid_ug,
-            'transfer_ratio': self.transfer_ratio,
-            'packaging_ratio': self.packaging_ratio,
-            'envelope_ratio': self.envelope_ratio,
-            'transfer_mass_ug': self.transfer_mass_ug,
-            'packaging_mass_ug': self.packaging_mass_ug,
-            'envelope_mass_ug': self.envelope_mass_ug,
-            'ratio_mode': self.ratio_mode,
-            'transfer_volume_ul': self.transfer_volume_ul,
-            'packaging_volume_ul': self.packaging_volume_ul,
-            'envelope_volume_ul': self.envelope_volume_ul,
-            'transfer_concentration_ng_ul': self.transfer_concentration_ng_ul,
-            'packaging_concentration_ng_ul': self.packaging_concentration_ng_ul,
-            'envelope_concentration_ng_ul': self.envelope_concentration_ng_ul,
-            'ratio_display': self.ratio_display,
-            'created_at': self.created_at.isoformat(),
-        }
+    def to_dict(self, fields: Optional[frozenset] = None) -> dict:
+        return self.column_dict(fields)
 
 
-class MediaChange(db.Model, TimestampMixin):
+class MediaChange(db.Model, TimestampMixin, SerializerMixin):
     __tablename__ = 'media_changes'
+    __serializer_exclude__ = frozenset({'updated_at'})
 
     id = db.Column(db.Integer, primary_key=True)
-    prep_id = db.Column(db.Integer, db.ForeignKey('lentivirus_preps.id'), nullable=False)
+    prep_id = db.Column(db.Integer, db.ForeignKey('lentivirus_preps.id'), nullable=False, index=True)
     media_type = db.Column(db.String(128), nullable=False)
     volume_ml = db.Column(db.Float, nullable=False)
 
-    def to_dict(self) -> dict:
-        return {
-            'id': self.id,
-            'prep_id': self.prep_id,
-            'media_type': self.media_type,
-            'volume_ml': self.volume_ml,
-            'created_at': self.created_at.isoformat(),
-        }
+    def to_dict(self, fields: Optional[frozenset] = None) -> dict:
+        return self.column_dict(fields)
 
 
-class Harvest(db.Model, TimestampMixin):
+class Harvest(db.Model, TimestampMixin, SerializerMixin):
     __tablename__ = 'harvests'
+    __serializer_exclude__ = frozenset({'updated_at'})
 
     id = db.Column(db.Integer, primary_key=True)
-    prep_id = db.Column(db.Integer, db.ForeignKey('lentivirus_preps.id'), nullable=False)
+    prep_id = db.Column(db.Integer, db.ForeignKey('lentivirus_preps.id'), nullable=False, index=True)
     harvest_date = db.Column(db.Date)
     volume_ml = db.Column(db.Float)
 
-    def to_dict(self) -> dict:
-        return {
-            'id': self.id,
-            'prep_id': self.prep_id,
-            'harvest_date': self.harvest_date.isoformat() if self.harvest_date else None,
-            'volume_ml': self.volume_ml,
-            'created_at': self.created_at.isoformat(),
-        }
+    def to_dict(self, fields: Optional[frozenset] = None) -> dict:
+        return self.column_dict(fields)
 
 
-class TiterRun(db.Model, TimestampMixin):
+class TiterRun(db.Model, TimestampMixin, SerializerMixin):
     __tablename__ = 'titer_runs'
+    __serializer_exclude__ = frozenset({'updated_at'})
 
     id = db.Column(db.Integer, primary_key=True)
-    prep_id = db.Column(db.Integer, db.ForeignKey('lentivirus_preps.id'), nullable=False)
+    prep_id = db.Column(db.Integer, db.ForeignKey('lentivirus_preps.id'), nullable=False, index=True)
     cell_line = db.Column(db.String(128), nullable=False)
     cells_seeded = db.Column(db.Float, nullable=False)
     vessel_type = db.Column(db.String(64), nullable=False)
@@ -230,32 +196,20 @@ class TiterRun(db.Model, TimestampMixin):
 
     samples = db.relationship('TiterSample', backref='titer_run', cascade='all, delete-orphan')
 
-    def to_dict(self, include_samples: bool = False) -> dict:
-        data = {
-            'id': self.id,
-            'prep_id': self.prep_id,
-            'cell_line': self.cell_line,
-            'cells_seeded': self.cells_seeded,
-            'vessel_type': self.vessel_type,
-            'selection_reagent': self.selection_reagent,
-            'selection_concentration': self.selection_concentration,
-            'tests_count': self.tests_count,
-            'notes': self.notes,
-            'polybrene_ug_ml': self.polybrene_ug_ml,
-            'measurement_media_ml': self.measurement_media_ml,
-            'control_cell_concentration': self.control_cell_concentration,
-            'created_at': self.created_at.isoformat(),
-        }
-        if include_samples:
-            data['samples'] = [sample.to_dict() for sample in self.samples]
+    def to_dict(self, include_samples: bool = False, projection: Projection = FULL_PROJECTION) -> dict:
+        data = self.column_dict(projection.fields_for('titer_run'))
+        if include_samples and projection.include('samples'):
+            fields = projection.fields_for('sample')
+            data['samples'] = [sample.to_dict(fields) for sample in self.samples]
         return data
 
 
-class TiterSample(db.Model, TimestampMixin):
+class TiterSample(db.Model, TimestampMixin, SerializerMixin):
     __tablename__ = 'titer_samples'
+    __serializer_exclude__ = frozenset({'titer_run_id', 'created_at', 'updated_at'})
 
     id = db.Column(db.Integer, primary_key=True)
-    titer_run_id = db.Column(db.Integer, db.ForeignKey('titer_runs.id'), nullable=False)
+    titer_run_id = db.Column(db.Integer, db.ForeignKey('titer_runs.id'), nullable=False, index=True)
     label = db.Column(db.String(128), nullable=False)
     virus_volume_ul = db.Column(db.Float, nullable=False)
     selection_used = db.Column(db.Boolean, default=False)
@@ -264,14 +218,58 @@ class TiterSample(db.Model, TimestampMixin):
     titer_tu_ml = db.Column(db.Float)
     cell_concentration = db.Column(db.Float)
 
+    def to_dict(self, fields: Optional[frozenset] = None) -> dict:
+        return self.column_dict(fields)
+
+
+class DeletedRecord(db.Model):
+    """Tombstone left behind when an experiment-graph row is deleted."""
+
+    __tablename__ = 'deleted_records'
+
+    id = db.Column(db.Integer, primary_key=True)
+    record_type = db.Column(db.String(32), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    experiment_id = db.Column(db.Integer)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+
     def to_dict(self) -> dict:
         return {
-            'id': self.id,
-            'label': self.label,
-            'virus_volume_ul': self.virus_volume_ul,
-            'selection_used': self.selection_used,
-            'measured_percent': self.measured_percent,
-            'moi': self.moi,
-            'titer_tu_ml': self.titer_tu_ml,
-            'cell_concentration': self.cell_concentration,
+            'type': self.record_type,
+            'id': self.record_id,
+            'experiment_id': self.experiment_id,
+            'deleted_at': self.deleted_at.isoformat(),
         }
+
+
+class SyncCounter(db.Model):
+    """Single-row counter behind the ``change_seq`` stamps and sync tokens."""
+
+    __tablename__ = 'sync_counter'
+
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TiterRunStats(db.Model):
+    """One row per titer run with a recorded titer, kept current by app.analytics."""
+
+    __tablename__ = 'titer_run_stats'
+    __table_args__ = (
+        db.Index('ix_titer_run_stats_run_created_at', 'run_created_at'),
+        db.Index('ix_titer_run_stats_revision', 'revision'),
+    )
+
+    run_id = db.Column(db.Integer, db.ForeignKey('titer_runs.id', ondelete='CASCADE'), primary_key=True)
+    prep_id = db.Column(db.Integer, nullable=False)
+    experiment_id = db.Column(db.Integer, nullable=False, index=True)
+    transfer_name = db.Column(db.String(128), nullable=False)
+    cell_line = db.Column(db.String(128))
+    vessel_type = db.Column(db.String(64))
+    run_created_at = db.Column(db.DateTime, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+    titer_tu_ml = db.Column(db.Float, nullable=False)
+    log_titer = db.Column(db.Float)
+    # Increases on every rewrite, so readers can fetch only runs changed since a revision.
+    revision = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,188 @@
+"""Parity checks for the column-driven serializers and the JSON backends.
+
+Models serialize from their table columns (:mod:`app.serializers`).
+:data:`LEGACY_FIELDS` keeps the field lists each ``to_dict`` spelled out by
+hand before that change, and :func:`legacy_dict` rebuilds the old payloads
+from them. :func:`check_serializer_parity` loads full experiment graphs. It
+requires that every object's ``to_dict``, and every whole graph, encodes to
+the same bytes as its legacy payload. Each available JSON backend then
+encodes the same graphs. The stdlib backend must match Flask's default
+provider byte for byte. ``orjson`` must decode to the same value; its byte
+differences (UTF-8 text instead of ``\\u`` escapes) are only counted.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date
+from typing import Iterable, Optional
+
+from flask.json.provider import DefaultJSONProvider
+
+from .models import (
+    Experiment,
+    Harvest,
+    LentivirusPrep,
+    MediaChange,
+    TiterRun,
+    TiterSample,
+    Transfection,
+)
+from .queries import experiment_detail_options
+from .serializers import json_provider, orjson
+
+DEFAULT_PARITY_LIMIT = 200
+MAX_REPORTED_MISMATCHES = 5
+
+# Column fields of each payload before serializers were generated from the table.
+LEGACY_FIELDS = {
+    Experiment: (
+        'id', 'name', 'status', 'finished_at', 'cell_line', 'passage_number', 'cell_concentration',
+        'cells_to_seed', 'vessel_type', 'seeding_volume_ml', 'media_type', 'vessels_seeded',
+        'seeding_date', 'prep_count', 'completed_preps', 'plates_allocated', 'created_at', 'updated_at',
+    ),
+    LentivirusPrep: (
+        'id', 'experiment_id', 'transfer_name', 'transfer_concentration', 'plasmid_size_bp',
+        'created_at', 'updated_at', 'plate_count',
+    ),
+    Transfection: (
+        'id', 'prep_id', 'vessel_type', 'surface_area', 'opti_mem_ml', 'xtremegene_ul',
+        'total_plasmid_ug', 'transfer_ratio', 'packaging_ratio', 'envelope_ratio', 'transfer_mass_ug',
+        'packaging_mass_ug', 'envelope_mass_ug', 'ratio_mode', 'transfer_volume_ul',
+        'packaging_volume_ul', 'envelope_volume_ul', 'transfer_concentration_ng_ul',
+        'packaging_concentration_ng_ul', 'envelope_concentration_ng_ul', 'ratio_display', 'created_at',
+    ),
+    MediaChange: ('id', 'prep_id', 'media_type', 'volume_ml', 'created_at'),
+    Harvest: ('id', 'prep_id', 'harvest_date', 'volume_ml', 'created_at'),
+    TiterRun: (
+        'id', 'prep_id', 'cell_line', 'cells_seeded', 'vessel_type', 'selection_reagent',
+        'selection_concentration', 'tests_count', 'notes', 'polybrene_ug_ml', 'measurement_media_ml',
+        'control_cell_concentration', 'created_at',
+    ),
+    TiterSample: (
+        'id', 'label', 'virus_volume_ul', 'selection_used', 'measured_percent', 'moi', 'titer_tu_ml',
+        'cell_concentration',
+    ),
+}
+# Rollup counters the old payload reported as 0 when unset.
+_ZERO_WHEN_UNSET = frozenset({'prep_count', 'completed_preps', 'plates_allocated'})
+_NAMES = {
+    Experiment: 'experiment',
+    LentivirusPrep: 'prep',
+    Transfection: 'transfection',
+    MediaChange: 'media_change',
+    Harvest: 'harvest',
+    TiterRun: 'titer_run',
+    TiterSample: 'sample',
+}
+
+
+def legacy_dict(instance, include_children: bool = False) -> dict:
+    """The payload ``instance.to_dict(include_children)`` returned before serializers were generated."""
+    data = {}
+    for key in LEGACY_FIELDS[type(instance)]:
+        value = getattr(instance, key)
+        if key in _ZERO_WHEN_UNSET:
+            value = value or 0
+        elif isinstance(value, date):
+            value = value.isoformat()
+        data[key] = value
+    if isinstance(instance, Experiment):
+        data['titer_summaries'] = json.loads(instance.titer_summaries_json or '[]')
+        if include_children:
+            data['preps'] = [legacy_dict(prep, include_children=True) for prep in instance.preps]
+    elif isinstance(instance, LentivirusPrep):
+        data['vessel_type'] = instance.experiment.vessel_type if instance.experiment else None
+        data['status'] = {
+            'logged': True,
+            'transfected': instance.transfection is not None,
+            'media_changed': instance.media_change is not None,
+            'harvested': instance.harvest is not None,
+            'titered': bool(instance.titer_runs),
+        }
+        data['latest_titer'] = instance.latest_titer_summary()
+        if include_children:
+            for name in ('transfection', 'media_change', 'harvest'):
+                stage = getattr(instance, name)
+                data[name] = legacy_dict(stage) if stage else None
+            data['titer_runs'] = [legacy_dict(run, include_children=True) for run in instance.titer_runs]
+    elif isinstance(instance, TiterRun) and include_children:
+        data['samples'] = [legacy_dict(sample) for sample in instance.samples]
+    return data
+
+
+def _graph_objects(experiment: Experiment) -> Iterable[object]:
+    yield experiment
+    for prep in experiment.preps:
+        yield prep
+        for stage in (prep.transfection, prep.media_change, prep.harvest):
+            if stage is not None:
+                yield stage
+        for run in prep.titer_runs:
+            yield run
+            yield from run.samples
+
+
+def _mismatch(name: str, instance, current: bytes, legacy: bytes) -> dict:
+    current_keys, legacy_keys = json.loads(current), json.loads(legacy)
+    keys = sorted(
+        key for key in set(current_keys) | set(legacy_keys)
+        if current_keys.get(key, ...) != legacy_keys.get(key, ...)
+    )
+    return {'check': name, 'id': getattr(instance, 'id', None), 'keys': keys}
+
+
+def check_serializer_parity(app, limit: int = DEFAULT_PARITY_LIMIT) -> list[dict]:
+    """Compare serializers and JSON backends against the legacy payloads.
+
+    Walks the first ``limit`` experiments with their full graphs. Returns one
+    result per check with ``checked`` objects, ``mismatches`` (the first few)
+    and ``ok``.
+    """
+    reference = DefaultJSONProvider(app)
+
+    def body(provider, payload) -> bytes:
+        return provider.response(payload).get_data()
+
+    results = {name: {'check': name, 'checked': 0, 'failed': 0, 'mismatches': []} for name in _NAMES.values()}
+    results['experiment graph'] = {'check': 'experiment graph', 'checked': 0, 'failed': 0, 'mismatches': []}
+    backends = ['stdlib'] + (['orjson'] if orjson is not None else [])
+    providers = {backend: json_provider(app, backend) for backend in backends}
+    for backend in backends:
+        results[f'{backend} backend'] = {
+            'check': f'{backend} backend', 'checked': 0, 'failed': 0, 'mismatches': [], 'bytes_identical': 0,
+        }
+
+    def record(name: str, failure: Optional[dict]) -> None:
+        result = results[name]
+        result['checked'] += 1
+        if failure is not None:
+            result['failed'] += 1
+            if len(result['mismatches']) < MAX_REPORTED_MISMATCHES:
+                result['mismatches'].append(failure)
+
+    experiments = (
+        Experiment.query.options(*experiment_detail_options()).order_by(Experiment.id).limit(limit).all()
+    )
+    for experiment in experiments:
+        for instance in _graph_objects(experiment):
+            name = _NAMES[type(instance)]
+            current, legacy = body(reference, instance.to_dict()), body(reference, legacy_dict(instance))
+            record(name, None if current == legacy else _mismatch(name, instance, current, legacy))
+
+        payload = {'experiment': experiment.to_dict(include_children=True)}
+        expected = body(reference, {'experiment': legacy_dict(experiment, include_children=True)})
+        current = body(reference, payload)
+        record('experiment graph', None if current == expected else {'check': 'experiment graph', 'id': experiment.id})
+
+        for backend, provider in providers.items():
+            encoded = body(provider, payload)
+            name = f'{backend} backend'
+            if encoded == current:
+                results[name]['bytes_identical'] += 1
+            # The stdlib backend is what clients see by default; it must not change a byte.
+            same = encoded == current if backend == 'stdlib' else json.loads(encoded) == json.loads(current)
+            record(name, None if same else {'check': name, 'id': experiment.id})
+
+    for result in results.values():
+        result['ok'] = result['failed'] == 0
+    return list(results.values())
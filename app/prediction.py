@@ -0,0 +1,339 @@
+"""Titer prediction from the transfection parameters each prep records.
+
+:class:`TiterModel` regresses natural-log titer on the producer vessel, the
+transfer:packaging:envelope molar ratio, transfer plasmid size, transfer DNA
+concentration and media. It fits by ridge-regularized least squares over
+every titered run in ``titer_run_stats``.
+
+The model keeps the normal-equation sums (``XᵀX``, ``Xᵀy``) in memory.
+:meth:`TiterModel.refresh` compares the table's run count and highest
+``revision`` with the state it last trained on. When they differ it fetches
+only the runs rewritten since, swaps their contributions into the sums and
+solves again. When nothing changed, a refresh costs one aggregate query.
+Predictions for any number of preps are one matrix product. NumPy is
+required; without it the model is not registered.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from typing import Optional, Sequence
+
+from sqlalchemy import func, select, update
+
+from .analytics import rebuild_titer_run_stats, write_titer_run_stats
+from .constants import DEFAULT_MOLAR_RATIO, SURFACE_AREAS
+from .models import Experiment, LentivirusPrep, MediaChange, TiterRunStats, TiterSample, Transfection
+from .utils import np, parse_optional_float, parse_positive_int, round_titer_average
+
+MODEL_KEY = 'lenti_titer_model'
+MIN_TRAINING_RUNS = 20
+RIDGE_PENALTY = 1.0
+# Numeric inputs are centred on these references; a missing input sits at its reference.
+REFERENCE_PLASMID_KB = 10.0
+REFERENCE_LOG10_DNA_NG_UL = 3.0
+_DEFAULT_FRACTIONS = tuple(part / sum(DEFAULT_MOLAR_RATIO) for part in DEFAULT_MOLAR_RATIO)
+_VESSELS = tuple(SURFACE_AREAS)
+# 95% interval half-width in standard deviations.
+_INTERVAL_Z = 1.96
+
+_stats = TiterRunStats.__table__
+_experiments = Experiment.__table__
+_preps = LentivirusPrep.__table__
+_transfections = Transfection.__table__
+_media_changes = MediaChange.__table__
+_samples = TiterSample.__table__
+# Runs whose titers the model check rewrites.
+_CHECK_RUNS = 5
+
+# (vessel_type, (transfer, packaging, envelope) ratio, plasmid_size_bp, transfer DNA ng/uL, media_type)
+Inputs = tuple
+
+
+class PredictionUnavailable(RuntimeError):
+    """Raised when there are too few titered runs to train on."""
+
+
+def _input_columns():
+    return (
+        func.coalesce(_transfections.c.vessel_type, _experiments.c.vessel_type),
+        _transfections.c.transfer_ratio,
+        _transfections.c.packaging_ratio,
+        _transfections.c.envelope_ratio,
+        _preps.c.plasmid_size_bp,
+        func.coalesce(_transfections.c.transfer_concentration_ng_ul, _preps.c.transfer_concentration),
+        func.coalesce(_media_changes.c.media_type, _experiments.c.media_type),
+    )
+
+
+def _prep_inputs_from():
+    return (
+        _preps.join(_experiments, _experiments.c.id == _preps.c.experiment_id)
+        .outerjoin(_transfections, _transfections.c.prep_id == _preps.c.id)
+        .outerjoin(_media_changes, _media_changes.c.prep_id == _preps.c.id)
+    )
+
+
+def _inputs(vessel, transfer_ratio, packaging_ratio, envelope_ratio, plasmid_size_bp, dna, media) -> Inputs:
+    ratio = (transfer_ratio, packaging_ratio, envelope_ratio)
+    if any(part is None for part in ratio):
+        ratio = DEFAULT_MOLAR_RATIO
+    return vessel, ratio, plasmid_size_bp, dna, media
+
+
+def prediction_inputs(data: dict) -> Inputs:
+    """Model inputs from a request item; raises ``ValueError`` when invalid."""
+    vessel = data.get('vessel_type')
+    if vessel not in SURFACE_AREAS:
+        raise ValueError(f'vessel_type must be one of {", ".join(_VESSELS)}')
+    try:
+        ratio = tuple(float(part) for part in data.get('ratio') or DEFAULT_MOLAR_RATIO)
+    except (TypeError, ValueError) as exc:
+        raise ValueError('ratio must list transfer, packaging and envelope parts') from exc
+    if len(ratio) != 3 or any(part < 0 for part in ratio) or not sum(ratio):
+        raise ValueError('ratio must list three non-negative transfer, packaging and envelope parts')
+    return _inputs(
+        vessel,
+        *ratio,
+        parse_positive_int(data.get('plasmid_size_bp')),
+        parse_optional_float(data.get('transfer_concentration_ng_ul')),
+        data.get('media_type') or None,
+    )
+
+
+def experiment_prediction_inputs(session, experiment_id: int) -> list[tuple[int, str, Inputs]]:
+    """``(prep_id, transfer_name, inputs)`` for every prep of an experiment.
+
+    Preps not yet transfected are planned at the default molar ratio in the
+    experiment's vessel and media.
+    """
+    rows = session.execute(
+        select(_preps.c.id, _preps.c.transfer_name, *_input_columns())
+        .select_from(_prep_inputs_from())
+        .where(_preps.c.experiment_id == experiment_id)
+        .order_by(_preps.c.id)
+    )
+    return [(prep_id, transfer_name, _inputs(*values)) for prep_id, transfer_name, *values in rows]
+
+
+def _design_matrix(inputs: Sequence[Inputs], media_levels: tuple[str, ...]):
+    """One row per input: intercept, vessel and media one-hots, centred numerics."""
+    vessel_index = {vessel: 1 + index for index, vessel in enumerate(_VESSELS)}
+    numeric = 1 + len(_VESSELS)
+    media_index = {media: numeric + 4 + index for index, media in enumerate(media_levels)}
+    matrix = np.zeros((len(inputs), numeric + 4 + len(media_levels)))
+    matrix[:, 0] = 1.0
+    for row, (vessel, ratio, plasmid_size_bp, dna, media) in enumerate(inputs):
+        if vessel in vessel_index:
+            matrix[row, vessel_index[vessel]] = 1.0
+        total = sum(ratio)
+        matrix[row, numeric] = ratio[0] / total - _DEFAULT_FRACTIONS[0]
+        matrix[row, numeric + 1] = ratio[1] / total - _DEFAULT_FRACTIONS[1]
+        if plasmid_size_bp:
+            matrix[row, numeric + 2] = plasmid_size_bp / 1000 - REFERENCE_PLASMID_KB
+        if dna and dna > 0:
+            matrix[row, numeric + 3] = math.log10(dna) - REFERENCE_LOG10_DNA_NG_UL
+        if media in media_index:
+            matrix[row, media_index[media]] = 1.0
+    return matrix
+
+
+class TiterModel:
+    """In-memory ridge regression of log titer, refreshed from ``titer_run_stats``."""
+
+    def __init__(self, penalty: float = RIDGE_PENALTY) -> None:
+        self.penalty = penalty
+        self._lock = threading.Lock()
+        self._runs: dict[int, tuple[Inputs, float]] = {}
+        self._count = 0
+        self._revision = 0
+        self._media: tuple[str, ...] = ()
+        self._xtx = None
+        self._xty = None
+        self._yty = 0.0
+        self._coefficients = None
+        self._residual_sd = None
+        self.full_fits = 0
+        self.incremental_fits = 0
+
+    def _accumulate(self, entries, sign: float) -> None:
+        if not entries:
+            return
+        matrix = _design_matrix([inputs for inputs, _ in entries], self._media)
+        target = np.fromiter((value for _, value in entries), dtype=float, count=len(entries))
+        self._xtx += sign * (matrix.T @ matrix)
+        self._xty += sign * (matrix.T @ target)
+        self._yty += sign * float(target @ target)
+
+    def _solve(self) -> None:
+        size = self._xtx.shape[0]
+        if len(self._runs) < MIN_TRAINING_RUNS:
+            self._coefficients = None
+            return
+        penalty = np.full(size, self.penalty)
+        penalty[0] = 0.0  # the intercept is not shrunk
+        coefficients = np.linalg.solve(self._xtx + np.diag(penalty), self._xty)
+        rss = self._yty - 2 * coefficients @ self._xty + coefficients @ self._xtx @ coefficients
+        dof = max(len(self._runs) - size, 1)
+        self._coefficients = coefficients
+        self._residual_sd = math.sqrt(max(float(rss), 0.0) / dof)
+
+    def _fetch(self, session, since_revision: int) -> list:
+        return session.execute(
+            select(_stats.c.run_id, _stats.c.revision, _stats.c.log_titer, *_input_columns())
+            .select_from(_prep_inputs_from().join(_stats, _stats.c.prep_id == _preps.c.id))
+            .where(_stats.c.revision > since_revision, _stats.c.log_titer.is_not(None))
+        ).all()
+
+    def refresh(self, session) -> None:
+        """Bring the fit up to date with ``titer_run_stats``."""
+        trained = _stats.c.log_titer.is_not(None)
+        count, revision = session.execute(
+            select(func.count(), func.coalesce(func.max(_stats.c.revision), 0)).where(trained)
+        ).one()
+        with self._lock:
+            if (count, revision) == (self._count, self._revision):
+                return
+            if revision < self._revision:
+                # The table was rebuilt with fresh revisions; start over, sums included.
+                self._runs.clear()
+                self._revision = 0
+                self._xtx = None
+            replaced = {}
+            fetched = set()
+            latest = revision
+            for run_id, row_revision, log_titer, *values in self._fetch(session, self._revision):
+                if run_id in self._runs:
+                    replaced.setdefault(run_id, self._runs[run_id])
+                self._runs[run_id] = (_inputs(*values), log_titer)
+                fetched.add(run_id)
+                latest = max(latest, row_revision)
+            if len(self._runs) != count:
+                current = set(session.execute(select(_stats.c.run_id).where(trained)).scalars())
+                for run_id in set(self._runs) - current:
+                    replaced.setdefault(run_id, self._runs[run_id])
+                    del self._runs[run_id]
+                count = len(self._runs)
+
+            media = tuple(sorted({inputs[4] for inputs, _ in self._runs.values() if inputs[4]}))
+            changed = [self._runs[run_id] for run_id in fetched if run_id in self._runs]
+            if self._xtx is None or media != self._media:
+                self._media = media
+                size = _design_matrix([], media).shape[1]
+                self._xtx = np.zeros((size, size))
+                self._xty = np.zeros(size)
+                self._yty = 0.0
+                self._accumulate(list(self._runs.values()), 1.0)
+                self.full_fits += 1
+            else:
+                self._accumulate(list(replaced.values()), -1.0)
+                self._accumulate(changed, 1.0)
+                self.incremental_fits += 1
+            self._solve()
+            self._count, self._revision = count, latest
+
+    def predict(self, inputs: Sequence[Inputs]) -> list[dict]:
+        """Predicted titer and 95% interval for each input, in one matrix product."""
+        with self._lock:
+            coefficients, media, residual_sd = self._coefficients, self._media, self._residual_sd
+            trained = len(self._runs)
+        if coefficients is None:
+            raise PredictionUnavailable(
+                f'Titer prediction needs at least {MIN_TRAINING_RUNS} titered runs; {trained} recorded'
+            )
+        if not inputs:
+            return []
+        predicted = _design_matrix(inputs, media) @ coefficients
+        margin = _INTERVAL_Z * residual_sd
+        return [
+            {
+                'titer_tu_ml': round_titer_average(math.exp(value)),
+                'log_titer': round(float(value), 4),
+                'interval_95': [
+                    round_titer_average(math.exp(value - margin)),
+                    round_titer_average(math.exp(value + margin)),
+                ],
+            }
+            for value in predicted
+        ]
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                'training_runs': len(self._runs),
+                'revision': self._revision,
+                'media_levels': len(self._media),
+                'residual_sd': None if self._residual_sd is None else round(self._residual_sd, 4),
+                'full_fits': self.full_fits,
+                'incremental_fits': self.incremental_fits,
+            }
+
+
+def init_titer_model(app) -> Optional[TiterModel]:
+    """Register the shared model; training happens lazily on first use."""
+    if np is None:
+        return None
+    model = TiterModel()
+    app.extensions[MODEL_KEY] = model
+    return model
+
+
+def _same_fit(model: TiterModel, reference: TiterModel) -> bool:
+    if model._media != reference._media or model._xtx.shape != reference._xtx.shape:
+        return False
+    if (model._coefficients is None) != (reference._coefficients is None):
+        return False
+    return (
+        np.allclose(model._xtx, reference._xtx)
+        and np.allclose(model._xty, reference._xty)
+        and math.isclose(model._yty, reference._yty, rel_tol=1e-9)
+        and (model._coefficients is None or np.allclose(model._coefficients, reference._coefficients))
+    )
+
+
+def check_titer_model(engine) -> list[dict]:
+    """Compare a refreshed model with a fresh fit after each kind of stats change.
+
+    Runs in a transaction that is rolled back: titers are rewritten, one run
+    loses its titers and ``titer_run_stats`` is rebuilt with new revisions.
+    After each step the long-lived model must hold the same sums and
+    coefficients as a model trained from scratch.
+    """
+    results = []
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            model = TiterModel()
+
+            def check(scenario: str) -> None:
+                model.refresh(connection)
+                reference = TiterModel()
+                reference.refresh(connection)
+                results.append({
+                    'scenario': scenario,
+                    'ok': reference._xtx is None or _same_fit(model, reference),
+                    **model.summary(),
+                })
+
+            check('initial fit')
+            run_ids = connection.execute(
+                select(_stats.c.run_id).order_by(_stats.c.run_id).limit(_CHECK_RUNS + 1)
+            ).scalars().all()
+            rewritten, emptied = run_ids[:_CHECK_RUNS], run_ids[_CHECK_RUNS:]
+            connection.execute(
+                update(_samples)
+                .where(_samples.c.titer_run_id.in_(rewritten))
+                .values(titer_tu_ml=_samples.c.titer_tu_ml * 2)
+            )
+            write_titer_run_stats(connection, rewritten)
+            check('titers rewritten')
+            connection.execute(
+                update(_samples).where(_samples.c.titer_run_id.in_(emptied)).values(titer_tu_ml=None)
+            )
+            write_titer_run_stats(connection, emptied)
+            check('run lost its titers')
+            rebuild_titer_run_stats(connection)
+            check('stats rebuilt')
+        finally:
+            transaction.rollback()
+    return results
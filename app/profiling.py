@@ -0,0 +1,476 @@
+"""Opt-in per-request profiling: latency, SQL and JSON encoding time.
+
+With ``LENTI_PROFILING=1`` every blueprint request records its wall time, the
+number of SQL statements it ran and their total time (from engine cursor
+events), and the time spent encoding JSON bodies. Each response carries a
+``Server-Timing`` header with those figures, and the per-endpoint aggregates
+are served in the Prometheus text format from ``GET /api/_metrics``.
+
+``LENTI_QUERY_WATCH=warn`` (or ``strict``) is the development/test mode. It
+fingerprints every statement a request runs and logs a warning, with the
+application stack that issued it, once one statement shape repeats more than
+``LENTI_QUERY_REPEAT_LIMIT`` times. It also checks the request's statement
+count against the budget the view declared with :func:`query_budget`. In
+``strict`` mode a breach raises :class:`QueryBudgetExceeded` so test clients
+fail loudly. Responses carry ``X-Query-Count`` and, when declared,
+``X-Query-Budget`` for tests to assert against.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+import traceback
+from functools import wraps
+from typing import Callable, Iterable, Mapping, Optional
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+
+from .cache import CACHE_KEY
+from .charts import CHART_CACHE_KEY
+from .database import READ_ENGINE_KEY, db
+from .models import LentivirusPrep, TiterRun, TiterSample
+from .sync import current_sync_sequence
+
+METRICS_KEY = 'lenti_request_metrics'
+QUERY_WATCH_KEY = 'lenti_query_watch'
+PROFILING_ENV = 'LENTI_PROFILING'
+QUERY_WATCH_ENV = 'LENTI_QUERY_WATCH'
+QUERY_REPEAT_LIMIT_ENV = 'LENTI_QUERY_REPEAT_LIMIT'
+QUERY_WATCH_MODES = ('off', 'warn', 'strict')
+DEFAULT_QUERY_REPEAT_LIMIT = 5
+# Recent row stamps the /api/changes budget sample polls for.
+SAMPLE_SYNC_CHANGES = 50
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+_PROFILE_KEY = '_lenti_profile'
+_QUERY_START_KEY = 'lenti_query_start'
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_UNBUDGETED = object()
+# Query arguments that make a route under budget check do its full work;
+# ``{experiment_id}`` and friends are filled from :func:`sample_url_values`.
+_SAMPLE_QUERY_ARGS = {
+    '/api/changes': {'since': '{sync_token}'},
+    '/api/search': {'q': 'p', 'limit': '100'},
+    '/api/predict/titer': {'experiment_id': '{experiment_id}'},
+}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def profiling_enabled(environ: Optional[Mapping[str, str]] = None) -> bool:
+    environ = os.environ if environ is None else environ
+    return (environ.get(PROFILING_ENV) or '0').strip().lower() in {'1', 'true', 'yes', 'on'}
+
+
+def query_watch_settings(environ: Optional[Mapping[str, str]] = None) -> tuple[str, int]:
+    """``(mode, repeat_limit)`` from ``LENTI_QUERY_WATCH``/``..._REPEAT_LIMIT``."""
+    environ = os.environ if environ is None else environ
+    mode = (environ.get(QUERY_WATCH_ENV) or 'off').strip().lower()
+    if mode in {'0', 'false', 'no'}:
+        mode = 'off'
+    elif mode in {'1', 'true', 'yes', 'on'}:
+        mode = 'warn'
+    if mode not in QUERY_WATCH_MODES:
+        raise ValueError(f'{QUERY_WATCH_ENV} must be one of: {", ".join(QUERY_WATCH_MODES)}')
+    raw = (environ.get(QUERY_REPEAT_LIMIT_ENV) or '').strip()
+    try:
+        limit = int(raw) if raw else DEFAULT_QUERY_REPEAT_LIMIT
+    except ValueError as exc:
+        raise ValueError(f'{QUERY_REPEAT_LIMIT_ENV} must be an integer') from exc
+    if limit < 1:
+        raise ValueError(f'{QUERY_REPEAT_LIMIT_ENV} must be at least 1')
+    return mode, limit
+
+
+def fingerprint_sql(statement: str) -> str:
+    """Statement shape with literals and ``IN`` lists collapsed to ``?``."""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in ``strict`` query-watch mode when a request breaks its limits."""
+
+
+def query_budget(limit: Optional[int] = None, **method_limits: Optional[int]) -> Callable:
+    """Declare how many SQL statements a view may run per request.
+
+    ``@query_budget(3)`` applies to every method; keyword arguments set
+    per-method budgets (``@query_budget(GET=8, PUT=15)``). A budget of
+    ``None`` marks a request whose work scales with its input, such as an
+    import; it is exempt from both the budget and the repeated-statement check.
+    """
+    budgets = {method.upper(): value for method, value in method_limits.items()}
+    if limit is not None or not method_limits:
+        budgets['*'] = limit
+
+    def decorate(view: Callable) -> Callable:
+        view.query_budgets = budgets
+        return view
+
+    return decorate
+
+
+def view_query_budget(view: Optional[Callable], method: str):
+    """The budget ``view`` declared for ``method``; a sentinel when undeclared."""
+    budgets = getattr(view, 'query_budgets', None)
+    if budgets is None:
+        return _UNBUDGETED
+    return budgets.get(method, budgets.get('*', _UNBUDGETED))
+
+
+def _application_stack() -> str:
+    frames = [
+        frame
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(_PACKAGE_DIR) and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames))
+
+
+class RequestProfile:
+    """Figures collected while one request is handled."""
+
+    __slots__ = (
+        'started', 'sql_statements', 'sql_seconds', 'serialize_seconds',
+        'shapes', 'repeat_limit', 'repeated',
+    )
+
+    def __init__(self, repeat_limit: Optional[int] = None) -> None:
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        # Statement shape counts, kept only while the query watch is active.
+        self.shapes: Optional[dict[str, int]] = {} if repeat_limit is not None else None
+        self.repeat_limit = repeat_limit
+        self.repeated: list[str] = []
+
+    def count_statement(self, statement: str) -> None:
+        self.sql_statements += 1
+        if self.shapes is None:
+            return
+        shape = fingerprint_sql(statement)
+        count = self.shapes.get(shape, 0) + 1
+        self.shapes[shape] = count
+        if count == self.repeat_limit + 1:
+            self.repeated.append(shape)
+            current_app.logger.warning(
+                'Statement ran more than %d times in %s %s (likely N+1): %s\n%s',
+                self.repeat_limit, request.method, request.path, shape, _application_stack(),
+            )
+
+    def server_timing(self, total_seconds: float) -> str:
+        return (
+            f'sql;desc="{self.sql_statements} queries";dur={self.sql_seconds * 1000:.2f}, '
+            f'serialize;dur={self.serialize_seconds * 1000:.2f}, '
+            f'total;dur={total_seconds * 1000:.2f}'
+        )
+
+
+class _Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds: tuple) -> None:
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class _EndpointSeries:
+    __slots__ = ('latency', 'sql_statements', 'sql_seconds', 'serialize_seconds', 'statuses')
+
+    def __init__(self) -> None:
+        self.latency = _Histogram(LATENCY_BUCKETS)
+        self.sql_statements = _Histogram(SQL_STATEMENT_BUCKETS)
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.statuses: dict[int, int] = {}
+
+
+class RequestMetrics:
+    """Per ``(endpoint, method)`` aggregates of completed request profiles."""
+
+    def __init__(self) -> None:
+        self._series: dict[tuple[str, str], _EndpointSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, method: str, status: int, profile: RequestProfile,
+                duration: float) -> None:
+        with self._lock:
+            series = self._series.get((endpoint, method))
+            if series is None:
+                series = self._series[(endpoint, method)] = _EndpointSeries()
+            series.latency.observe(duration)
+            series.sql_statements.observe(profile.sql_statements)
+            series.sql_seconds += profile.sql_seconds
+            series.serialize_seconds += profile.serialize_seconds
+            series.statuses[status] = series.statuses.get(status, 0) + 1
+
+    def render(self) -> str:
+        """Prometheus text exposition of every series recorded so far."""
+        requests = ['# HELP lenti_requests_total Requests handled, by response status.',
+                    '# TYPE lenti_requests_total counter']
+        latency = ['# HELP lenti_request_duration_seconds Request handling time.',
+                   '# TYPE lenti_request_duration_seconds histogram']
+        statements = ['# HELP lenti_request_sql_statements SQL statements executed per request.',
+                      '# TYPE lenti_request_sql_statements histogram']
+        sql_seconds = ['# HELP lenti_request_sql_seconds_total Time spent executing SQL.',
+                       '# TYPE lenti_request_sql_seconds_total counter']
+        serialize = ['# HELP lenti_request_serialize_seconds_total Time spent encoding JSON bodies.',
+                     '# TYPE lenti_request_serialize_seconds_total counter']
+        with self._lock:
+            for (endpoint, method), series in sorted(self._series.items()):
+                labels = f'endpoint="{_escape(endpoint)}",method="{method}"'
+                for status, count in sorted(series.statuses.items()):
+                    requests.append(f'lenti_requests_total{{{labels},status="{status}"}} {count}')
+                latency.extend(series.latency.lines('lenti_request_duration_seconds', labels))
+                statements.extend(series.sql_statements.lines('lenti_request_sql_statements', labels))
+                sql_seconds.append(f'lenti_request_sql_seconds_total{{{labels}}} {series.sql_seconds:.6f}')
+                serialize.append(
+                    f'lenti_request_serialize_seconds_total{{{labels}}} {series.serialize_seconds:.6f}'
+                )
+        return '\n'.join([*requests, *latency, *statements, *sql_seconds, *serialize]) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def current_profile() -> Optional[RequestProfile]:
+    if not has_app_context():
+        return None
+    return g.get(_PROFILE_KEY)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if current_profile() is not None:
+        conn.info.setdefault(_QUERY_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    profile = current_profile()
+    starts = conn.info.get(_QUERY_START_KEY)
+    if profile is None or not starts:
+        return
+    profile.sql_seconds += time.perf_counter() - starts.pop()
+    profile.count_statement(statement)
+
+
+def _handle_error(exception_context) -> None:
+    # A failed statement never reaches ``after_cursor_execute``.
+    connection = exception_context.connection
+    starts = connection.info.get(_QUERY_START_KEY) if connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine: Optional[Engine]) -> None:
+    """Attribute the statements ``engine`` runs to the current request profile."""
+    if engine is not None and not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+
+def _timed_json_response(respond):
+    @wraps(respond)
+    def response(*args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return respond(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return respond(*args, **kwargs)
+        finally:
+            profile.serialize_seconds += time.perf_counter() - started
+
+    return response
+
+
+class QueryWatch:
+    """Query-watch settings of an application."""
+
+    def __init__(self, mode: str, repeat_limit: int) -> None:
+        self.mode = mode
+        self.repeat_limit = repeat_limit
+
+
+def init_profiling(app, engines: Iterable[Optional[Engine]]) -> None:
+    """Install request profiling and/or the query watch as configured."""
+    watch_mode = app.config.get('QUERY_WATCH', 'off')
+    if not app.config.get('REQUEST_PROFILING') and watch_mode == 'off':
+        return
+    for engine in engines:
+        instrument_engine(engine)
+    if app.config.get('REQUEST_PROFILING'):
+        app.json.response = _timed_json_response(app.json.response)
+        app.extensions[METRICS_KEY] = RequestMetrics()
+    if watch_mode != 'off':
+        app.extensions[QUERY_WATCH_KEY] = QueryWatch(
+            watch_mode, app.config.get('QUERY_REPEAT_LIMIT', DEFAULT_QUERY_REPEAT_LIMIT)
+        )
+
+
+def start_request_profile() -> None:
+    metrics = current_app.extensions.get(METRICS_KEY)
+    watch = current_app.extensions.get(QUERY_WATCH_KEY)
+    if metrics is None and watch is None:
+        return
+    repeat_limit = None
+    if watch is not None:
+        view = current_app.view_functions.get(request.endpoint)
+        if view_query_budget(view, request.method) is not None:
+            repeat_limit = watch.repeat_limit
+    setattr(g, _PROFILE_KEY, RequestProfile(repeat_limit))
+
+
+def finish_request_profile(response: Response) -> Response:
+    """Record the request's profile and add its ``Server-Timing`` header."""
+    profile = g.pop(_PROFILE_KEY, None)
+    if profile is None:
+        return response
+    duration = time.perf_counter() - profile.started
+    metrics = current_app.extensions.get(METRICS_KEY)
+    if metrics is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe(endpoint, request.method, response.status_code, profile, duration)
+    response.headers.add('Server-Timing', profile.server_timing(duration))
+    watch = current_app.extensions.get(QUERY_WATCH_KEY)
+    if watch is not None:
+        _check_query_budget(watch, profile, response)
+    return response
+
+
+def _check_query_budget(watch: QueryWatch, profile: RequestProfile, response: Response) -> None:
+    view = current_app.view_functions.get(request.endpoint)
+    budget = view_query_budget(view, request.method)
+    response.headers['X-Query-Count'] = str(profile.sql_statements)
+    if budget is None:
+        return
+    problems = [
+        f'statement repeated more than {watch.repeat_limit} times: {shape}'
+        for shape in profile.repeated
+    ]
+    if profile.repeated:
+        response.headers['X-Query-Repeated'] = str(len(profile.repeated))
+    if budget is not _UNBUDGETED:
+        response.headers['X-Query-Budget'] = str(budget)
+        if profile.sql_statements > budget:
+            message = f'ran {profile.sql_statements} SQL statements; budget is {budget}'
+            current_app.logger.warning('%s %s %s', request.method, request.path, message)
+            problems.append(message)
+    if problems and watch.mode == 'strict':
+        raise QueryBudgetExceeded(f'{request.method} {request.path}: ' + '; '.join(problems))
+
+
+def enable_query_watch(app) -> QueryWatch:
+    """Turn on the query watch (``warn`` mode) for tooling that reads its headers."""
+    watch = app.extensions.get(QUERY_WATCH_KEY)
+    if watch is None:
+        with app.app_context():
+            instrument_engine(db.engine)
+        instrument_engine(app.extensions.get(READ_ENGINE_KEY))
+        watch = app.extensions[QUERY_WATCH_KEY] = QueryWatch(
+            'warn', app.config.get('QUERY_REPEAT_LIMIT', DEFAULT_QUERY_REPEAT_LIMIT)
+        )
+    return watch
+
+
+def sample_url_values() -> dict[str, int]:
+    """Ids of the busiest experiment, prep and titer run, keyed by URL argument.
+
+    The rows with the most children exercise any per-row query fan-out.
+    ``sync_token`` is a poll that missed the last :data:`SAMPLE_SYNC_CHANGES`
+    stamps, like an open session's, rather than the whole history.
+    """
+    values = {'sync_token': max(current_sync_sequence(db.session) - SAMPLE_SYNC_CHANGES, 1)}
+    for argument, column in (
+        ('experiment_id', LentivirusPrep.experiment_id),
+        ('prep_id', TiterRun.prep_id),
+        ('run_id', TiterSample.titer_run_id),
+    ):
+        busiest = db.session.execute(
+            select(column).group_by(column).order_by(func.count().desc(), column).limit(1)
+        ).scalar()
+        if busiest is not None:
+            values[argument] = busiest
+    return values
+
+
+def check_query_budgets(app) -> list[dict]:
+    """Request every budgeted ``GET`` route once and compare its statement count.
+
+    Routes whose URL needs an id the database cannot supply are skipped.
+    """
+    enable_query_watch(app)
+    with app.app_context():
+        url_values = sample_url_values()
+    urls = app.url_map.bind('localhost')
+    client = app.test_client()
+    caches = [app.extensions[key] for key in (CACHE_KEY, CHART_CACHE_KEY) if key in app.extensions]
+    results = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        budget = view_query_budget(app.view_functions.get(rule.endpoint), 'GET')
+        if 'GET' not in rule.methods or budget is None or budget is _UNBUDGETED:
+            continue
+        try:
+            query_args = {
+                key: value.format(**url_values) for key, value in _SAMPLE_QUERY_ARGS.get(rule.rule, {}).items()
+            }
+        except KeyError:
+            query_args = None
+        if query_args is None or not rule.arguments <= url_values.keys():
+            results.append({'route': rule.rule, 'budget': budget, 'skipped': True})
+            continue
+        for cache in caches:
+            cache.clear()
+        # Each request gets a fresh session, as it would when served.
+        db.session.remove()
+        values = {key: url_values[key] for key in rule.arguments}
+        values.update(query_args)
+        response = client.get(urls.build(rule.endpoint, values))
+        statements = int(response.headers.get('X-Query-Count', 0))
+        repeated = int(response.headers.get('X-Query-Repeated', 0))
+        results.append({
+            'route': rule.rule,
+            'budget': budget,
+            'skipped': False,
+            'status': response.status_code,
+            'statements': statements,
+            'repeated': repeated,
+            'ok': response.status_code < 400 and statements <= budget and not repeated,
+        })
+    return results
@@ -0,0 +1,160 @@
+"""Query builders for the experiment list and eager-loaded experiment graphs."""
+from __future__ import annotations
+
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import selectinload
+
+from .database import db
+from .models import Experiment, LentivirusPrep, TiterRun, TiterSample
+from .serializers import FULL_PROJECTION, Projection
+from .utils import parse_positive_int
+
+EXPERIMENT_PAGE_SIZE = 50
+EXPERIMENT_PAGE_MAX = 200
+
+
+def prep_detail_options(path=None, projection: Projection = FULL_PROJECTION) -> tuple:
+    """Loader options for ``LentivirusPrep.to_dict(include_children=True)``.
+
+    ``path`` chains the options off an existing loader (e.g. ``Experiment.preps``).
+    Children are only loaded when ``projection`` inlines them or a requested
+    computed field (``status``, ``latest_titer``) reads them.
+    """
+    def load(attribute):
+        return path.selectinload(attribute) if path is not None else selectinload(attribute)
+
+    status = projection.wants('prep', 'status')
+    latest_titer = projection.wants('prep', 'latest_titer')
+    options = [
+        load(getattr(LentivirusPrep, name))
+        for name in ('transfection', 'media_change', 'harvest')
+        if status or projection.include(name)
+    ]
+    if status or latest_titer or projection.include('titer_runs'):
+        runs = load(LentivirusPrep.titer_runs)
+        if latest_titer or projection.include('samples'):
+            runs = runs.selectinload(TiterRun.samples)
+        options.append(runs)
+    if not options and path is not None:
+        options.append(path)
+    return tuple(options)
+
+
+def experiment_detail_options(projection: Projection = FULL_PROJECTION) -> tuple:
+    """Loader options for ``Experiment.to_dict(include_children=True)`` and CSV export."""
+    if not projection.include('preps'):
+        return ()
+    return prep_detail_options(selectinload(Experiment.preps), projection)
+
+
+def titer_run_options(projection: Projection = FULL_PROJECTION) -> tuple:
+    if not projection.include('samples'):
+        return ()
+    return (selectinload(TiterRun.samples),)
+
+
+def load_experiment_or_404(experiment_id: int, options: tuple = ()) -> Experiment:
+    return Experiment.query.options(*options).filter_by(id=experiment_id).first_or_404()
+
+
+def encode_cursor(created_at: datetime, experiment_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{experiment_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> tuple[datetime, int]:
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        created_raw, id_raw = base64.urlsafe_b64decode(padded).decode().split('|', 1)
+        return datetime.fromisoformat(created_raw), int(id_raw)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def _parse_date_arg(args, name: str):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError as exc:
+        raise ValueError(f'{name} must be formatted as YYYY-MM-DD') from exc
+
+
+def filter_experiments(query, args):
+    """Apply the list endpoint's ``status``/``cell_line``/``vessel_type``/date filters."""
+    for field in ('status', 'cell_line', 'vessel_type'):
+        value = (args.get(field) or '').strip()
+        if value:
+            if field == 'status':
+                value = value.lower()
+            query = query.filter(getattr(Experiment, field) == value)
+
+    seeded_from = _parse_date_arg(args, 'seeding_date_from')
+    if seeded_from is not None:
+        query = query.filter(Experiment.seeding_date >= seeded_from)
+    seeded_to = _parse_date_arg(args, 'seeding_date_to')
+    if seeded_to is not None:
+        query = query.filter(Experiment.seeding_date <= seeded_to)
+    return query
+
+
+def experiment_page(query, args) -> tuple[list[Experiment], Optional[str]]:
+    """Return one keyset page ordered by ``(created_at, id)`` descending.
+
+    Raises ``ValueError`` for malformed filters or cursors.
+    """
+    limit = min(parse_positive_int(args.get('limit'), default=EXPERIMENT_PAGE_SIZE), EXPERIMENT_PAGE_MAX)
+    query = filter_experiments(query, args)
+
+    cursor = args.get('cursor')
+    if cursor:
+        created_at, experiment_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                Experiment.created_at < created_at,
+                and_(Experiment.created_at == created_at, Experiment.id < experiment_id),
+            )
+        )
+
+    rows = (
+        query.order_by(Experiment.created_at.desc(), Experiment.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
+
+
+def titer_fit_points(run_ids: Optional[list[int]] = None) -> list:
+    """``(run_id, cells_seeded, virus_volume_ul, fraction_infected)`` for fitting.
+
+    Only wells with selection and a measured survival percentage contribute;
+    every run's points come back from one query.
+    """
+    statement = (
+        select(
+            TiterSample.titer_run_id,
+            TiterRun.cells_seeded,
+            TiterSample.virus_volume_ul,
+            TiterSample.measured_percent,
+        )
+        .join(TiterRun, TiterRun.id == TiterSample.titer_run_id)
+        .where(TiterSample.selection_used.is_(True), TiterSample.measured_percent.is_not(None))
+        .order_by(TiterSample.titer_run_id, TiterSample.id)
+    )
+    if run_ids is not None:
+        statement = statement.where(TiterSample.titer_run_id.in_(run_ids))
+    return [
+        (run_id, cells, volume, max(0.0, min(1.0, 1 - measured_percent / 100)))
+        for run_id, cells, volume, measured_percent in db.session.execute(statement)
+    ]
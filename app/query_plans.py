@@ -0,0 +1,87 @@
+"""``EXPLAIN QUERY PLAN`` checks for the application's hot queries.
+
+Each entry in :func:`hot_queries` mirrors a statement issued by a list, detail,
+sync or titer endpoint. :func:`check_query_plans` asks SQLite how it would run
+each one. It flags full table scans and temporary sort B-trees, because either
+means a supporting index is missing.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.engine import Connection
+
+from .models import (
+    DeletedRecord,
+    Experiment,
+    Harvest,
+    LentivirusPrep,
+    MediaChange,
+    TiterRun,
+    TiterSample,
+    Transfection,
+)
+from .queries import filter_experiments
+
+_SAMPLE_IDS = [1, 2, 3]
+_SAMPLE_MOMENT = datetime(2024, 1, 1)
+_SAMPLE_SEQUENCE = 1000
+
+
+def _experiment_list(args: dict):
+    statement = filter_experiments(select(Experiment), args)
+    return statement.order_by(Experiment.created_at.desc(), Experiment.id.desc()).limit(51)
+
+
+def hot_queries() -> list[tuple[str, object]]:
+    """``(name, statement)`` pairs for the queries that must stay indexed."""
+    keyset = or_(
+        Experiment.created_at < _SAMPLE_MOMENT,
+        and_(Experiment.created_at == _SAMPLE_MOMENT, Experiment.id < 100),
+    )
+    queries = [
+        ('experiment list', _experiment_list({})),
+        ('experiment list next page', _experiment_list({}).where(keyset)),
+        ('experiment list by status', _experiment_list({'status': 'active'})),
+        ('experiment list by cell line', _experiment_list({'cell_line': 'HEK293T'})),
+        ('experiment list by vessel', _experiment_list({'vessel_type': 'T175'})),
+        ('preps by experiment', select(LentivirusPrep).where(LentivirusPrep.experiment_id.in_(_SAMPLE_IDS))),
+        ('titer samples by run', select(TiterSample).where(TiterSample.titer_run_id.in_(_SAMPLE_IDS))),
+        ('deleted records since', select(DeletedRecord).where(DeletedRecord.change_seq > _SAMPLE_SEQUENCE)),
+    ]
+    for model in (Transfection, MediaChange, Harvest, TiterRun):
+        table = model.__tablename__
+        queries.append((f'{table} by prep', select(model).where(model.prep_id.in_(_SAMPLE_IDS))))
+    for model in (Experiment, LentivirusPrep, Transfection, MediaChange, Harvest, TiterRun, TiterSample):
+        table = model.__tablename__
+        queries.append((f'{table} changed since', select(model).where(model.change_seq > _SAMPLE_SEQUENCE)))
+    return queries
+
+
+def explain_query_plan(connection: Connection, statement) -> list[str]:
+    compiled = statement.compile(
+        dialect=connection.dialect, compile_kwargs={'literal_binds': True}
+    )
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}')
+    return [row[-1] for row in rows]
+
+
+def plan_problems(plan: list[str]) -> list[str]:
+    """Plan steps that read a whole table or sort without an index."""
+    problems = []
+    for step in plan:
+        if step.startswith('SCAN ') and ' USING ' not in step:
+            problems.append(step)
+        elif step.startswith('USE TEMP B-TREE'):
+            problems.append(step)
+    return problems
+
+
+def check_query_plans(connection: Connection) -> list[dict]:
+    """Explain every hot query; each result lists its plan and any problems."""
+    results = []
+    for name, statement in hot_queries():
+        plan = explain_query_plan(connection, statement)
+        results.append({'name': name, 'plan': plan, 'problems': plan_problems(plan)})
+    return results
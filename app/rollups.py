@@ -0,0 +1,289 @@
+"""Experiment summary rollups maintained from child-record writes.
+
+``Experiment`` stores ``prep_count``, ``completed_preps``, ``plates_allocated``
+and the serialized ``titer_summaries`` so the list endpoint can be served from
+the experiments table alone. A session flush hook recomputes the rollups of
+every experiment touched by a prep, transfection, titer run or titer sample
+write; :func:`rebuild_experiment_rollups` repairs drift across the database.
+:func:`allocate_plates` reserves seeded plates against ``plates_allocated``
+before a prep is created or resized.
+"""
+from __future__ import annotations
+
+import json
+from typing import Iterable, Optional
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.orm import Session
+
+from .database import begin_immediate
+from .models import (
+    Experiment,
+    Harvest,
+    LentivirusPrep,
+    MediaChange,
+    TiterRun,
+    TiterSample,
+    Transfection,
+)
+from .utils import round_titer_average
+
+_PENDING_KEY = 'pending_rollup_experiments'
+_CHUNK_SIZE = 500
+
+_experiments = Experiment.__table__
+_preps = LentivirusPrep.__table__
+_transfections = Transfection.__table__
+_runs = TiterRun.__table__
+_samples = TiterSample.__table__
+
+
+def _chunks(values: list[int]) -> Iterable[list[int]]:
+    for start in range(0, len(values), _CHUNK_SIZE):
+        yield values[start:start + _CHUNK_SIZE]
+
+
+def _prep_experiment_ids(session: Session, prep_ids: set[int]) -> set[int]:
+    experiment_ids = set()
+    unresolved = []
+    for prep_id in prep_ids:
+        prep = session.identity_map.get(session.identity_key(LentivirusPrep, prep_id))
+        if prep is not None and prep.experiment_id is not None:
+            experiment_ids.add(prep.experiment_id)
+        else:
+            unresolved.append(prep_id)
+    connection = session.connection()
+    for chunk in _chunks(unresolved):
+        statement = select(_preps.c.experiment_id).where(_preps.c.id.in_(chunk))
+        experiment_ids.update(connection.execute(statement).scalars())
+    return experiment_ids
+
+
+def _run_prep_ids(session: Session, run_ids: set[int]) -> set[int]:
+    prep_ids = set()
+    unresolved = []
+    for run_id in run_ids:
+        run = session.identity_map.get(session.identity_key(TiterRun, run_id))
+        if run is not None and run.prep_id is not None:
+            prep_ids.add(run.prep_id)
+        else:
+            unresolved.append(run_id)
+    connection = session.connection()
+    for chunk in _chunks(unresolved):
+        statement = select(_runs.c.prep_id).where(_runs.c.id.in_(chunk))
+        prep_ids.update(connection.execute(statement).scalars())
+    return prep_ids
+
+
+def affected_experiment_ids(session: Session, instances: Iterable[object]) -> set[int]:
+    """Resolve the experiments that own ``instances`` (preps and their children)."""
+    experiment_ids: set[int] = set()
+    prep_ids: set[int] = set()
+    run_ids: set[int] = set()
+    for instance in instances:
+        if isinstance(instance, LentivirusPrep):
+            if instance.experiment_id is not None:
+                experiment_ids.add(instance.experiment_id)
+        elif isinstance(instance, (Transfection, MediaChange, Harvest, TiterRun)):
+            if instance.prep_id is not None:
+                prep_ids.add(instance.prep_id)
+        elif isinstance(instance, TiterSample):
+            if instance.titer_run_id is not None:
+                run_ids.add(instance.titer_run_id)
+    if run_ids:
+        prep_ids |= _run_prep_ids(session, run_ids)
+    if prep_ids:
+        experiment_ids |= _prep_experiment_ids(session, prep_ids)
+    return experiment_ids
+
+
+def compute_experiment_rollups(connection, experiment_ids: list[int]) -> dict[int, dict]:
+    """Compute rollup column values for ``experiment_ids`` with aggregate queries."""
+    rollups = {
+        experiment_id: {
+            'prep_count': 0,
+            'completed_preps': 0,
+            'plates_allocated': 0,
+            'titer_summaries': [],
+        }
+        for experiment_id in experiment_ids
+    }
+    prep_rows = connection.execute(
+        select(
+            _preps.c.experiment_id,
+            func.count(_preps.c.id),
+            func.coalesce(func.sum(_preps.c.plate_count), 0),
+            func.count(_transfections.c.id),
+        )
+        .select_from(_preps.outerjoin(_transfections, _transfections.c.prep_id == _preps.c.id))
+        .where(_preps.c.experiment_id.in_(experiment_ids))
+        .group_by(_preps.c.experiment_id)
+    )
+    for experiment_id, prep_count, plates_allocated, completed_preps in prep_rows:
+        rollups[experiment_id].update(
+            prep_count=prep_count,
+            plates_allocated=plates_allocated,
+            completed_preps=completed_preps,
+        )
+
+    # Mirrors LentivirusPrep.latest_titer_summary: the newest run per prep
+    # (first inserted on ties), averaged over samples with a recorded titer.
+    run_rows = connection.execute(
+        select(
+            _preps.c.experiment_id,
+            _preps.c.id,
+            _preps.c.transfer_name,
+            _runs.c.id,
+            _runs.c.created_at,
+        )
+        .select_from(_runs.join(_preps, _preps.c.id == _runs.c.prep_id))
+        .where(_preps.c.experiment_id.in_(experiment_ids))
+        .order_by(_preps.c.id, _runs.c.id)
+    )
+    latest_runs: dict[int, tuple] = {}
+    for experiment_id, prep_id, transfer_name, run_id, created_at in run_rows:
+        current = latest_runs.get(prep_id)
+        if current is None or created_at > current[3]:
+            latest_runs[prep_id] = (experiment_id, transfer_name, run_id, created_at)
+    if not latest_runs:
+        return rollups
+
+    run_titers: dict[int, list[float]] = {}
+    for chunk in _chunks([entry[2] for entry in latest_runs.values()]):
+        sample_rows = connection.execute(
+            select(_samples.c.titer_run_id, _samples.c.titer_tu_ml)
+            .where(_samples.c.titer_run_id.in_(chunk), _samples.c.titer_tu_ml.is_not(None))
+            .order_by(_samples.c.id)
+        )
+        for run_id, titer in sample_rows:
+            run_titers.setdefault(run_id, []).append(titer)
+
+    for prep_id in sorted(latest_runs):
+        experiment_id, transfer_name, run_id, created_at = latest_runs[prep_id]
+        titers = run_titers.get(run_id)
+        if not titers:
+            continue
+        rollups[experiment_id]['titer_summaries'].append(
+            {
+                'prep_id': prep_id,
+                'transfer_name': transfer_name,
+                'average_titer': round_titer_average(sum(titers) / len(titers)),
+                'run_id': run_id,
+                'run_created_at': created_at.isoformat(),
+            }
+        )
+    return rollups
+
+
+def write_experiment_rollups(connection, experiment_ids: Iterable[int]) -> int:
+    """Recompute and persist rollups for ``experiment_ids``; returns rows written."""
+    written = 0
+    for chunk in _chunks(sorted(set(experiment_ids))):
+        rollups = compute_experiment_rollups(connection, chunk)
+        # Plain SQL so TimestampMixin's onupdate leaves ``updated_at`` untouched.
+        connection.execute(
+            text(
+                'UPDATE experiments SET prep_count = :prep_count, '
+                'completed_preps = :completed_preps, plates_allocated = :plates_allocated, '
+                'titer_summaries_json = :titer_summaries_json WHERE id = :id'
+            ),
+            [
+                {
+                    'id': experiment_id,
+                    'prep_count': values['prep_count'],
+                    'completed_preps': values['completed_preps'],
+                    'plates_allocated': values['plates_allocated'],
+                    'titer_summaries_json': json.dumps(values['titer_summaries']),
+                }
+                for experiment_id, values in rollups.items()
+            ],
+        )
+        written += len(rollups)
+    return written
+
+
+def rebuild_experiment_rollups(connection, experiment_ids: Optional[Iterable[int]] = None) -> int:
+    """Repair rollup drift for the given experiments, or every experiment."""
+    if experiment_ids is None:
+        experiment_ids = connection.execute(select(_experiments.c.id)).scalars().all()
+    return write_experiment_rollups(connection, experiment_ids)
+
+
+class PlateAllocationError(ValueError):
+    """Raised when a prep asks for more plates than its experiment has left."""
+
+    def __init__(self, remaining: int) -> None:
+        super().__init__(f'{remaining} plate(s) remain available')
+        self.remaining = remaining
+
+
+def allocate_plates(session: Session, experiment_id: int, plate_count: int,
+                    prep_id: Optional[int] = None) -> None:
+    """Reserve ``plate_count`` seeded plates for a new prep, or for ``prep_id``.
+
+    Runs in an immediate transaction, and the capacity check is a single
+    conditional ``UPDATE`` of the ``plates_allocated`` rollup. Concurrent
+    writers therefore cannot both pass the check. When resizing, the prep's
+    current plates count as available. The flush hook later rewrites the
+    rollup from ``SUM(plate_count)``, which agrees with the reservation.
+    Raises :class:`PlateAllocationError` if the experiment lacks capacity.
+    Experiments without ``vessels_seeded`` are unlimited.
+    """
+    begin_immediate(session)
+    connection = session.connection()
+    current = 0
+    if prep_id is not None:
+        current = connection.execute(
+            select(_preps.c.plate_count).where(_preps.c.id == prep_id)
+        ).scalar() or 0
+    delta = plate_count - current
+    if delta <= 0:
+        return
+    # Plain SQL so TimestampMixin's onupdate leaves ``updated_at`` untouched.
+    reserved = connection.execute(
+        text(
+            'UPDATE experiments SET plates_allocated = plates_allocated + :delta '
+            'WHERE id = :id AND (vessels_seeded IS NULL OR vessels_seeded <= 0 '
+            'OR plates_allocated + :delta <= vessels_seeded)'
+        ),
+        {'id': experiment_id, 'delta': delta},
+    ).rowcount
+    if reserved:
+        return
+    capacity, allocated = connection.execute(
+        select(_experiments.c.vessels_seeded, _experiments.c.plates_allocated)
+        .where(_experiments.c.id == experiment_id)
+    ).one()
+    raise PlateAllocationError(capacity - allocated + current)
+
+
+def _collect_after_flush(session: Session, flush_context) -> None:
+    instances = [*session.new, *session.dirty, *session.deleted]
+    if not any(
+        isinstance(instance, (LentivirusPrep, Transfection, TiterRun, TiterSample))
+        for instance in instances
+    ):
+        return
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    pending |= affected_experiment_ids(session, instances)
+
+
+def _apply_after_flush_postexec(session: Session, flush_context) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    write_experiment_rollups(session.connection(), pending)
+    for experiment_id in pending:
+        experiment = session.identity_map.get(session.identity_key(Experiment, experiment_id))
+        if experiment is not None:
+            session.expire(
+                experiment,
+                ['prep_count', 'completed_preps', 'plates_allocated', 'titer_summaries_json'],
+            )
+
+
+def register_rollup_hooks() -> None:
+    """Keep experiment rollups current on every ORM flush."""
+    if not event.contains(Session, 'after_flush', _collect_after_flush):
+        event.listen(Session, 'after_flush', _collect_after_flush)
+        event.listen(Session, 'after_flush_postexec', _apply_after_flush_postexec)
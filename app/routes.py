@@ -1,16 +1,35 @@
 """Blueprint routes for the Lentivirus tracker Flask application."""
 from __future__ import annotations
 
-import csv
-import io
 import math
 from datetime import datetime
 from typing import Iterable
 
-from flask import Blueprint, Response, current_app, jsonify, render_template, request
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+    stream_with_context,
+)
+from sqlalchemy import insert
 
 from .constants import BASE_TRANSFECTION, DEFAULT_MOLAR_RATIO, SURFACE_AREAS
-from .database import db
+from .analytics import titer_analytics
+from .cache import CACHE_KEY, experiment_cache
+from .charts import CHART_CACHE_KEY, chart_cache, moi_chart, moi_chart_query, moi_chart_version
+from .database import READ_ENGINE_KEY, active_sqlite_pragmas, db, serialized_write
+from .exports import (
+    bulk_csv_lines,
+    bulk_export_query,
+    experiment_csv_filename,
+    experiment_csv_lines,
+)
+from .fieldsets import column_load_options, parse_projection
+from .imports import IMPORT_BATCH_SIZE, import_records, parse_import
 from .models import (
     Experiment,
     Harvest,
@@ -20,20 +39,73 @@ from .models import (
     TiterSample,
     Transfection,
 )
+from .prediction import (
+    MODEL_KEY,
+    PredictionUnavailable,
+    experiment_prediction_inputs,
+    prediction_inputs,
+)
+from .profiling import (
+    METRICS_KEY,
+    PROMETHEUS_CONTENT_TYPE,
+    finish_request_profile,
+    query_budget,
+    start_request_profile,
+)
+from .queries import (
+    experiment_detail_options,
+    experiment_page,
+    load_experiment_or_404,
+    prep_detail_options,
+    titer_fit_points,
+    titer_run_options,
+)
+from .rollups import PlateAllocationError, allocate_plates
+from .scaling import (
+    SCALING_TABLE_ETAG,
+    SCALING_TABLE_JSON,
+    seeding_volume,
+    transfection_scaling,
+)
+from .search import search_records
+from .serializers import FULL_PROJECTION
+from .sync import collect_changes, decode_sync_token
 from .utils import (
-    calculate_seeding_volume,
-    calculate_transfection_scaling,
+    TITER_FIT_MAX_FRACTION,
+    TITER_FIT_MIN_FRACTION,
     compute_moi,
     compute_titer,
+    compute_titer_batch,
+    fit_poisson_titers,
     parse_optional_float,
     parse_positive_int,
     parse_shorthand_number,
     round_titer_average,
-    total_plate_count,
 )
+from .versioning import collection_version, experiment_version, variant_version
 
 
 bp = Blueprint('main', __name__)
+bp.before_request(start_request_profile)
+bp.after_request(finish_request_profile)
+
+EXPERIMENT_INCLUDES = ('preps', 'transfection', 'media_change', 'harvest', 'titer_runs', 'samples')
+PREP_INCLUDES = EXPERIMENT_INCLUDES[1:]
+
+
+def _conditional_json(etag: str, build_payload) -> Response:
+    """Answer ``If-None-Match`` with 304, only building the JSON body on a miss.
+
+    ``build_payload`` may return a prebuilt ``Response`` instead of a payload.
+    """
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        payload = build_payload()
+        response = payload if isinstance(payload, Response) else jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
 
 
 @bp.route('/')
@@ -48,6 +120,8 @@ def index():
 
 
 @bp.route('/api/experiments', methods=['GET', 'POST'])
+@query_budget(GET=2, POST=2)
+@serialized_write
 def experiments_endpoint():
     if request.method == 'POST':
         data = request.get_json(force=True)
@@ -94,16 +168,128 @@ def experiments_endpoint():
             return jsonify({'error': 'Unable to save experiment', 'details': str(exc)}), 500
         return jsonify({'experiment': experiment.to_dict()})
 
-    experiments = Experiment.query.order_by(Experiment.created_at.desc()).all()
-    return jsonify({'experiments': [exp.to_dict() for exp in experiments]})
+    def build_page() -> dict:
+        query = Experiment.query.options(
+            *column_load_options('experiment', projection, required=('created_at',))
+        )
+        experiments, next_cursor = experiment_page(query, request.args)
+        return {
+            'experiments': [exp.to_dict(projection=projection) for exp in experiments],
+            'next_cursor': next_cursor,
+        }
+
+    try:
+        projection = parse_projection(request.args, 'experiment')
+        etag = collection_version(sorted(request.args.items(multi=True)))
+        return _conditional_json(etag, build_page)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+
+@bp.route('/api/_diagnostics/storage', methods=['GET'])
+def storage_diagnostics():
+    """Configured storage profile next to the pragma values SQLite reports."""
+    configured = current_app.config.get('SQLITE_PRAGMAS', {})
+    read_engine = current_app.extensions.get(READ_ENGINE_KEY)
+    with db.engine.connect() as connection:
+        active = active_sqlite_pragmas(connection, configured)
+        sqlite_version = connection.exec_driver_sql('SELECT sqlite_version()').scalar()
+    return jsonify(
+        {
+            'profile': current_app.config.get('SQLITE_STORAGE_PROFILE'),
+            'configured': configured,
+            'active': active,
+            'sqlite_version': sqlite_version,
+            'concurrency': current_app.config.get('SQLITE_CONCURRENCY', {}),
+            'read_pool': read_engine.pool.status() if read_engine is not None else None,
+        }
+    )
+
+
+@bp.route('/api/_diagnostics/cache', methods=['GET'])
+def cache_diagnostics():
+    """Hit/miss counters and occupancy of the experiment and chart payload caches."""
+    cache = current_app.extensions.get(CACHE_KEY)
+    charts = current_app.extensions.get(CHART_CACHE_KEY)
+    return jsonify({
+        'enabled': cache is not None,
+        **(cache.stats() if cache is not None else {}),
+        'charts': charts.stats() if charts is not None else None,
+    })
+
+
+@bp.route('/api/_metrics', methods=['GET'])
+def request_metrics():
+    """Per-endpoint latency, SQL and serialization aggregates for Prometheus."""
+    metrics = current_app.extensions.get(METRICS_KEY)
+    if metrics is None:
+        return jsonify({'error': 'Request profiling is disabled; set LENTI_PROFILING=1'}), 404
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@bp.route('/api/changes', methods=['GET'])
+@query_budget(14)
+def changes_endpoint():
+    since = request.args.get('since')
+    try:
+        since_value = decode_sync_token(since) if since else None
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify(collect_changes(since_value))
+
+
+@bp.route('/api/search', methods=['GET'])
+@query_budget(3)
+def search_endpoint():
+    """Ranked full-text hits across experiments, preps and titer runs."""
+    try:
+        hits, next_cursor = search_records(request.args)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify({'hits': hits, 'next_cursor': next_cursor})
+
+
+def _experiment_detail_body(experiment_id: int, version: str) -> Response:
+    """Detail response body, served from the experiment cache when current."""
+    cache = experiment_cache()
+    if cache is not None:
+        body = cache.get(experiment_id, version)
+        if body is not None:
+            return Response(body, mimetype=current_app.json.mimetype)
+    experiment = load_experiment_or_404(experiment_id, experiment_detail_options())
+    response = current_app.json.response({'experiment': experiment.to_dict(include_children=True)})
+    if cache is not None:
+        cache.put(experiment_id, version, response.get_data())
+    return response
 
 
 @bp.route('/api/experiments/<int:experiment_id>', methods=['GET', 'PUT', 'DELETE'])
+@query_budget(GET=8, PUT=19, DELETE=18)
+@serialized_write
 def experiment_detail(experiment_id: int):
-    experiment = Experiment.query.get_or_404(experiment_id)
-
     if request.method == 'GET':
-        return jsonify({'experiment': experiment.to_dict(include_children=True)})
+        try:
+            projection = parse_projection(request.args, 'experiment', EXPERIMENT_INCLUDES)
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+        etag = experiment_version(experiment_id)
+        if etag is None:
+            abort(404)
+        if projection is FULL_PROJECTION:
+            return _conditional_json(etag, lambda: _experiment_detail_body(experiment_id, etag))
+
+        def build_projected() -> dict:
+            options = (
+                *experiment_detail_options(projection),
+                *column_load_options('experiment', projection),
+            )
+            experiment = load_experiment_or_404(experiment_id, options)
+            return {'experiment': experiment.to_dict(include_children=True, projection=projection)}
+
+        etag = variant_version(etag, sorted(request.args.items(multi=True)))
+        return _conditional_json(etag, build_projected)
+
+    experiment = load_experiment_or_404(experiment_id, experiment_detail_options())
 
     if request.method == 'DELETE':
         db.session.delete(experiment)
@@ -161,128 +347,56 @@ def experiment_detail(experiment_id: int):
 
 
 @bp.route('/api/experiments/<int:experiment_id>/export', methods=['GET'])
+@query_budget(7)
 def export_experiment_csv(experiment_id: int) -> Response:
-    experiment = Experiment.query.get_or_404(experiment_id)
-
-    def format_number(value) -> str:
-        if value is None:
-            return ''
-        if isinstance(value, float):
-            if math.isnan(value) or math.isinf(value):
-                return ''
-            rounded = round(value, 4)
-            if rounded.is_integer():
-                return str(int(rounded))
-            return f"{rounded:.4f}".rstrip('0').rstrip('.')
-        return str(value)
-
-    def write_row(writer: csv.writer, section: str, prep_name: str | None, field: str, value: str | float | None) -> None:
-        writer.writerow([section, prep_name or '', field, value if isinstance(value, str) else format_number(value)])
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Section', 'Preparation', 'Field', 'Value'])
-
-    write_row(writer, 'Experiment', None, 'ID', experiment.id)
-    write_row(writer, 'Experiment', None, 'Name', experiment.name)
-    write_row(writer, 'Experiment', None, 'Status', experiment.status)
-    write_row(writer, 'Experiment', None, 'Cell line', experiment.cell_line)
-    write_row(writer, 'Experiment', None, 'Seeding date', experiment.seeding_date.isoformat() if experiment.seeding_date else '')
-    write_row(writer, 'Experiment', None, 'Cells to seed', format_number(experiment.cells_to_seed))
-    write_row(writer, 'Experiment', None, 'Vessel type', experiment.vessel_type)
-    write_row(writer, 'Experiment', None, 'Vessels seeded', format_number(experiment.vessels_seeded))
-    write_row(writer, 'Experiment', None, 'Media type', experiment.media_type)
-    write_row(writer, 'Experiment', None, 'Created at', experiment.created_at.isoformat())
-    if experiment.finished_at:
-        write_row(writer, 'Experiment', None, 'Finished at', experiment.finished_at.isoformat())
-
-    for prep in experiment.preps:
-        prep_name = prep.transfer_name
-        write_row(writer, 'Preparation', prep_name, 'Plate count', format_number(prep.plate_count))
-        write_row(writer, 'Preparation', prep_name, 'Transfer concentration (ng/µL)', format_number(prep.transfer_concentration))
-        write_row(writer, 'Preparation', prep_name, 'Plasmid size (bp)', format_number(prep.plasmid_size_bp))
-        status_labels = ['Logged']
-        if prep.transfection:
-            status_labels.append('Transfected')
-        if prep.media_change:
-            status_labels.append('Media changed')
-        if prep.harvest:
-            status_labels.append('Harvested')
-        if prep.titer_runs:
-            status_labels.append('Titered')
-        write_row(writer, 'Preparation', prep_name, 'Status', ' · '.join(status_labels))
-
-        if prep.transfection:
-            tx = prep.transfection
-            write_row(writer, 'Transfection', prep_name, 'Vessel type', tx.vessel_type)
-            write_row(writer, 'Transfection', prep_name, 'Surface area (cm²)', format_number(tx.surface_area))
-            write_row(writer, 'Transfection', prep_name, 'Opti-MEM (mL)', format_number(tx.opti_mem_ml))
-            write_row(writer, 'Transfection', prep_name, 'X-tremeGene 9 (µL)', format_number(tx.xtremegene_ul))
-            write_row(writer, 'Transfection', prep_name, 'Total plasmid (µg)', format_number(tx.total_plasmid_ug))
-            write_row(writer, 'Transfection', prep_name, 'Ratio display', tx.ratio_display)
-            write_row(writer, 'Transfection', prep_name, 'Transfer DNA (µg)', format_number(tx.transfer_mass_ug))
-            write_row(writer, 'Transfection', prep_name, 'Packaging DNA (µg)', format_number(tx.packaging_mass_ug))
-            write_row(writer, 'Transfection', prep_name, 'Envelope DNA (µg)', format_number(tx.envelope_mass_ug))
-            write_row(writer, 'Transfection', prep_name, 'Transfer concentration (ng/µL)', format_number(tx.transfer_concentration_ng_ul))
-            write_row(writer, 'Transfection', prep_name, 'Packaging concentration (ng/µL)', format_number(tx.packaging_concentration_ng_ul))
-            write_row(writer, 'Transfection', prep_name, 'Envelope concentration (ng/µL)', format_number(tx.envelope_concentration_ng_ul))
-            write_row(writer, 'Transfection', prep_name, 'Transfer volume (µL)', format_number(tx.transfer_volume_ul))
-            write_row(writer, 'Transfection', prep_name, 'Packaging volume (µL)', format_number(tx.packaging_volume_ul))
-            write_row(writer, 'Transfection', prep_name, 'Envelope volume (µL)', format_number(tx.envelope_volume_ul))
-            write_row(writer, 'Transfection', prep_name, 'Recorded at', tx.created_at.isoformat())
-
-        if prep.media_change:
-            media = prep.media_change
-            write_row(writer, 'Media change', prep_name, 'Media type', media.media_type)
-            write_row(writer, 'Media change', prep_name, 'Volume (mL)', format_number(media.volume_ml))
-            write_row(writer, 'Media change', prep_name, 'Recorded at', media.created_at.isoformat())
-
-        if prep.harvest:
-            harvest = prep.harvest
-            write_row(writer, 'Harvest', prep_name, 'Harvest date', harvest.harvest_date.isoformat() if harvest.harvest_date else '')
-            write_row(writer, 'Harvest', prep_name, 'Volume (mL)', format_number(harvest.volume_ml))
-            write_row(writer, 'Harvest', prep_name, 'Recorded at', harvest.created_at.isoformat())
-
-        for run in sorted(prep.titer_runs, key=lambda item: item.created_at):
-            write_row(writer, 'Titer run', prep_name, 'Run created', run.created_at.isoformat())
-            write_row(writer, 'Titer run', prep_name, 'Cell line', run.cell_line)
-            write_row(writer, 'Titer run', prep_name, 'Cells seeded', format_number(run.cells_seeded))
-            write_row(writer, 'Titer run', prep_name, 'Vessel type', run.vessel_type)
-            write_row(writer, 'Titer run', prep_name, 'Selection reagent', run.selection_reagent)
-            write_row(writer, 'Titer run', prep_name, 'Selection concentration', run.selection_concentration)
-            write_row(writer, 'Titer run', prep_name, 'Polybrene (µg/mL)', format_number(run.polybrene_ug_ml))
-            write_row(writer, 'Titer run', prep_name, 'Measurement media (mL)', format_number(run.measurement_media_ml))
-            write_row(writer, 'Titer run', prep_name, 'Control cell concentration', format_number(run.control_cell_concentration))
-            valid_titers = [sample.titer_tu_ml for sample in run.samples if sample.titer_tu_ml is not None]
-            average_titer = (
-                round_titer_average(sum(valid_titers) / len(valid_titers)) if valid_titers else None
-            )
-            write_row(writer, 'Titer run', prep_name, 'Average titer (TU/mL)', format_number(average_titer))
-            for sample in run.samples:
-                selection_label = 'With selection' if sample.selection_used else 'No selection'
-                if sample.selection_used and run.selection_reagent:
-                    selection_label = f"{selection_label} ({run.selection_reagent})"
-                parts = [
-                    f"Virus volume: {format_number(sample.virus_volume_ul)} µL" if sample.virus_volume_ul is not None else None,
-                    selection_label,
-                    f"Measured %: {format_number(sample.measured_percent)}" if sample.measured_percent is not None else None,
-                    f"MOI: {format_number(sample.moi)}" if sample.moi is not None else None,
-                    f"Titer: {format_number(sample.titer_tu_ml)} TU/mL" if sample.titer_tu_ml is not None else None,
-                ]
-                value = '; '.join(part for part in parts if part)
-                if sample.cell_concentration is not None:
-                    value = f"{value}; Cell concentration: {format_number(sample.cell_concentration)}"
-                write_row(writer, 'Titer sample', prep_name, sample.label, value)
-
-    csv_content = output.getvalue()
-    filename_base = ''.join(char for char in experiment.name if char.isalnum() or char in (' ', '-', '_')).strip()
-    filename = filename_base.replace(' ', '_') or f'experiment_{experiment.id}'
-    response = Response(csv_content, mimetype='text/csv')
+    experiment = load_experiment_or_404(experiment_id, experiment_detail_options())
+    filename = experiment_csv_filename(experiment)
+    response = Response(stream_with_context(experiment_csv_lines(experiment)), mimetype='text/csv')
     response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
     return response
 
 
+@bp.route('/api/experiments/export', methods=['GET'])
+def bulk_export_csv() -> Response:
+    experiment_ids = [
+        parse_positive_int(value)
+        for value in ','.join(request.args.getlist('ids')).split(',')
+        if value.strip()
+    ]
+    if any(value is None for value in experiment_ids):
+        return jsonify({'error': 'ids must be a comma-separated list of experiment ids'}), 400
+    try:
+        query = bulk_export_query(request.args, experiment_ids)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    response = Response(stream_with_context(bulk_csv_lines(query)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename=lentivirus_experiments.csv'
+    return response
+
+
+@bp.route('/api/import', methods=['POST'])
+@query_budget(None)
+@serialized_write
+def import_endpoint():
+    fmt = (request.args.get('format') or '').lower()
+    if not fmt:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    text = request.get_data().decode('utf-8-sig')
+    if not text.strip():
+        return jsonify({'error': 'Request body is empty'}), 400
+    try:
+        records, errors = parse_import(text, fmt)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    batch_size = parse_positive_int(request.args.get('batch_size'), default=IMPORT_BATCH_SIZE)
+    dry_run = request.args.get('dry_run', '').lower() in {'1', 'true', 'yes'}
+    report = import_records(records, errors, batch_size=batch_size, dry_run=dry_run)
+    return jsonify(report)
+
+
 @bp.route('/api/experiments/<int:experiment_id>/preps', methods=['POST', 'GET'])
+@query_budget(GET=7, POST=13)
+@serialized_write
 def prep_endpoint(experiment_id: int):
     experiment = Experiment.query.get_or_404(experiment_id)
 
@@ -292,16 +406,15 @@ def prep_endpoint(experiment_id: int):
         if plate_count is None:
             return jsonify({'error': 'plate_count must be a positive integer'}), 400
 
-        capacity = experiment.vessels_seeded
-        if capacity:
-            used = total_plate_count(experiment)
-            remaining = capacity - used
-            if plate_count > remaining:
-                if remaining <= 0:
-                    message = 'All seeded plates are already allocated to preparations'
-                else:
-                    message = f'Only {remaining} plate(s) remain available for this experiment'
-                return jsonify({'error': message}), 400
+        try:
+            allocate_plates(db.session, experiment_id, plate_count)
+        except PlateAllocationError as exc:
+            db.session.rollback()
+            if exc.remaining <= 0:
+                message = 'All seeded plates are already allocated to preparations'
+            else:
+                message = f'Only {exc.remaining} plate(s) remain available for this experiment'
+            return jsonify({'error': message}), 400
 
         prep = LentivirusPrep(
             experiment_id=experiment_id,
@@ -315,11 +428,26 @@ def prep_endpoint(experiment_id: int):
         db.session.refresh(experiment)
         return jsonify({'prep': prep.to_dict(include_children=True)})
 
-    preps = LentivirusPrep.query.filter_by(experiment_id=experiment_id).all()
-    return jsonify({'preps': [prep.to_dict(include_children=True) for prep in preps]})
+    try:
+        projection = parse_projection(request.args, 'prep', PREP_INCLUDES)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    preps = (
+        LentivirusPrep.query.options(
+            *prep_detail_options(projection=projection),
+            *column_load_options('prep', projection, required=('experiment_id',)),
+        )
+        .filter_by(experiment_id=experiment_id)
+        .all()
+    )
+    return jsonify(
+        {'preps': [prep.to_dict(include_children=True, projection=projection) for prep in preps]}
+    )
 
 
 @bp.route('/api/preps/<int:prep_id>', methods=['PUT', 'DELETE'])
+@query_budget(PUT=20, DELETE=17)
+@serialized_write
 def update_prep(prep_id: int):
     prep = LentivirusPrep.query.get_or_404(prep_id)
 
@@ -343,17 +471,15 @@ def update_prep(prep_id: int):
         new_count = parse_positive_int(data.get('plate_count'))
         if new_count is None:
             return jsonify({'error': 'plate_count must be a positive integer'}), 400
-        experiment = prep.experiment
-        capacity = experiment.vessels_seeded if experiment else None
-        if capacity:
-            used = total_plate_count(experiment, exclude_prep_id=prep.id)
-            remaining = capacity - used
-            if new_count > remaining:
-                if remaining <= 0:
-                    message = 'All seeded plates are already allocated to other preparations'
-                else:
-                    message = f'Only {remaining} plate(s) remain available for this experiment'
-                return jsonify({'error': message}), 400
+        try:
+            allocate_plates(db.session, prep.experiment_id, new_count, prep_id=prep.id)
+        except PlateAllocationError as exc:
+            db.session.rollback()
+            if exc.remaining <= 0:
+                message = 'All seeded plates are already allocated to other preparations'
+            else:
+                message = f'Only {exc.remaining} plate(s) remain available for this experiment'
+            return jsonify({'error': message}), 400
         prep.plate_count = new_count
 
     db.session.commit()
@@ -379,6 +505,8 @@ def _compute_volume(mass_ug: float, concentration_ng_ul) -> float | None:
 
 
 @bp.route('/api/preps/<int:prep_id>/transfection', methods=['POST'])
+@query_budget(14)
+@serialized_write
 def transfection_endpoint(prep_id: int):
     prep = LentivirusPrep.query.get_or_404(prep_id)
     experiment = prep.experiment
@@ -387,7 +515,7 @@ def transfection_endpoint(prep_id: int):
 
     ratio_mode = data.get('ratio_mode', 'optimal')
     ratio = _parse_ratio(data.get('ratio'), ratio_mode)
-    scaling = calculate_transfection_scaling(vessel_type, ratio)
+    scaling = transfection_scaling(vessel_type, ratio)
 
     transfer_conc = data.get('transfer_concentration_ng_ul') or prep.transfer_concentration
     packaging_conc = data.get('packaging_concentration_ng_ul')
@@ -422,6 +550,8 @@ def transfection_endpoint(prep_id: int):
 
 
 @bp.route('/api/preps/<int:prep_id>/media-change', methods=['POST'])
+@query_budget(13)
+@serialized_write
 def media_change_endpoint(prep_id: int):
     prep = LentivirusPrep.query.get_or_404(prep_id)
     data = request.get_json(force=True)
@@ -443,6 +573,8 @@ def media_change_endpoint(prep_id: int):
 
 
 @bp.route('/api/preps/<int:prep_id>/harvest', methods=['POST'])
+@query_budget(9)
+@serialized_write
 def harvest_endpoint(prep_id: int):
     prep = LentivirusPrep.query.get_or_404(prep_id)
     data = request.get_json(force=True)
@@ -468,6 +600,8 @@ def harvest_endpoint(prep_id: int):
 
 
 @bp.route('/api/preps/<int:prep_id>/titer-runs', methods=['POST', 'GET'])
+@query_budget(GET=3, POST=13)
+@serialized_write
 def titer_runs_endpoint(prep_id: int):
     LentivirusPrep.query.get_or_404(prep_id)
 
@@ -493,27 +627,43 @@ def titer_runs_endpoint(prep_id: int):
         db.session.add(titer_run)
         db.session.flush()
 
-        for sample in data.get('samples', []):
-            sample_entry = TiterSample(
-                titer_run_id=titer_run.id,
-                label=sample['label'],
-                virus_volume_ul=sample['virus_volume_ul'],
-                selection_used=sample.get('selection_used', True),
-            )
-            db.session.add(sample_entry)
+        # One executemany; flushing TiterSample objects would issue an
+        # INSERT ... RETURNING per sample.
+        sample_rows = [
+            {
+                'titer_run_id': titer_run.id,
+                'label': sample['label'],
+                'virus_volume_ul': sample['virus_volume_ul'],
+                'selection_used': sample.get('selection_used', True),
+            }
+            for sample in data.get('samples', [])
+        ]
+        if sample_rows:
+            db.session.execute(insert(TiterSample), sample_rows)
 
         db.session.commit()
         return jsonify({'titer_run': titer_run.to_dict(include_samples=True)})
 
-    runs = TiterRun.query.filter_by(prep_id=prep_id).order_by(TiterRun.created_at.desc()).all()
-    return jsonify({'titer_runs': [run.to_dict(include_samples=True) for run in runs]})
-
+    try:
+        projection = parse_projection(request.args, 'titer_run', ('samples',))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    runs = (
+        TiterRun.query.options(
+            *titer_run_options(projection),
+            *column_load_options('titer_run', projection),
+        )
+        .filter_by(prep_id=prep_id)
+        .order_by(TiterRun.created_at.desc())
+        .all()
+    )
+    return jsonify(
+        {'titer_runs': [run.to_dict(include_samples=True, projection=projection) for run in runs]}
+    )
 
-@bp.route('/api/titer-runs/<int:run_id>/results', methods=['POST'])
-def titer_results_endpoint(run_id: int):
-    run = TiterRun.query.get_or_404(run_id)
-    data = request.get_json(force=True)
 
+def _prepare_titer_results(run: TiterRun, data: dict, samples_by_id: dict[int, TiterSample]) -> list[dict]:
+    """Apply one run's result payload and return per-sample survival fractions."""
     measurement_media_ml = parse_shorthand_number(data.get('measurement_media_ml'))
     control_concentration = parse_shorthand_number(data.get('control_cell_concentration'))
     if measurement_media_ml is not None:
@@ -522,14 +672,13 @@ def titer_results_endpoint(run_id: int):
         run.control_cell_concentration = control_concentration
 
     measurement_media = run.measurement_media_ml or 1.0
-    cells_at_transduction = run.cells_seeded
 
     pending_updates = []
     control_candidate = None
     for sample_payload in data.get('samples', []):
-        sample = TiterSample.query.filter_by(
-            id=sample_payload['id'], titer_run_id=run.id
-        ).first_or_404()
+        sample = samples_by_id.get(sample_payload['id'])
+        if sample is None or sample.titer_run_id != run.id:
+            abort(404)
         if 'selection_used' in sample_payload:
             sample.selection_used = bool(sample_payload['selection_used'])
         cell_concentration = parse_shorthand_number(sample_payload.get('cell_concentration'))
@@ -552,9 +701,7 @@ def titer_results_endpoint(run_id: int):
     if run.control_cell_concentration is not None:
         control_cells = run.control_cell_concentration * measurement_media
 
-    updated_samples = []
     for entry in pending_updates:
-        sample = entry['sample']
         measured_percent = None
         survival_fraction = None
         if entry['cell_concentration'] is not None and control_cells not in (None, 0):
@@ -567,45 +714,293 @@ def titer_results_endpoint(run_id: int):
             except (TypeError, ValueError):
                 measured_percent = None
             survival_fraction = measured_percent / 100 if measured_percent is not None else None
-        if measured_percent is None or survival_fraction is None:
+        entry['measured_percent'] = measured_percent
+        entry['survival_fraction'] = survival_fraction
+        entry['cells_at_transduction'] = run.cells_seeded
+    return pending_updates
+
+
+def _apply_titer_results(entries: list[dict]) -> None:
+    """Compute MOI and titer for every entry in one vectorized pass."""
+    computable = [entry for entry in entries if entry['survival_fraction'] is not None]
+    mois, titers = compute_titer_batch(
+        [entry['survival_fraction'] for entry in computable],
+        [entry['cells_at_transduction'] for entry in computable],
+        [entry['sample'].virus_volume_ul for entry in computable],
+    )
+    for entry, moi, titer in zip(computable, mois, titers):
+        sample = entry['sample']
+        sample.measured_percent = round(entry['measured_percent'], 2)
+        sample.moi = round(moi, 4) if math.isfinite(moi) else None
+        sample.titer_tu_ml = round(titer, 2) if math.isfinite(titer) else None
+    for entry in entries:
+        if entry['survival_fraction'] is None:
+            sample = entry['sample']
             sample.measured_percent = None
             sample.moi = None
             sample.titer_tu_ml = None
-            updated_samples.append(sample.to_dict())
-            continue
-        fraction_infected = max(0.0, min(1.0, 1 - survival_fraction))
-        moi = compute_moi(fraction_infected)
-        titer = compute_titer(cells_at_transduction, moi, sample.virus_volume_ul)
-        sample.measured_percent = round(measured_percent, 2)
-        sample.moi = round(moi, 4) if math.isfinite(moi) else None
-        sample.titer_tu_ml = round(titer, 2) if math.isfinite(titer) else None
-        updated_samples.append(sample.to_dict())
 
-    db.session.commit()
 
+def _titer_results_payload(run: TiterRun, entries: list[dict]) -> dict:
+    updated_samples = [entry['sample'].to_dict() for entry in entries]
     average_titer = None
     titers = [s['titer_tu_ml'] for s in updated_samples if s['titer_tu_ml'] is not None]
     if titers:
         average_titer = round_titer_average(sum(titers) / len(titers))
+    return {
+        'samples': updated_samples,
+        'average_titer': average_titer,
+        'control_cell_concentration': run.control_cell_concentration,
+        'measurement_media_ml': run.measurement_media_ml,
+    }
+
+
+def _load_samples(payloads: Iterable[dict]) -> dict[int, TiterSample]:
+    sample_ids = {sample['id'] for payload in payloads for sample in payload.get('samples', [])}
+    if not sample_ids:
+        return {}
+    return {sample.id: sample for sample in TiterSample.query.filter(TiterSample.id.in_(sample_ids))}
+
+
+@bp.route('/api/titer-runs/<int:run_id>/results', methods=['POST'])
+@query_budget(12)
+@serialized_write
+def titer_results_endpoint(run_id: int):
+    run = TiterRun.query.get_or_404(run_id)
+    data = request.get_json(force=True)
 
+    entries = _prepare_titer_results(run, data, _load_samples([data]))
+    _apply_titer_results(entries)
+    payload = _titer_results_payload(run, entries)
+    db.session.commit()
+    return jsonify(payload)
+
+
+@bp.route('/api/titer-runs/results', methods=['POST'])
+@query_budget(12)
+@serialized_write
+def titer_results_batch_endpoint():
+    """Record results for many titer runs in one request and one transaction."""
+    data = request.get_json(force=True)
+    run_payloads = data.get('runs') or []
+    if not isinstance(run_payloads, list) or not all(isinstance(item, dict) for item in run_payloads):
+        return jsonify({'error': 'runs must be a list of objects'}), 400
+    run_ids = [item.get('run_id') for item in run_payloads]
+    if any(not isinstance(run_id, int) for run_id in run_ids):
+        return jsonify({'error': 'Each run requires an integer run_id'}), 400
+    if len(set(run_ids)) != len(run_ids):
+        return jsonify({'error': 'Each run_id may only appear once'}), 400
+
+    runs = {run.id: run for run in TiterRun.query.filter(TiterRun.id.in_(run_ids))}
+    missing = [run_id for run_id in run_ids if run_id not in runs]
+    if missing:
+        return jsonify({'error': f'Titer run(s) not found: {missing}'}), 404
+
+    samples_by_id = _load_samples(run_payloads)
+    prepared = [
+        (runs[item['run_id']], _prepare_titer_results(runs[item['run_id']], item, samples_by_id))
+        for item in run_payloads
+    ]
+    _apply_titer_results([entry for _, entries in prepared for entry in entries])
+    results = [
+        {'run_id': run.id, **_titer_results_payload(run, entries)} for run, entries in prepared
+    ]
+    db.session.commit()
+    return jsonify({'runs': results})
+
+
+def _fit_bounds(args) -> tuple[float, float]:
+    min_fraction = parse_optional_float(args.get('min_fraction'))
+    max_fraction = parse_optional_float(args.get('max_fraction'))
+    min_fraction = TITER_FIT_MIN_FRACTION if min_fraction is None else min_fraction
+    max_fraction = TITER_FIT_MAX_FRACTION if max_fraction is None else max_fraction
+    if not 0 <= min_fraction < max_fraction <= 1:
+        raise ValueError('Expected 0 <= min_fraction < max_fraction <= 1')
+    return min_fraction, max_fraction
+
+
+def _fit_runs(run_ids: list[int] | None, min_fraction: float, max_fraction: float) -> dict:
+    points = titer_fit_points(run_ids)
+    return fit_poisson_titers(
+        [point[0] for point in points],
+        [point[1] for point in points],
+        [point[2] for point in points],
+        [point[3] for point in points],
+        min_fraction=min_fraction,
+        max_fraction=max_fraction,
+    )
+
+
+@bp.route('/api/titer-runs/<int:run_id>/fit', methods=['GET'])
+@query_budget(2)
+def titer_run_fit(run_id: int):
+    TiterRun.query.get_or_404(run_id)
+    try:
+        min_fraction, max_fraction = _fit_bounds(request.args)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    fit = _fit_runs([run_id], min_fraction, max_fraction).get(run_id)
+    if fit is None:
+        fit = {
+            'titer_tu_ml': None,
+            'ci_lower': None,
+            'ci_upper': None,
+            'points_used': 0,
+            'points_excluded': 0,
+        }
+    return jsonify(
+        {'run_id': run_id, 'min_fraction': min_fraction, 'max_fraction': max_fraction, 'fit': fit}
+    )
+
+
+@bp.route('/api/titer-runs/fits', methods=['GET'])
+@query_budget(1)
+def titer_run_fits():
+    """Refit every titer run (or ``run_ids``) in one vectorized pass."""
+    raw_ids = [value for value in ','.join(request.args.getlist('run_ids')).split(',') if value.strip()]
+    run_ids = [parse_positive_int(value) for value in raw_ids] or None
+    if run_ids is not None and any(value is None for value in run_ids):
+        return jsonify({'error': 'run_ids must be a comma-separated list of titer run ids'}), 400
+    try:
+        min_fraction, max_fraction = _fit_bounds(request.args)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    fits = _fit_runs(run_ids, min_fraction, max_fraction)
     return jsonify(
         {
-            'samples': updated_samples,
-            'average_titer': average_titer,
-            'control_cell_concentration': run.control_cell_concentration,
-            'measurement_media_ml': run.measurement_media_ml,
+            'min_fraction': min_fraction,
+            'max_fraction': max_fraction,
+            'fits': [{'run_id': run_id, **fit} for run_id, fit in fits.items()],
         }
     )
 
 
-@bp.route('/api/metrics/transfection', methods=['POST'])
-def metrics_transfection():
-    data = request.get_json(force=True)
+@bp.route('/api/analytics/titers', methods=['GET'])
+@query_budget(1)
+def titer_analytics_endpoint():
+    """Titer aggregates by plasmid, producer cell line and vessel over time."""
+    try:
+        return jsonify(titer_analytics(request.args))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+
+@bp.route('/api/charts/moi', methods=['GET'])
+@query_budget(3)
+def moi_chart_endpoint():
+    """MOI vs. percent-infected series across runs, downsampled and cached per query."""
+    try:
+        query = moi_chart_query(request.args)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    cache = chart_cache()
+    if cache is None:
+        return jsonify(moi_chart(query))
+    version = moi_chart_version(db.session)
+    body = cache.get(query, version)
+    if body is not None:
+        return Response(body, mimetype=current_app.json.mimetype)
+    response = current_app.json.response(moi_chart(query))
+    cache.put(query, version, response.get_data())
+    return response
+
+
+def _metrics_items(data) -> tuple[list, bool]:
+    """Normalize a metrics body to ``(items, batched)``.
+
+    A JSON list or ``{"items": [...]}`` is a batch; a single object keeps the
+    original one-result response shape.
+    """
+    if isinstance(data, list):
+        return data, True
+    if isinstance(data, dict) and 'items' in data:
+        items = data['items']
+        if not isinstance(items, list):
+            raise ValueError('items must be a list')
+        return items, True
+    return [data], False
+
+
+def _metrics_response(compute, data):
+    try:
+        items, batched = _metrics_items(data)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    results = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict) or not item.get('vessel_type'):
+                raise ValueError('vessel_type is required')
+            results.append(compute(item))
+        except (TypeError, ValueError) as exc:
+            error = {'error': str(exc)}
+            if batched:
+                error['index'] = index
+            return jsonify(error), 400
+    if batched:
+        return jsonify({'results': results})
+    return jsonify(results[0])
+
+
+@bp.route('/api/predict/titer', methods=['GET', 'POST'])
+@query_budget(GET=5, POST=3)
+def predict_titer():
+    """Expected titer for planned transfections, or for every prep of an experiment."""
+    model = current_app.extensions.get(MODEL_KEY)
+    if model is None:
+        return jsonify({'error': 'Titer prediction requires NumPy; pip install numpy'}), 503
+
+    if request.method == 'GET':
+        experiment_id = parse_positive_int(request.args.get('experiment_id'))
+        if experiment_id is None:
+            return jsonify({'error': 'experiment_id is required'}), 400
+        Experiment.query.get_or_404(experiment_id)
+        preps = experiment_prediction_inputs(db.session, experiment_id)
+        try:
+            model.refresh(db.session)
+            predictions = model.predict([inputs for _, _, inputs in preps])
+        except PredictionUnavailable as exc:
+            return jsonify({'error': str(exc)}), 503
+        return jsonify({
+            'experiment_id': experiment_id,
+            'predictions': [
+                {'prep_id': prep_id, 'transfer_name': transfer_name, **prediction}
+                for (prep_id, transfer_name, _), prediction in zip(preps, predictions)
+            ],
+            'model': model.summary(),
+        })
+
+    try:
+        items, batched = _metrics_items(request.get_json(force=True))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    inputs = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Each item must be an object')
+            inputs.append(prediction_inputs(item))
+        except (TypeError, ValueError) as exc:
+            error = {'error': str(exc)}
+            if batched:
+                error['index'] = index
+            return jsonify(error), 400
+    try:
+        model.refresh(db.session)
+        predictions = model.predict(inputs)
+    except PredictionUnavailable as exc:
+        return jsonify({'error': str(exc)}), 503
+    if batched:
+        return jsonify({'results': predictions, 'model': model.summary()})
+    return jsonify({**predictions[0], 'model': model.summary()})
+
+
+def _transfection_metrics(data: dict) -> dict:
     vessel_type = data['vessel_type']
     ratio_mode = data.get('ratio_mode', 'optimal')
     ratio = _parse_ratio(data.get('ratio'), ratio_mode)
 
-    scaling = calculate_transfection_scaling(vessel_type, ratio)
+    scaling = transfection_scaling(vessel_type, ratio)
     scaling['surface_area'] = SURFACE_AREAS[vessel_type]
     scaling['ratio'] = ratio
     scaling['transfer_volume_ul'] = _compute_volume(
@@ -618,19 +1013,42 @@ def metrics_transfection():
         scaling['envelope_mass_ug'], data.get('envelope_concentration_ng_ul')
     )
     scaling['ratio_display'] = f"{ratio[0]}:{ratio[1]}:{ratio[2]}"
-    return jsonify(scaling)
+    return scaling
+
+
+def _seeding_metrics(data: dict) -> dict:
+    volume = seeding_volume(data['vessel_type'], data.get('target_cells'))
+    return {'seeding_volume_ml': round(volume, 3)}
+
+
+@bp.route('/api/metrics/scaling-table', methods=['GET'])
+@query_budget(0)
+def metrics_scaling_table():
+    """Per-vessel scaling factors; immutable for the lifetime of the process."""
+    if SCALING_TABLE_ETAG in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(SCALING_TABLE_JSON, mimetype='application/json')
+    response.set_etag(SCALING_TABLE_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
+
+
+@bp.route('/api/metrics/transfection', methods=['POST'])
+@query_budget(0)
+def metrics_transfection():
+    return _metrics_response(_transfection_metrics, request.get_json(force=True))
 
 
 @bp.route('/api/metrics/seeding', methods=['POST'])
+@query_budget(0)
 def metrics_seeding():
-    data = request.get_json(force=True)
-    vessel_type = data['vessel_type']
-    target_cells = data.get('target_cells')
-    volume = calculate_seeding_volume(vessel_type, target_cells)
-    return jsonify({'seeding_volume_ml': round(volume, 3)})
+    return _metrics_response(_seeding_metrics, request.get_json(force=True))
 
 
 @bp.route('/api/metrics/moi', methods=['POST'])
+@query_budget(0)
 def metrics_moi():
     data = request.get_json(force=True)
     fraction_infected = data['fraction_infected']
@@ -639,6 +1057,7 @@ def metrics_moi():
 
 
 @bp.route('/api/metrics/titer', methods=['POST'])
+@query_budget(0)
 def metrics_titer():
     data = request.get_json(force=True)
     cells = data['cells']
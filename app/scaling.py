@@ -0,0 +1,97 @@
+"""Vessel scaling table precomputed from the constants at import time.
+
+Every per-vessel quantity that the transfection and seeding calculators derive
+from ``SURFACE_AREAS`` is computed once into a read-only table. The metrics
+endpoints then only apply the molar ratio split and the concentration
+division for each request. Results match :func:`calculate_transfection_scaling`
+and :func:`calculate_seeding_volume` exactly.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from types import MappingProxyType
+from typing import Mapping, Optional, Sequence
+
+from .constants import BASE_SEEDING, BASE_TRANSFECTION, DEFAULT_MOLAR_RATIO, SURFACE_AREAS
+from .utils import calculate_surface_ratio
+
+
+def _vessel_entry(vessel_type: str) -> Mapping[str, float]:
+    surface_ratio = calculate_surface_ratio(vessel_type)
+    return MappingProxyType(
+        {
+            'surface_area': SURFACE_AREAS[vessel_type],
+            'surface_ratio': surface_ratio,
+            'opti_mem_ml': BASE_TRANSFECTION['opti_mem_ml'] * surface_ratio,
+            'xtremegene_ul': BASE_TRANSFECTION['xtremegene_ul'] * surface_ratio,
+            'total_plasmid_ug': BASE_TRANSFECTION['total_plasmid_ug'] * surface_ratio,
+            'seeding_volume_ml': BASE_SEEDING['volume_ml'] * surface_ratio,
+        }
+    )
+
+
+VESSEL_SCALING: Mapping[str, Mapping[str, float]] = MappingProxyType(
+    {vessel_type: _vessel_entry(vessel_type) for vessel_type in SURFACE_AREAS}
+)
+
+
+def vessel_scaling(vessel_type: str) -> Mapping[str, float]:
+    entry = VESSEL_SCALING.get(vessel_type)
+    if entry is None:
+        raise ValueError('Unknown vessel type')
+    return entry
+
+
+def transfection_scaling(vessel_type: str, ratio: Optional[Sequence[float]] = None) -> dict:
+    """Table-backed equivalent of :func:`calculate_transfection_scaling`."""
+    entry = vessel_scaling(vessel_type)
+    if ratio is None:
+        ratio = DEFAULT_MOLAR_RATIO
+    if len(ratio) != 3:
+        raise ValueError('ratio must have three parts (transfer, packaging, envelope)')
+    transfer, packaging, envelope = ratio
+    total_ratio = sum(ratio)
+    if total_ratio <= 0:
+        raise ValueError('ratio parts must sum to a positive number')
+    total_plasmid = entry['total_plasmid_ug']
+    return {
+        'surface_ratio': entry['surface_ratio'],
+        'opti_mem_ml': round(entry['opti_mem_ml'], 3),
+        'xtremegene_ul': round(entry['xtremegene_ul'], 3),
+        'total_plasmid_ug': round(total_plasmid, 3),
+        'transfer_mass_ug': round(total_plasmid * (transfer / total_ratio), 3),
+        'packaging_mass_ug': round(total_plasmid * (packaging / total_ratio), 3),
+        'envelope_mass_ug': round(total_plasmid * (envelope / total_ratio), 3),
+    }
+
+
+def seeding_volume(vessel_type: str, target_cells: Optional[float]) -> float:
+    """Table-backed equivalent of :func:`calculate_seeding_volume`."""
+    entry = vessel_scaling(vessel_type)
+    if target_cells:
+        return target_cells / BASE_SEEDING['density']
+    return entry['seeding_volume_ml']
+
+
+def scaling_table_payload() -> dict:
+    """Serializable view of the table plus the default-ratio plasmid split."""
+    return {
+        'base_vessel': BASE_TRANSFECTION['vessel'],
+        'seeding_density': BASE_SEEDING['density'],
+        'default_ratio': list(DEFAULT_MOLAR_RATIO),
+        'vessels': [
+            {
+                'vessel_type': vessel_type,
+                'surface_area': entry['surface_area'],
+                'seeding_volume_ml': round(entry['seeding_volume_ml'], 3),
+                **transfection_scaling(vessel_type),
+            }
+            for vessel_type, entry in VESSEL_SCALING.items()
+        ],
+    }
+
+
+# Serialized once; the table only changes when the constants do.
+SCALING_TABLE_JSON = json.dumps(scaling_table_payload())
+SCALING_TABLE_ETAG = hashlib.sha1(SCALING_TABLE_JSON.encode()).hexdigest()
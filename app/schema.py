@@ -1,83 +1,87 @@
-"""Runtime schema patching for legacy SQLite databases."""
+"""Versioned schema migrations for SQLite databases.
+
+Each entry in :data:`MIGRATIONS` brings a database from one schema version to
+the next. The version reached is stored in ``PRAGMA user_version``, so a
+database that is already current costs a single pragma read at startup. Steps
+are idempotent: legacy files (version 0) that were patched by earlier builds
+simply re-check their columns and backfills once.
+"""
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Callable
 
 from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
 
+from .analytics import rebuild_titer_run_stats
 from .database import db
+from .rollups import rebuild_experiment_rollups
+from .search import create_search_index
+from .sync import SYNC_TABLES, create_sync_sequence
 
+AUTO_MIGRATE_ENV = 'LENTI_AUTO_MIGRATE'
 
-def ensure_sqlite_schema() -> None:
-    """Add any missing columns that newer builds require."""
-    engine = db.engine
-    if not engine.url.drivername.startswith('sqlite'):
-        return
-
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if 'experiments' not in table_names:
-        return
-
-    def add_missing_columns(table_name: str, required_columns: dict[str, str]) -> None:
-        if table_name not in table_names:
-            return
-        existing = {column['name'] for column in inspect(engine).get_columns(table_name)}
-        missing = {name: ddl for name, ddl in required_columns.items() if name not in existing}
-        if not missing:
-            return
-        with engine.begin() as connection:
-            for column_name, column_type in missing.items():
-                connection.execute(
-                    text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}')
-                )
-
-    experiment_required = {
-        'name': 'VARCHAR(128)',
-        'status': 'VARCHAR(32)',
-        'finished_at': 'DATETIME',
-        'passage_number': 'VARCHAR(64)',
-        'cell_concentration': 'FLOAT',
-        'cells_to_seed': 'FLOAT',
-        'vessel_type': 'VARCHAR(64)',
-        'media_type': 'VARCHAR(128)',
-        'vessels_seeded': 'INTEGER',
-        'seeding_date': 'DATE',
-        'seeding_volume_ml': 'FLOAT',
-        'created_at': 'DATETIME',
-        'updated_at': 'DATETIME',
-    }
-    add_missing_columns('experiments', experiment_required)
-
-    with engine.begin() as connection:
-        connection.execute(
-            text("UPDATE experiments SET media_type = 'DMEM + 10% FBS' WHERE media_type IS NULL")
-        )
-        connection.execute(
-            text("UPDATE experiments SET name = COALESCE(name, 'Untitled Experiment')")
-        )
-        connection.execute(
-            text("UPDATE experiments SET status = COALESCE(status, 'active')")
-        )
-        connection.execute(
-            text('UPDATE experiments SET vessels_seeded = 1 WHERE vessels_seeded IS NULL')
-        )
-        today = datetime.utcnow().date().isoformat()
-        connection.execute(
-            text('UPDATE experiments SET seeding_date = COALESCE(seeding_date, :today)'),
-            {'today': today},
-        )
-        now = datetime.utcnow().isoformat()
-        connection.execute(
-            text(
-                "UPDATE experiments "
-                "SET created_at = COALESCE(created_at, :now), "
-                "updated_at = COALESCE(updated_at, :now)"
-            ),
-            {'now': now},
-        )
 
+def add_missing_columns(connection: Connection, table_name: str, required_columns: dict[str, str]) -> set[str]:
+    inspector = inspect(connection)
+    if not inspector.has_table(table_name):
+        return set()
+    existing = {column['name'] for column in inspector.get_columns(table_name)}
+    missing = {name: ddl for name, ddl in required_columns.items() if name not in existing}
+    for column_name, column_type in missing.items():
+        connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+    return set(missing)
+
+
+def _experiment_columns(connection: Connection) -> None:
     add_missing_columns(
+        connection,
+        'experiments',
+        {
+            'name': 'VARCHAR(128)',
+            'status': 'VARCHAR(32)',
+            'finished_at': 'DATETIME',
+            'passage_number': 'VARCHAR(64)',
+            'cell_concentration': 'FLOAT',
+            'cells_to_seed': 'FLOAT',
+            'vessel_type': 'VARCHAR(64)',
+            'media_type': 'VARCHAR(128)',
+            'vessels_seeded': 'INTEGER',
+            'seeding_date': 'DATE',
+            'seeding_volume_ml': 'FLOAT',
+            'created_at': 'DATETIME',
+            'updated_at': 'DATETIME',
+        },
+    )
+    connection.execute(
+        text("UPDATE experiments SET media_type = 'DMEM + 10% FBS' WHERE media_type IS NULL")
+    )
+    connection.execute(
+        text("UPDATE experiments SET name = 'Untitled Experiment' WHERE name IS NULL")
+    )
+    connection.execute(text("UPDATE experiments SET status = 'active' WHERE status IS NULL"))
+    connection.execute(
+        text('UPDATE experiments SET vessels_seeded = 1 WHERE vessels_seeded IS NULL')
+    )
+    connection.execute(
+        text('UPDATE experiments SET seeding_date = :today WHERE seeding_date IS NULL'),
+        {'today': datetime.utcnow().date().isoformat()},
+    )
+    connection.execute(
+        text(
+            'UPDATE experiments '
+            'SET created_at = COALESCE(created_at, :now), '
+            'updated_at = COALESCE(updated_at, :now) '
+            'WHERE created_at IS NULL OR updated_at IS NULL'
+        ),
+        {'now': datetime.utcnow().isoformat()},
+    )
+
+
+def _transfection_columns(connection: Connection) -> None:
+    add_missing_columns(
+        connection,
         'transfections',
         {
             'transfer_volume_ul': 'FLOAT',
@@ -90,18 +94,17 @@ def ensure_sqlite_schema() -> None:
         },
     )
 
-    add_missing_columns(
-        'lentivirus_preps',
-        {
-            'plate_count': 'INTEGER',
-        },
+
+def _prep_plate_count(connection: Connection) -> None:
+    add_missing_columns(connection, 'lentivirus_preps', {'plate_count': 'INTEGER'})
+    connection.execute(
+        text('UPDATE lentivirus_preps SET plate_count = 1 WHERE plate_count IS NULL')
     )
-    with engine.begin() as connection:
-        connection.execute(
-            text('UPDATE lentivirus_preps SET plate_count = 1 WHERE plate_count IS NULL')
-        )
 
+
+def _titer_columns(connection: Connection) -> None:
     add_missing_columns(
+        connection,
         'titer_runs',
         {
             'polybrene_ug_ml': 'FLOAT',
@@ -109,10 +112,124 @@ def ensure_sqlite_schema() -> None:
             'control_cell_concentration': 'FLOAT',
         },
     )
+    add_missing_columns(connection, 'titer_samples', {'cell_concentration': 'FLOAT'})
+
 
+def _experiment_rollups(connection: Connection) -> None:
     add_missing_columns(
-        'titer_samples',
+        connection,
+        'experiments',
         {
-            'cell_concentration': 'FLOAT',
+            'prep_count': 'INTEGER NOT NULL DEFAULT 0',
+            'completed_preps': 'INTEGER NOT NULL DEFAULT 0',
+            'plates_allocated': 'INTEGER NOT NULL DEFAULT 0',
+            'titer_summaries_json': "TEXT NOT NULL DEFAULT '[]'",
         },
     )
+    rebuild_experiment_rollups(connection)
+
+
+def _titer_run_stats_revision(connection: Connection) -> None:
+    add_missing_columns(connection, 'titer_run_stats', {'revision': 'INTEGER NOT NULL DEFAULT 0'})
+    ensure_indexes(connection)
+    rebuild_titer_run_stats(connection)
+
+
+def _sync_sequence(connection: Connection) -> None:
+    for table in SYNC_TABLES:
+        add_missing_columns(connection, table, {'change_seq': 'INTEGER NOT NULL DEFAULT 0'})
+    ensure_indexes(connection)
+    create_sync_sequence(connection)
+
+
+def ensure_indexes(connection: Connection) -> None:
+    """Create model-declared indexes missing from an existing database file.
+
+    Indexes on columns a later step has yet to add are skipped; that step
+    creates them once the column exists.
+    """
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if all(column.name in existing for column in index.columns):
+                index.create(bind=connection, checkfirst=True)
+
+
+# Append new steps; never reorder or edit ones that have shipped.
+MIGRATIONS: list[tuple[str, Callable[[Connection], None]]] = [
+    ('experiment columns and defaults', _experiment_columns),
+    ('transfection volume columns', _transfection_columns),
+    ('prep plate counts', _prep_plate_count),
+    ('titer run and sample columns', _titer_columns),
+    ('experiment summary rollups', _experiment_rollups),
+    ('list and sync indexes', ensure_indexes),
+    ('foreign key indexes', ensure_indexes),
+    ('full-text search index', create_search_index),
+    ('titer analytics rollups', rebuild_titer_run_stats),
+    ('titer run stats revisions', _titer_run_stats_revision),
+    ('sync change sequence', _sync_sequence),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(connection: Connection) -> int:
+    return connection.exec_driver_sql('PRAGMA user_version').scalar() or 0
+
+
+def _set_schema_version(connection: Connection, version: int) -> None:
+    connection.exec_driver_sql(f'PRAGMA user_version = {int(version)}')
+
+
+def pending_migrations() -> list[tuple[int, str]]:
+    """``(version, description)`` of the steps not yet applied to the database."""
+    if not db.engine.url.drivername.startswith('sqlite'):
+        return []
+    with db.engine.connect() as connection:
+        current = schema_version(connection)
+    return [
+        (version, description)
+        for version, (description, _) in enumerate(MIGRATIONS, start=1)
+        if version > current
+    ]
+
+
+def migrate_schema() -> list[tuple[int, str]]:
+    """Create missing tables and apply pending migrations; returns steps applied.
+
+    A brand-new database gets the full schema from the models, plus the
+    search index and sync triggers the models do not declare, and is stamped
+    with :data:`SCHEMA_VERSION` without replaying any steps.
+    """
+    engine = db.engine
+    if not engine.url.drivername.startswith('sqlite'):
+        db.create_all()
+        return []
+
+    with engine.connect() as connection:
+        current = schema_version(connection)
+        if current >= SCHEMA_VERSION:
+            return []
+        is_new = not inspect(connection).has_table('experiments')
+
+    db.create_all()
+    if is_new:
+        with engine.begin() as connection:
+            create_search_index(connection)
+            create_sync_sequence(connection)
+            _set_schema_version(connection, SCHEMA_VERSION)
+        return []
+
+    applied = []
+    for version, (description, step) in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        # Steps are idempotent, so one interrupted before its version bump
+        # is simply replayed on the next run.
+        with engine.begin() as connection:
+            step(connection)
+            _set_schema_version(connection, version)
+        applied.append((version, description))
+    return applied
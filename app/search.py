@@ -0,0 +1,210 @@
+"""Full-text search over experiments, preps and titer runs.
+
+``search_index`` is an SQLite FTS5 table with one row per searchable record:
+an experiment's ``name`` (title) with its ``cell_line`` and ``media_type``
+(body), a prep's ``transfer_name``, and a titer run's ``selection_reagent``
+with its ``notes``. The rowid encodes the record as ``id * 4 + kind``.
+Triggers on the source tables can therefore replace or drop a record's row by
+rowid. Because these are triggers and not ORM events, bulk imports,
+``executemany`` inserts and cascaded deletes stay in sync too.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+from typing import Iterable, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+
+from .database import db
+from .models import LentivirusPrep, TiterRun
+from .utils import parse_positive_int
+
+SEARCH_TABLE = 'search_index'
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX = 100
+# Title matches weigh ten times as much as body matches in the bm25 rank.
+TITLE_WEIGHT = 10.0
+
+_KIND_STRIDE = 4
+# kind -> (hit type, source table, title columns, body columns)
+SEARCH_SOURCES = {
+    1: ('experiment', 'experiments', ('name',), ('cell_line', 'media_type')),
+    2: ('prep', 'lentivirus_preps', ('transfer_name',), ()),
+    3: ('titer_run', 'titer_runs', ('selection_reagent',), ('notes',)),
+}
+SEARCH_TYPES = {hit_type: kind for kind, (hit_type, _, _, _) in SEARCH_SOURCES.items()}
+
+_runs = TiterRun.__table__
+_preps = LentivirusPrep.__table__
+
+
+def _text_expression(row: str, columns: tuple[str, ...]) -> str:
+    if not columns:
+        return "''"
+    return " || ' ' || ".join(f"coalesce({row}.{column}, '')" for column in columns)
+
+
+def _index_row(kind: int, row: str) -> str:
+    _, _, title_columns, body_columns = SEARCH_SOURCES[kind]
+    return (
+        f'INSERT INTO {SEARCH_TABLE} (rowid, title, body) VALUES ('
+        f'{row}.id * {_KIND_STRIDE} + {kind}, '
+        f'{_text_expression(row, title_columns)}, {_text_expression(row, body_columns)})'
+    )
+
+
+def _trigger_statements() -> Iterable[str]:
+    for kind, (_, table, title_columns, body_columns) in SEARCH_SOURCES.items():
+        drop = f'DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * {_KIND_STRIDE} + {kind}'
+        columns = ', '.join(title_columns + body_columns)
+        yield (
+            f'CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} '
+            f'BEGIN {_index_row(kind, "new")}; END'
+        )
+        yield (
+            f'CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {columns} ON {table} '
+            f'BEGIN {drop}; {_index_row(kind, "new")}; END'
+        )
+        yield (
+            f'CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} '
+            f'BEGIN {drop}; END'
+        )
+
+
+def rebuild_search_index(connection: Connection) -> int:
+    """Repopulate ``search_index`` from the source tables; returns rows indexed."""
+    connection.exec_driver_sql(f'DELETE FROM {SEARCH_TABLE}')
+    indexed = 0
+    for kind, (_, table, title_columns, body_columns) in SEARCH_SOURCES.items():
+        indexed += connection.exec_driver_sql(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, body) '
+            f'SELECT id * {_KIND_STRIDE} + {kind}, {_text_expression(table, title_columns)}, '
+            f'{_text_expression(table, body_columns)} FROM {table}'
+        ).rowcount
+    connection.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def create_search_index(connection: Connection) -> None:
+    """Create the FTS5 table and its sync triggers, then index existing rows."""
+    connection.exec_driver_sql(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+        "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    connection.exec_driver_sql(
+        f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25({TITLE_WEIGHT}, 1.0)')"
+    )
+    for statement in _trigger_statements():
+        connection.exec_driver_sql(statement)
+    rebuild_search_index(connection)
+
+
+def match_expression(query: str) -> str:
+    """Turn user input into an FTS5 query: every word must match, as a prefix.
+
+    Each word is quoted, so ``pLKO-shX`` is the phrase ``plko shx*`` rather
+    than FTS5 syntax. Raises ``ValueError`` when nothing searchable remains.
+    """
+    words = [word for word in query.split() if any(char.isalnum() for char in word)]
+    if not words:
+        raise ValueError('q must contain at least one letter or digit')
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def encode_search_cursor(rank: float, rowid: int) -> str:
+    raw = f'{rank!r}|{rowid}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(token: str) -> tuple[float, int]:
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        rank_raw, rowid_raw = base64.urlsafe_b64decode(padded).decode().split('|', 1)
+        return float(rank_raw), int(rowid_raw)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def _parents(kind_ids: dict[int, list[int]]) -> dict[int, tuple[Optional[int], Optional[int]]]:
+    """``rowid -> (experiment_id, prep_id)`` for the preps and runs on a page."""
+    parents = {}
+    prep_ids = kind_ids.get(SEARCH_TYPES['prep'])
+    if prep_ids:
+        rows = db.session.execute(
+            select(_preps.c.id, _preps.c.experiment_id).where(_preps.c.id.in_(prep_ids))
+        )
+        for prep_id, experiment_id in rows:
+            parents[prep_id * _KIND_STRIDE + SEARCH_TYPES['prep']] = (experiment_id, prep_id)
+    run_ids = kind_ids.get(SEARCH_TYPES['titer_run'])
+    if run_ids:
+        rows = db.session.execute(
+            select(_runs.c.id, _preps.c.experiment_id, _runs.c.prep_id)
+            .join(_preps, _preps.c.id == _runs.c.prep_id)
+            .where(_runs.c.id.in_(run_ids))
+        )
+        for run_id, experiment_id, prep_id in rows:
+            parents[run_id * _KIND_STRIDE + SEARCH_TYPES['titer_run']] = (experiment_id, prep_id)
+    return parents
+
+
+def search_records(args) -> tuple[list[dict], Optional[str]]:
+    """One page of hits for ``q``, best first, as ``(hits, next_cursor)``.
+
+    ``type`` limits the hit types (``experiment``, ``prep``, ``titer_run``).
+    Raises ``ValueError`` for a missing query, unknown type or bad cursor.
+    """
+    expression = match_expression(args.get('q', ''))
+    limit = min(parse_positive_int(args.get('limit'), default=SEARCH_PAGE_SIZE), SEARCH_PAGE_MAX)
+    conditions = [f'{SEARCH_TABLE} MATCH :expression']
+    params = {'expression': expression, 'limit': limit + 1}
+
+    types = [value.strip() for value in args.get('type', '').split(',') if value.strip()]
+    if types:
+        unknown = set(types) - set(SEARCH_TYPES)
+        if unknown:
+            raise ValueError(f'type accepts {", ".join(SEARCH_TYPES)}; got {", ".join(sorted(unknown))}')
+        kinds = ', '.join(str(SEARCH_TYPES[value]) for value in sorted(set(types)))
+        conditions.append(f'rowid % {_KIND_STRIDE} IN ({kinds})')
+
+    cursor = args.get('cursor')
+    if cursor:
+        params['rank'], params['rowid'] = decode_search_cursor(cursor)
+        conditions.append('(rank > :rank OR (rank = :rank AND rowid > :rowid))')
+
+    rows = db.session.execute(
+        text(
+            f'SELECT rowid, rank, title, body FROM {SEARCH_TABLE} '
+            f'WHERE {" AND ".join(conditions)} ORDER BY rank, rowid LIMIT :limit'
+        ),
+        params,
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(rows[-1].rank, rows[-1].rowid)
+
+    kind_ids: dict[int, list[int]] = {}
+    for row in rows:
+        kind_ids.setdefault(row.rowid % _KIND_STRIDE, []).append(row.rowid // _KIND_STRIDE)
+    parents = _parents(kind_ids)
+
+    hits = []
+    for row in rows:
+        record_id, kind = divmod(row.rowid, _KIND_STRIDE)
+        hit_type = SEARCH_SOURCES[kind][0]
+        if hit_type == 'experiment':
+            experiment_id, prep_id = record_id, None
+        else:
+            experiment_id, prep_id = parents.get(row.rowid, (None, None))
+        hits.append({
+            'type': hit_type,
+            'id': record_id,
+            'experiment_id': experiment_id,
+            'prep_id': prep_id,
+            'title': row.title,
+            'body': row.body,
+            'score': round(-row.rank, 4),
+        })
+    return hits, next_cursor
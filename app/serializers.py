@@ -0,0 +1,161 @@
+"""Column-driven model serializers and the pluggable JSON response backend.
+
+:class:`SerializerMixin` builds each model's serializer once, on first use,
+from ``__table__.columns``. The key list and the date/datetime columns needing
+``isoformat`` are worked out ahead of time, so ``to_dict`` no longer walks
+hand-written field lists.
+
+:func:`init_json_backend` can swap Flask's JSON provider for one backed by
+``orjson``. Bodies stay key-sorted and compact like the stdlib provider's,
+but they are not byte-identical. Non-ASCII text is written as UTF-8 rather
+than ``\\u`` escapes, and non-finite floats become ``null``. The stdlib
+encoder therefore stays the default, and ``orjson`` is opt-in.
+:mod:`app.parity` checks both backends.
+"""
+from __future__ import annotations
+
+import os
+from typing import Callable, Iterable, Mapping, Optional
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import Date, DateTime
+
+try:  # orjson is optional; the stdlib encoder is used without it.
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+JSON_BACKEND_ENV = 'LENTI_JSON_BACKEND'
+JSON_BACKENDS = ('stdlib', 'orjson', 'auto')
+DEFAULT_JSON_BACKEND = 'stdlib'
+
+
+def column_serializer(columns, keys: Iterable[str]) -> Callable[[object], dict]:
+    """Return a function mapping an instance to ``{key: JSON value}`` for ``keys``."""
+    keys = tuple(keys)
+    temporal_keys = tuple(
+        column.key
+        for column in columns
+        if column.key in keys and isinstance(column.type, (Date, DateTime))
+    )
+
+    def serialize(instance) -> dict:
+        # Loaded column values live in the instance ``__dict__``; expired or
+        # deferred ones go through the attribute so they are refreshed.
+        state = instance.__dict__
+        data = {key: state[key] if key in state else getattr(instance, key) for key in keys}
+        for key in temporal_keys:
+            value = data[key]
+            if value is not None:
+                data[key] = value.isoformat()
+        return data
+
+    return serialize
+
+
+class SerializerMixin:
+    """Adds :meth:`column_dict`, generated from the model's table columns.
+
+    Subclasses list columns to leave out of their payload in
+    ``__serializer_exclude__``; columns declared with
+    ``info={'serialize': False}`` are left out of every model's payload.
+    """
+
+    __serializer_exclude__: frozenset = frozenset()
+
+    @classmethod
+    def serialized_columns(cls) -> tuple[str, ...]:
+        return tuple(
+            column.key
+            for column in cls.__table__.columns
+            if column.key not in cls.__serializer_exclude__ and column.info.get('serialize', True)
+        )
+
+    @classmethod
+    def column_serializer(cls, fields: Optional[frozenset] = None) -> Callable[[object], dict]:
+        """Serializer for every payload column, or only those in ``fields``."""
+        serializers = cls.__dict__.get('_column_serializers')
+        if serializers is None:
+            serializers = cls._column_serializers = {}
+        serializer = serializers.get(fields)
+        if serializer is None:
+            keys = cls.serialized_columns()
+            if fields is not None:
+                keys = tuple(key for key in keys if key in fields)
+            serializer = serializers[fields] = column_serializer(cls.__table__.columns, keys)
+        return serializer
+
+    def column_dict(self, fields: Optional[frozenset] = None) -> dict:
+        return type(self).column_serializer(fields)(self)
+
+
+class Projection:
+    """Requested fields per resource type and the child collections to inline.
+
+    ``fields`` maps a resource type to the keys to emit; missing types emit
+    everything. ``includes`` of ``None`` inlines every child the endpoint
+    normally returns.
+    """
+
+    def __init__(self, fields: Optional[dict] = None, includes: Optional[frozenset] = None) -> None:
+        self.fields = fields or {}
+        self.includes = includes
+
+    def fields_for(self, resource_type: str) -> Optional[frozenset]:
+        return self.fields.get(resource_type)
+
+    def wants(self, resource_type: str, field: str) -> bool:
+        fields = self.fields.get(resource_type)
+        return fields is None or field in fields
+
+    def include(self, child: str) -> bool:
+        return self.includes is None or child in self.includes
+
+
+FULL_PROJECTION = Projection()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes response bodies with ``orjson``."""
+
+    options = (
+        orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson is not None
+        else 0
+    )
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(obj)
+        try:
+            body = orjson.dumps(obj, default=self.default, option=self.options)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().response(obj)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def json_backend(environ: Optional[Mapping[str, str]] = None) -> str:
+    """Resolve ``LENTI_JSON_BACKEND`` to the backend that will actually be used."""
+    environ = os.environ if environ is None else environ
+    choice = (environ.get(JSON_BACKEND_ENV) or DEFAULT_JSON_BACKEND).strip().lower()
+    if choice not in JSON_BACKENDS:
+        raise ValueError(f'{JSON_BACKEND_ENV} must be one of: {", ".join(JSON_BACKENDS)}')
+    if choice == 'orjson' and orjson is None:
+        raise ValueError(f'{JSON_BACKEND_ENV}=orjson requires the orjson package')
+    if choice == 'auto':
+        return 'orjson' if orjson is not None else 'stdlib'
+    return choice
+
+
+def json_provider(app, backend: str) -> DefaultJSONProvider:
+    """A JSON provider for ``backend`` as resolved by :func:`json_backend`."""
+    if backend == 'orjson':
+        return OrjsonProvider(app)
+    return DefaultJSONProvider(app)
+
+
+def init_json_backend(app, backend: str) -> None:
+    if backend == 'orjson':
+        app.json = json_provider(app, backend)
@@ -1,5 +1,7 @@
 const api = {
     experiments: '/api/experiments',
+    changes: (token) => (token ? `/api/changes?since=${encodeURIComponent(token)}` : '/api/changes'),
+    experimentsPage: (cursor) => (cursor ? `/api/experiments?cursor=${encodeURIComponent(cursor)}` : '/api/experiments'),
     experimentDetail: (id) => `/api/experiments/${id}`,
     experimentExport: (id) => `/api/experiments/${id}/export`,
     experimentPreps: (id) => `/api/experiments/${id}/preps`,
@@ -11,6 +13,7 @@ const api = {
     harvest: (prepId) => `/api/preps/${prepId}/harvest`,
     titerRuns: (prepId) => `/api/preps/${prepId}/titer-runs`,
     titerResults: (runId) => `/api/titer-runs/${runId}/results`,
+    moiChart: (params = {}) => `/api/charts/moi?${new URLSearchParams(params)}`,
     metrics: {
         seeding: '/api/metrics/seeding',
 
@@ -60,9 +63,13 @@ const state = {
     titerSaveScope: 'all',
     titerSaveTarget: null,
     titerPlanCopy: '',
-    currentRunId: null
+    currentRunId: null,
+    experimentsCursor: null,
+    syncToken: null
 };
 
+const CHANGE_SYNC_INTERVAL_MS = 15000;
+
 function parseNumericInput(value) {
     if (value === undefined || value === null) return null;
     const text = value.toString().trim().replace(/,/g, '');
@@ -236,9 +243,147 @@ function showWorkflow() {
 }
 
 async function loadExperiments() {
-    const data = await fetchJSON(api.experiments);
+    const data = await fetchJSON(api.experimentsPage(null));
     experiments = data.experiments;
+    state.experiments = experiments;
+    state.experimentsCursor = data.next_cursor || null;
+    renderExperimentRecords();
+}
+
+async function loadMoreExperiments() {
+    if (!state.experimentsCursor) return;
+    const data = await fetchJSON(api.experimentsPage(state.experimentsCursor));
+    const known = new Set(experiments.map((exp) => exp.id));
+    experiments = experiments.concat(data.experiments.filter((exp) => !known.has(exp.id)));
+    state.experiments = experiments;
+    state.experimentsCursor = data.next_cursor || null;
+    renderExperimentRecords();
+}
+
+async function startChangeSync() {
+    const data = await fetchJSON(api.changes(null));
+    state.syncToken = data.next_token;
+}
+
+async function syncChanges() {
+    if (!state.syncToken) return;
+    let data;
+    try {
+        data = await fetchJSON(api.changes(state.syncToken));
+    } catch (error) {
+        return;
+    }
+    state.syncToken = data.next_token;
+    mergeExperimentListChanges(data);
+    renderExperimentRecords();
+    if (mergeActiveExperimentChanges(data)) {
+        state.selectedPreps = new Set([...state.selectedPreps].filter((id) => state.activeExperiment.preps.some((prep) => prep.id === id)));
+        state.currentRunId = ensureCurrentRunSelection();
+        syncDraftsForSelection();
+        renderWorkflow();
+    }
+}
+
+function deletedIds(data, type) {
+    return new Set(data.deleted.filter((entry) => entry.type === type).map((entry) => entry.id));
+}
+
+function mergeExperimentListChanges(data) {
+    const removed = deletedIds(data, 'experiment');
+    const byId = new Map(experiments.map((exp) => [exp.id, exp]));
+    const added = [];
+    data.experiments.forEach((exp) => {
+        if (byId.has(exp.id)) {
+            Object.assign(byId.get(exp.id), exp);
+        } else {
+            added.push(exp);
+        }
+    });
+    experiments = experiments
+        .concat(added)
+        .filter((exp) => !removed.has(exp.id))
+        .sort((a, b) => (b.created_at || '').localeCompare(a.created_at || '') || b.id - a.id);
+    state.experiments = experiments;
+}
+
+function mergeActiveExperimentChanges(data) {
+    const active = state.activeExperiment;
+    if (!active) return false;
+    if (deletedIds(data, 'experiment').has(active.id)) {
+        showDashboard();
+        return false;
+    }
+
+    let touched = false;
+    const changedExperiment = data.experiments.find((exp) => exp.id === active.id);
+    if (changedExperiment) {
+        Object.assign(active, changedExperiment);
+        touched = true;
+    }
+
+    const removedPreps = deletedIds(data, 'prep');
+    if (active.preps.some((prep) => removedPreps.has(prep.id))) {
+        active.preps = active.preps.filter((prep) => !removedPreps.has(prep.id));
+        touched = true;
+    }
+    const prepsById = new Map(active.preps.map((prep) => [prep.id, prep]));
+    data.preps
+        .filter((prep) => prep.experiment_id === active.id)
+        .forEach((prep) => {
+            if (prepsById.has(prep.id)) {
+                Object.assign(prepsById.get(prep.id), prep);
+            } else {
+                const created = { ...prep, transfection: null, media_change: null, harvest: null, titer_runs: [] };
+                active.preps.push(created);
+                prepsById.set(prep.id, created);
+            }
+            touched = true;
+        });
+
+    [['transfections', 'transfection'], ['media_changes', 'media_change'], ['harvests', 'harvest']].forEach(([key, field]) => {
+        data[key].forEach((stage) => {
+            const prep = prepsById.get(stage.prep_id);
+            if (prep) {
+                prep[field] = stage;
+                touched = true;
+            }
+        });
+    });
+
+    const removedRuns = deletedIds(data, 'titer_run');
+    active.preps.forEach((prep) => {
+        const runs = prep.titer_runs || [];
+        if (runs.some((run) => removedRuns.has(run.id))) {
+            prep.titer_runs = runs.filter((run) => !removedRuns.has(run.id));
+            touched = true;
+        }
+    });
+    data.titer_runs.forEach((run) => {
+        const prep = prepsById.get(run.prep_id);
+        if (!prep) return;
+        const runs = prep.titer_runs || [];
+        const index = runs.findIndex((entry) => entry.id === run.id);
+        if (index >= 0) {
+            runs[index] = run;
+        } else {
+            runs.push(run);
+        }
+        prep.titer_runs = runs;
+        touched = true;
+    });
+    return touched;
+}
+
+function renderExperimentRecords() {
+    const loadMoreButton = document.getElementById('loadMoreExperiments');
+    if (loadMoreButton) {
+        loadMoreButton.hidden = !state.experimentsCursor;
+    }
+    if (document.getElementById('activeExperiments')) {
+        renderDashboard();
+    }
     const tbody = document.querySelector('#experimentsTable tbody');
+    if (!tbody) return;
     tbody.innerHTML = '';
     experiments.forEach(exp => {
         const tr = document.createElement('tr');
@@ -1274,11 +1419,11 @@ function parseRatioInput(value) {
     return parts;
 }
 
-async function updateTransfectionMetrics(prepId) {
+function transfectionMetricsRequest(prepId) {
     const draft = state.transfectionDraft.get(prepId);
-    if (!draft) return;
+    if (!draft) return null;
     const prep = getPrepById(prepId);
-    if (!prep) return;
+    if (!prep) return null;
     let ratioMode = 'optimal';
     let ratioValues = null;
     if (draft.ratioMode !== '4:3:1') {
@@ -1286,28 +1431,49 @@ async function updateTransfectionMetrics(prepId) {
         const parsed = parseRatioInput(draft.ratioMode);
         if (!parsed) {
             draft.metrics = null;
-            return;
+            return null;
         }
         ratioValues = parsed;
     }
+    return {
+        vessel_type: prep.vessel_type,
+        ratio_mode: ratioMode,
+        ratio: ratioValues || [4, 3, 1],
+        transfer_concentration_ng_ul: draft.transferConcentration || prep.transfer_concentration || null,
+        packaging_concentration_ng_ul: draft.packagingConcentration || null,
+        envelope_concentration_ng_ul: draft.envelopeConcentration || null
+    };
+}
+
+async function updateTransfectionMetricsBatch(prepIds) {
+    const ids = [];
+    const items = [];
+    prepIds.forEach((prepId) => {
+        const item = transfectionMetricsRequest(prepId);
+        if (!item) return;
+        ids.push(prepId);
+        items.push(item);
+    });
+    if (!items.length) return;
     try {
         const response = await fetchJSON(api.metrics.transfection, {
             method: 'POST',
-            body: JSON.stringify({
-                vessel_type: prep.vessel_type,
-                ratio_mode: ratioMode,
-                ratio: ratioValues || [4, 3, 1],
-                transfer_concentration_ng_ul: draft.transferConcentration || prep.transfer_concentration || null,
-                packaging_concentration_ng_ul: draft.packagingConcentration || null,
-                envelope_concentration_ng_ul: draft.envelopeConcentration || null
-            })
+            body: JSON.stringify({ items })
+        });
+        ids.forEach((prepId, index) => {
+            state.transfectionDraft.get(prepId).metrics = response.results[index];
         });
-        draft.metrics = response;
     } catch (error) {
-        draft.metrics = null;
+        ids.forEach((prepId) => {
+            state.transfectionDraft.get(prepId).metrics = null;
+        });
     }
 }
 
+async function updateTransfectionMetrics(prepId) {
+    await updateTransfectionMetricsBatch([prepId]);
+}
+
 function buildTransfectionRow(prep) {
     const draft = state.transfectionDraft.get(prep.id);
     const row = document.createElement('tr');
@@ -1486,7 +1652,7 @@ function renderTransfectionSection() {
         return draft && draft.metrics === null;
     });
     if (pending.length) {
-        Promise.all(pending.map((id) => updateTransfectionMetrics(id))).then(() => {
+        updateTransfectionMetricsBatch(pending).then(() => {
             renderTransfectionSection();
         });
     }
@@ -1505,7 +1671,7 @@ function applyTransfectionBulk() {
         if (packaging !== '') draft.packagingConcentration = packaging;
         if (envelope !== '') draft.envelopeConcentration = envelope;
     });
-    Promise.all(getSelectedPrepIds().map((id) => updateTransfectionMetrics(id))).then(() => {
+    updateTransfectionMetricsBatch(getSelectedPrepIds()).then(() => {
         renderTransfectionSection();
     });
 }
@@ -2465,7 +2631,6 @@ document.addEventListener('DOMContentLoaded', async () => {
     document.getElementById('seedingVesselSelect').addEventListener('change', updateSeedingVolume);
     document.querySelector('[name="cells_to_seed"]').addEventListener('input', updateSeedingVolume);
     document.getElementById('seedingForm').addEventListener('submit', submitSeedingForm);
-    document.getElementById('refreshExperiments').addEventListener('click', loadExperiments);
     document.getElementById('prepExperimentSelect').addEventListener('change', (e) => loadPreps(parseInt(e.target.value, 10)));
     document.getElementById('prepForm').addEventListener('submit', submitPrepForm);
     document.getElementById('printPrepLabel').addEventListener('click', handlePrintPrepLabel);
@@ -2631,6 +2796,11 @@ function attachEventListeners() {
     document.getElementById('closeExperimentPanel').addEventListener('click', () => toggleNewExperimentPanel(false));
     document.getElementById('newExperimentForm').addEventListener('submit', createExperiment);
     document.getElementById('backToDashboard').addEventListener('click', showDashboard);
+    document.getElementById('loadMoreExperiments').addEventListener('click', loadMoreExperiments);
+    const refreshButton = document.getElementById('refreshExperiments');
+    if (refreshButton) {
+        refreshButton.addEventListener('click', syncChanges);
+    }
     document.getElementById('seedingDetailForm').addEventListener('submit', submitSeedingForm);
     document.getElementById('renameExperiment').addEventListener('click', renameExperiment);
     document.getElementById('toggleExperimentStatus').addEventListener('click', toggleExperimentStatus);
@@ -2731,7 +2901,9 @@ function attachEventListeners() {
 
 async function init() {
     attachEventListeners();
+    await startChangeSync();
     await loadExperiments();
+    window.setInterval(syncChanges, CHANGE_SYNC_INTERVAL_MS);
 }
 
 document.addEventListener('DOMContentLoaded', init);
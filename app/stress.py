@@ -0,0 +1,154 @@
+"""Concurrency stress test for prep plate allocation.
+
+:func:`stress_plate_allocation` builds a separate app on a temporary SQLite
+file, so the lab's database and its sync feed are never touched. It creates
+one experiment there and has many threads create preps and resize them at
+the same time. The write queue is
+bypassed for the run, so each thread behaves like a separate worker process
+with its own SQLite connection. Afterwards the experiment must not have more
+plates allocated than were seeded, and its ``plates_allocated`` rollup must
+match the sum of its preps.
+"""
+from __future__ import annotations
+
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from flask import Flask
+from sqlalchemy import func, select
+
+from .database import DB_FILENAME, READ_ENGINE_KEY, WRITE_QUEUE_KEY, db
+from .schema import migrate_schema
+from .models import Experiment, LentivirusPrep
+
+DEFAULT_THREADS = 16
+DEFAULT_ATTEMPTS = 400
+DEFAULT_CAPACITY = 40
+# Share of attempts that resize an existing prep rather than create one.
+RESIZE_SHARE = 0.3
+MAX_REPORTED_FAILURES = 10
+
+
+def _worker(app, experiment_id: int, attempts: int, rng: random.Random, start: threading.Barrier,
+            prep_ids: list[int], lock: threading.Lock, tally: dict, failures: list) -> None:
+    client = app.test_client()
+    start.wait()
+    for _ in range(attempts):
+        with lock:
+            prep_id = rng.choice(prep_ids) if prep_ids and rng.random() < RESIZE_SHARE else None
+        if prep_id is None:
+            outcome = 'created'
+            response = client.post(f'/api/experiments/{experiment_id}/preps', json={
+                'transfer_name': 'stress',
+                'plate_count': rng.randint(1, 3),
+            })
+        else:
+            outcome = 'resized'
+            response = client.put(f'/api/preps/{prep_id}', json={'plate_count': rng.randint(1, 4)})
+        if response.status_code == 400:
+            outcome = 'rejected'
+        elif response.status_code != 200:
+            outcome = 'failed'
+            with lock:
+                if len(failures) < MAX_REPORTED_FAILURES:
+                    failures.append({'status': response.status_code, 'body': response.get_data(as_text=True)})
+        elif prep_id is None:
+            with lock:
+                prep_ids.append(response.get_json()['prep']['id'])
+        with lock:
+            tally[outcome] += 1
+
+
+@contextmanager
+def scratch_app() -> Iterator[Flask]:
+    """An app, inside its app context, on a temporary database removed on exit."""
+    from . import create_app  # pylint: disable=import-outside-toplevel
+
+    with tempfile.TemporaryDirectory(prefix='lenti-stress-') as directory:
+        app = create_app(database_path=Path(directory) / DB_FILENAME)
+        with app.app_context():
+            try:
+                # The scratch file is new, so this also covers LENTI_AUTO_MIGRATE=0.
+                migrate_schema()
+                yield app
+            finally:
+                db.session.remove()
+                db.engine.dispose()
+                read_engine = app.extensions.get(READ_ENGINE_KEY)
+                if read_engine is not None:
+                    read_engine.dispose()
+
+
+def stress_plate_allocation(
+    threads: int = DEFAULT_THREADS,
+    attempts: int = DEFAULT_ATTEMPTS,
+    capacity: int = DEFAULT_CAPACITY,
+    seed: int = 0,
+) -> dict:
+    """Hammer one experiment's plate allocation from ``threads`` threads on a scratch database.
+
+    Returns a report whose ``ok`` is false if plates were over-allocated, the
+    rollup drifted, or any request failed with something other than a 400.
+    """
+    with scratch_app() as app:
+        client = app.test_client()
+        db.session.remove()
+        response = client.post('/api/experiments', json={
+            'name': 'allocation stress',
+            'cell_line': 'HEK293T',
+            'vessel_type': 'T175',
+            'cells_to_seed': '15M',
+            'vessels_seeded': capacity,
+        })
+        experiment_id = response.get_json()['experiment']['id']
+
+        tally = {'created': 0, 'resized': 0, 'rejected': 0, 'failed': 0}
+        failures: list[dict] = []
+        prep_ids: list[int] = []
+        lock = threading.Lock()
+        start = threading.Barrier(threads)
+        per_thread = [attempts // threads + (index < attempts % threads) for index in range(threads)]
+        workers = [
+            threading.Thread(
+                target=_worker,
+                args=(app, experiment_id, count, random.Random(seed * 1000 + index), start,
+                      prep_ids, lock, tally, failures),
+            )
+            for index, count in enumerate(per_thread)
+        ]
+
+        queue = app.extensions.pop(WRITE_QUEUE_KEY, None)
+        started = time.perf_counter()
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            if queue is not None:
+                app.extensions[WRITE_QUEUE_KEY] = queue
+        elapsed = time.perf_counter() - started
+
+        db.session.remove()
+        allocated = db.session.execute(
+            select(func.coalesce(func.sum(LentivirusPrep.plate_count), 0))
+            .where(LentivirusPrep.experiment_id == experiment_id)
+        ).scalar_one()
+        recorded = db.session.get(Experiment, experiment_id).plates_allocated
+
+        return {
+            'threads': threads,
+            'attempts': attempts,
+            'capacity': capacity,
+            'allocated': allocated,
+            'rollup': recorded,
+            'requests': tally,
+            'failures': failures,
+            'elapsed_seconds': round(elapsed, 3),
+            'ok': allocated <= capacity and recorded == allocated and not tally['failed'],
+        }
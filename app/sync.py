@@ -0,0 +1,223 @@
+"""Delta sync feed backing ``GET /api/changes``.
+
+Every synced table has a ``change_seq`` column. SQLite triggers stamp it from
+the single-row ``sync_counter`` table on each insert and update, and tombstones
+for deleted rows (:class:`DeletedRecord`, written by a session flush hook) are
+stamped the same way. Bumping the counter takes SQLite's write lock, and the
+transaction holds that lock until it commits, so stamps are handed out in
+commit order. A sync token is the counter value a poll read before any rows.
+Every row stamped at or below it had already committed, so the next poll
+(``change_seq`` above the token) cannot miss a slow transaction, however long
+it sat between flush and commit. Rows committed while a feed is being read
+may be delivered twice; clients merge by id.
+
+Timestamp tokens issued before change sequences are still accepted for one
+poll and compared against ``updated_at``.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable, Optional, Union
+
+from sqlalchemy import event, insert, or_, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, selectinload
+
+from .database import db
+from .models import (
+    DeletedRecord,
+    Experiment,
+    Harvest,
+    LentivirusPrep,
+    MediaChange,
+    SyncCounter,
+    TiterRun,
+    TiterSample,
+    Transfection,
+)
+from .queries import prep_detail_options, titer_run_options
+
+SyncPoint = Union[int, datetime]
+
+_COUNTER = SyncCounter.__tablename__
+SYNC_TABLES = tuple(
+    model.__tablename__
+    for model in (
+        Experiment, LentivirusPrep, Transfection, MediaChange, Harvest, TiterRun, TiterSample, DeletedRecord,
+    )
+)
+
+RECORD_TYPES = {
+    Experiment: 'experiment',
+    LentivirusPrep: 'prep',
+    Transfection: 'transfection',
+    MediaChange: 'media_change',
+    Harvest: 'harvest',
+    TiterRun: 'titer_run',
+}
+
+STAGE_MODELS = {
+    'transfections': Transfection,
+    'media_changes': MediaChange,
+    'harvests': Harvest,
+}
+
+
+def encode_sync_token(point: SyncPoint) -> str:
+    return point.isoformat() if isinstance(point, datetime) else str(point)
+
+
+def decode_sync_token(token: str) -> SyncPoint:
+    """Change sequence in ``token``, or the ``datetime`` of a pre-sequence token."""
+    if token.isascii() and token.isdigit():
+        return int(token)
+    try:
+        return datetime.fromisoformat(token)
+    except ValueError as exc:
+        raise ValueError('Invalid sync token') from exc
+
+
+def _stamp(table: str) -> str:
+    return (
+        f'UPDATE {_COUNTER} SET value = value + 1; '
+        f'UPDATE {table} SET change_seq = (SELECT value FROM {_COUNTER}) WHERE id = new.id;'
+    )
+
+
+def _trigger_statements() -> Iterable[str]:
+    for table in SYNC_TABLES:
+        yield (
+            f'CREATE TRIGGER IF NOT EXISTS {table}_sync_insert AFTER INSERT ON {table} '
+            f'BEGIN {_stamp(table)} END'
+        )
+        # The guard skips the trigger's own stamping update.
+        yield (
+            f'CREATE TRIGGER IF NOT EXISTS {table}_sync_update AFTER UPDATE ON {table} '
+            f'WHEN new.change_seq = old.change_seq BEGIN {_stamp(table)} END'
+        )
+
+
+def create_sync_sequence(connection: Connection) -> None:
+    """Seed ``sync_counter``, stamp unstamped rows and create the stamping triggers.
+
+    Rows that predate the triggers all get sequence 1, which the counter
+    starts at, so a token of ``0`` covers everything.
+    """
+    connection.exec_driver_sql(f'INSERT OR IGNORE INTO {_COUNTER} (id, value) VALUES (1, 1)')
+    for table in SYNC_TABLES:
+        connection.exec_driver_sql(f'UPDATE {table} SET change_seq = 1 WHERE change_seq = 0')
+    for statement in _trigger_statements():
+        connection.exec_driver_sql(statement)
+
+
+def current_sync_sequence(session) -> int:
+    """Highest change sequence committed as seen by ``session``; the next sync token."""
+    return session.execute(select(SyncCounter.value).where(SyncCounter.id == 1)).scalar() or 0
+
+
+def _changed_since(model, since: SyncPoint, timestamp=None):
+    if isinstance(since, datetime):
+        return (timestamp if timestamp is not None else model.updated_at) > since
+    return model.change_seq > since
+
+
+def _resolve_experiment_id(session: Session, instance) -> Optional[int]:
+    """Best-effort owning experiment of ``instance`` using the identity map only."""
+    if isinstance(instance, Experiment):
+        return instance.id
+    if isinstance(instance, (Transfection, MediaChange, Harvest, TiterRun)):
+        prep = session.identity_map.get(session.identity_key(LentivirusPrep, instance.prep_id))
+        if prep is None:
+            return None
+        instance = prep
+    return instance.experiment_id
+
+
+def _record_tombstones(session: Session, flush_context) -> None:
+    deleted_at = datetime.utcnow()
+    rows = [
+        {
+            'record_type': RECORD_TYPES[type(instance)],
+            'record_id': instance.id,
+            'experiment_id': _resolve_experiment_id(session, instance),
+            'deleted_at': deleted_at,
+        }
+        for instance in session.deleted
+        if type(instance) in RECORD_TYPES
+    ]
+    if rows:
+        session.connection().execute(insert(DeletedRecord.__table__), rows)
+
+
+def register_sync_hooks() -> None:
+    """Record a tombstone for every deleted experiment-graph row."""
+    if not event.contains(Session, 'after_flush', _record_tombstones):
+        event.listen(Session, 'after_flush', _record_tombstones)
+
+
+def collect_changes(since: Optional[SyncPoint]) -> dict:
+    """Build the delta payload for rows changed after ``since``.
+
+    Stage and titer changes also resend their prep, and prep changes resend
+    their experiment, so derived fields (status flags, rollups) stay in sync.
+    """
+    # Read before any rows: everything at or below it is already committed.
+    next_token = encode_sync_token(current_sync_sequence(db.session))
+    payload = {
+        'since': encode_sync_token(since) if since is not None else None,
+        'next_token': next_token,
+        'experiments': [],
+        'preps': [],
+        'transfections': [],
+        'media_changes': [],
+        'harvests': [],
+        'titer_runs': [],
+        'deleted': [],
+    }
+    if since is None:
+        return payload
+
+    prep_ids: set[int] = set()
+    for key, model in STAGE_MODELS.items():
+        stages = model.query.filter(_changed_since(model, since)).all()
+        payload[key] = [stage.to_dict() for stage in stages]
+        prep_ids.update(stage.prep_id for stage in stages)
+
+    changed_run_ids = TiterSample.query.with_entities(TiterSample.titer_run_id).filter(
+        _changed_since(TiterSample, since)
+    )
+    runs = (
+        TiterRun.query.options(*titer_run_options())
+        .filter(or_(_changed_since(TiterRun, since), TiterRun.id.in_(changed_run_ids)))
+        .all()
+    )
+    payload['titer_runs'] = [run.to_dict(include_samples=True) for run in runs]
+    prep_ids.update(run.prep_id for run in runs)
+
+    preps = (
+        LentivirusPrep.query.options(
+            selectinload(LentivirusPrep.experiment), *prep_detail_options()
+        )
+        .filter(or_(_changed_since(LentivirusPrep, since), LentivirusPrep.id.in_(prep_ids)))
+        .all()
+    )
+    payload['preps'] = [prep.to_dict() for prep in preps]
+
+    tombstones = (
+        DeletedRecord.query.filter(_changed_since(DeletedRecord, since, DeletedRecord.deleted_at))
+        .order_by(DeletedRecord.id)
+        .all()
+    )
+    payload['deleted'] = [tombstone.to_dict() for tombstone in tombstones]
+
+    experiment_ids = {prep.experiment_id for prep in preps}
+    experiment_ids.update(
+        tombstone.experiment_id
+        for tombstone in tombstones
+        if tombstone.experiment_id is not None and tombstone.record_type != 'experiment'
+    )
+    experiments = Experiment.query.filter(
+        or_(_changed_since(Experiment, since), Experiment.id.in_(experiment_ids))
+    ).all()
+    payload['experiments'] = [experiment.to_dict() for experiment in experiments]
+    return payload
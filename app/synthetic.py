@@ -0,0 +1,182 @@
+"""Seeded synthetic datasets for benchmarks and load tests.
+
+:func:`synthetic_experiments` yields experiment records shaped like the
+NDJSON import format. :func:`generate_dataset` feeds them through
+:func:`app.imports.import_records`, so generated rows pass the same
+validation, MOI/titer derivation and rollup maintenance as a real import.
+The same ``seed`` always produces the same dataset.
+
+Experiments are spread over the preceding ``days``. Anything older than two
+weeks has every prep transfected, fed, harvested and titered. Newer work is
+part-way through the pipeline, and the newest experiments are still active.
+"""
+from __future__ import annotations
+
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+from .constants import DEFAULT_MOLAR_RATIO
+from .imports import IMPORT_BATCH_SIZE, import_records
+from .scaling import seeding_volume, transfection_scaling
+
+CELL_LINES = ('HEK293T', 'HEK293FT', 'Lenti-X 293T')
+TARGET_CELL_LINES = ('HeLa', 'Jurkat', 'A549', 'K562', 'MCF7', 'U2OS', 'HEK293T', 'iPSC')
+TRANSFER_PLASMIDS = ('pLKO.1-shRNA', 'lentiCRISPRv2', 'lentiGuide-Puro', 'pLVX-EF1a', 'pCDH-CMV', 'pLX304')
+PRODUCER_VESSELS = ('T175', 'T75', '15 cm dish', '10 cm dish')
+TITER_VESSELS = ('6-well', '12-well', '24-well')
+SELECTIONS = (('puromycin', '2 ug/mL'), ('blasticidin', '10 ug/mL'), ('hygromycin', '200 ug/mL'))
+MEDIA = ('DMEM + 10% FBS', 'DMEM + 10% FBS + GlutaMAX', 'Opti-MEM + 5% FBS')
+
+COMPLETE_AFTER_DAYS = 14
+
+
+def _stage_progress(rng: random.Random, age_days: float) -> int:
+    """Pipeline stages reached: 1 transfected, 2 fed, 3 harvested, 4 titered."""
+    if age_days >= COMPLETE_AFTER_DAYS:
+        return 4
+    return min(4, int(age_days / 2) + rng.randint(0, 1))
+
+
+def _titer_run(rng: random.Random, created_at: datetime, sample_range: tuple[int, int]) -> dict:
+    cells_seeded = rng.choice((50_000, 100_000, 200_000))
+    # Functional titer of this prep; the dilution series samples the Poisson curve.
+    titer = 10 ** rng.uniform(6.0, 8.5)
+    reagent, concentration = rng.choice(SELECTIONS)
+    # measured_percent follows the results endpoint: percent of the control
+    # population lost under selection, i.e. 100 * exp(-MOI).
+    samples = [{'label': 'no virus', 'virus_volume_ul': 0.0, 'selection_used': True}]
+    volume = rng.choice((0.5, 1.0, 2.0))
+    for _ in range(rng.randint(*sample_range) - 1):
+        moi = titer * volume * 1e-3 / cells_seeded
+        lost = 100 * math.exp(-moi) * rng.uniform(0.9, 1.1)
+        samples.append({
+            'label': f'{volume:g} uL',
+            'virus_volume_ul': volume,
+            'selection_used': True,
+            'measured_percent': round(min(max(lost, 0.5), 99.5), 1),
+        })
+        volume *= 2
+    return {
+        'cell_line': rng.choice(TARGET_CELL_LINES),
+        'cells_seeded': cells_seeded,
+        'vessel_type': rng.choice(TITER_VESSELS),
+        'selection_reagent': reagent,
+        'selection_concentration': concentration,
+        'tests_count': 1,
+        'polybrene_ug_ml': 8,
+        'measurement_media_ml': 2,
+        'control_cell_concentration': round(cells_seeded * rng.uniform(3, 5)),
+        'created_at': created_at.isoformat(),
+        'samples': samples,
+    }
+
+
+def _prep(rng: random.Random, cell_line: str, vessel_type: str, created_at: datetime, now: datetime,
+          run_range: tuple[int, int], sample_range: tuple[int, int]) -> dict:
+    prep = {
+        'transfer_name': f'{rng.choice(TRANSFER_PLASMIDS)}-{rng.randint(1, 999):03d}',
+        'transfer_concentration': round(rng.uniform(200, 1500), 1),
+        'plasmid_size_bp': rng.randint(6_500, 14_000),
+        'cell_line_used': cell_line,
+        'plate_count': rng.randint(1, 2),
+        'created_at': created_at.isoformat(),
+    }
+    progress = _stage_progress(rng, (now - created_at).total_seconds() / 86_400)
+
+    def at(offset: timedelta) -> datetime:
+        return min(created_at + offset, now)
+
+    if progress >= 1:
+        concentrations = (prep['transfer_concentration'], rng.uniform(500, 1500), rng.uniform(500, 1500))
+        scaling = transfection_scaling(vessel_type, DEFAULT_MOLAR_RATIO)
+        masses = (scaling['transfer_mass_ug'], scaling['packaging_mass_ug'], scaling['envelope_mass_ug'])
+        prep['transfection'] = {
+            'vessel_type': vessel_type,
+            'opti_mem_ml': scaling['opti_mem_ml'],
+            'xtremegene_ul': scaling['xtremegene_ul'],
+            'total_plasmid_ug': scaling['total_plasmid_ug'],
+            'transfer_ratio': DEFAULT_MOLAR_RATIO[0],
+            'packaging_ratio': DEFAULT_MOLAR_RATIO[1],
+            'envelope_ratio': DEFAULT_MOLAR_RATIO[2],
+            'transfer_mass_ug': masses[0],
+            'packaging_mass_ug': masses[1],
+            'envelope_mass_ug': masses[2],
+            'ratio_mode': 'optimal',
+            'transfer_volume_ul': round(masses[0] * 1000 / concentrations[0], 2),
+            'packaging_volume_ul': round(masses[1] * 1000 / concentrations[1], 2),
+            'envelope_volume_ul': round(masses[2] * 1000 / concentrations[2], 2),
+            'transfer_concentration_ng_ul': concentrations[0],
+            'packaging_concentration_ng_ul': round(concentrations[1], 1),
+            'envelope_concentration_ng_ul': round(concentrations[2], 1),
+            'ratio_display': ':'.join(str(part) for part in DEFAULT_MOLAR_RATIO),
+            'created_at': at(timedelta(hours=4)).isoformat(),
+        }
+    volume_ml = round(seeding_volume(vessel_type, None), 1)
+    if progress >= 2:
+        prep['media_change'] = {
+            'media_type': rng.choice(MEDIA),
+            'volume_ml': volume_ml,
+            'created_at': at(timedelta(days=1)).isoformat(),
+        }
+    if progress >= 3:
+        harvested_at = at(timedelta(days=3))
+        prep['harvest'] = {
+            'harvest_date': harvested_at.date().isoformat(),
+            'volume_ml': round(volume_ml * prep['plate_count'] * rng.uniform(0.85, 1.0), 1),
+            'created_at': harvested_at.isoformat(),
+        }
+    if progress >= 4:
+        prep['titer_runs'] = [
+            _titer_run(rng, at(timedelta(days=4 + 3 * index)), sample_range)
+            for index in range(rng.randint(*run_range))
+        ]
+    return prep
+
+
+def synthetic_experiments(
+    count: int,
+    *,
+    preps: tuple[int, int] = (1, 4),
+    titer_runs: tuple[int, int] = (1, 2),
+    samples: tuple[int, int] = (4, 12),
+    days: int = 730,
+    seed: int = 0,
+    now: Optional[datetime] = None,
+) -> Iterator[dict]:
+    """Yield ``count`` experiment records, oldest first; ranges are inclusive."""
+    rng = random.Random(seed)
+    now = now or datetime.utcnow().replace(microsecond=0)
+    for index in range(count):
+        age_days = days * (count - index) / count
+        created_at = now - timedelta(days=age_days, minutes=rng.randint(0, 600))
+        cell_line = rng.choice(CELL_LINES)
+        vessel_type = rng.choice(PRODUCER_VESSELS)
+        prep_records = [
+            _prep(rng, cell_line, vessel_type, min(created_at + timedelta(days=1), now), now, titer_runs, samples)
+            for _ in range(rng.randint(*preps))
+        ]
+        cells_to_seed = rng.choice((5e6, 10e6, 15e6))
+        finished = age_days >= COMPLETE_AFTER_DAYS * 2
+        yield {
+            'name': f'{rng.choice(TRANSFER_PLASMIDS).split("-")[0]} batch {index + 1}',
+            'status': 'finished' if finished else 'active',
+            'finished_at': (created_at + timedelta(days=COMPLETE_AFTER_DAYS)).isoformat() if finished else None,
+            'cell_line': cell_line,
+            'passage_number': f'P{rng.randint(4, 25)}',
+            'cell_concentration': round(rng.uniform(0.8e6, 2.5e6)),
+            'cells_to_seed': cells_to_seed,
+            'vessel_type': vessel_type,
+            'seeding_volume_ml': round(seeding_volume(vessel_type, cells_to_seed), 2),
+            'media_type': MEDIA[0],
+            'vessels_seeded': sum(prep['plate_count'] for prep in prep_records) + rng.randint(0, 2),
+            'seeding_date': created_at.date().isoformat(),
+            'created_at': created_at.isoformat(),
+            'preps': prep_records,
+        }
+
+
+def generate_dataset(count: int, batch_size: int = IMPORT_BATCH_SIZE, **options) -> dict:
+    """Insert ``count`` synthetic experiments; returns the import report."""
+    return import_records(synthetic_experiments(count, **options), batch_size=batch_size)
@@ -2,7 +2,12 @@
 from __future__ import annotations
 
 import math
-from typing import Iterable, Optional
+from typing import Iterable, Optional, Sequence
+
+try:  # NumPy is optional; batch helpers fall back to pure Python without it.
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
 
 from .constants import BASE_SEEDING, BASE_TRANSFECTION, DEFAULT_MOLAR_RATIO, SURFACE_AREAS
 
@@ -26,14 +31,6 @@ def parse_positive_int(value, default: Optional[int] = None) -> Optional[int]:
     return int(round(number))
 
 
-def total_plate_count(experiment, exclude_prep_id: Optional[int] = None) -> int:
-    return sum(
-        (prep.plate_count or 0)
-        for prep in experiment.preps
-        if exclude_prep_id is None or prep.id != exclude_prep_id
-    )
-
-
 def parse_optional_float(value) -> Optional[float]:
     if value in (None, ''):
         return None
@@ -124,6 +121,170 @@ def compute_titer(cells_at_transduction: float, moi: float, virus_volume_ul: flo
     return cells_at_transduction * (moi / volume_ml)
 
 
+def compute_titer_batch(
+    survival_fractions: Sequence[float],
+    cells_at_transduction: Sequence[float],
+    virus_volumes_ul: Sequence[float],
+) -> tuple[list[float], list[float]]:
+    """Vectorized ``compute_moi``/``compute_titer`` over parallel sequences.
+
+    Returns ``(moi, titer)`` lists; uses one NumPy array pass when available.
+    """
+    if np is None or not survival_fractions:
+        mois, titers = [], []
+        for survival, cells, volume in zip(survival_fractions, cells_at_transduction, virus_volumes_ul):
+            moi = compute_moi(max(0.0, min(1.0, 1 - survival)))
+            mois.append(moi)
+            titers.append(compute_titer(cells, moi, volume))
+        return mois, titers
+
+    survival = np.asarray(survival_fractions, dtype=float)
+    cells = np.asarray(cells_at_transduction, dtype=float)
+    volumes = np.asarray(virus_volumes_ul, dtype=float)
+    fraction_infected = np.clip(1 - survival, 0.0, 1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moi = np.where(
+            fraction_infected >= 1,
+            np.inf,
+            np.where(fraction_infected <= 0, 0.0, -np.log(1 - fraction_infected)),
+        )
+        titer = np.where(volumes == 0, 0.0, cells * (moi / (volumes / 1000.0)))
+    return moi.tolist(), titer.tolist()
+
+
+TITER_FIT_MIN_FRACTION = 0.01
+TITER_FIT_MAX_FRACTION = 0.95
+TITER_FIT_ITERATIONS = 25
+
+# Two-sided 95% Student t quantiles for 1-30 degrees of freedom.
+_T_QUANTILES_95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)
+
+
+def _t_quantile_95(degrees_of_freedom: int) -> float:
+    if degrees_of_freedom <= len(_T_QUANTILES_95):
+        return _T_QUANTILES_95[degrees_of_freedom - 1]
+    return 1.96
+
+
+def _fit_result(titer: float, rss: float, jacobian_ss: float, used: int, total: int) -> dict:
+    result = {
+        'titer_tu_ml': None,
+        'ci_lower': None,
+        'ci_upper': None,
+        'points_used': used,
+        'points_excluded': total - used,
+    }
+    if used == 0 or not math.isfinite(titer):
+        return result
+    result['titer_tu_ml'] = round(titer, 2)
+    if used > 1 and jacobian_ss > 0:
+        margin = _t_quantile_95(used - 1) * math.sqrt(rss / (used - 1) / jacobian_ss)
+        result['ci_lower'] = round(max(0.0, titer - margin), 2)
+        result['ci_upper'] = round(titer + margin, 2)
+    return result
+
+
+def fit_poisson_titers(
+    groups: Sequence,
+    cells_at_transduction: Sequence[float],
+    virus_volumes_ul: Sequence[float],
+    fractions_infected: Sequence[float],
+    min_fraction: float = TITER_FIT_MIN_FRACTION,
+    max_fraction: float = TITER_FIT_MAX_FRACTION,
+) -> dict:
+    """Fit ``fraction_infected = 1 - exp(-titer * V / cells)`` per group.
+
+    Each group (typically a titer run) is fit by least squares on the infected
+    fraction: a linearized through-origin estimate on MOI seeds Gauss-Newton
+    iterations, all groups advancing together in array operations. Wells
+    outside ``(min_fraction, max_fraction)`` are excluded as near-zero or
+    saturated. Returns ``{group: result}`` with the fitted titer (TU/mL), a 95%
+    confidence interval and the used/excluded point counts.
+    """
+    keys = list(dict.fromkeys(groups))
+    if not keys:
+        return {}
+    position = {key: index for index, key in enumerate(keys)}
+
+    if np is None:
+        series: dict = {key: ([], [], 0) for key in keys}
+        for group, cells, volume, fraction in zip(groups, cells_at_transduction, virus_volumes_ul, fractions_infected):
+            xs, fs, total = series[group]
+            series[group] = (xs, fs, total + 1)
+            if cells and volume and min_fraction < fraction < max_fraction:
+                xs.append((volume / 1000.0) / cells)
+                fs.append(fraction)
+        results = {}
+        for key, (xs, fs, total) in series.items():
+            sxx = sum(x * x for x in xs)
+            titer = sum(x * -math.log(1 - f) for x, f in zip(xs, fs)) / sxx if sxx else float('nan')
+            jacobian_ss = rss = 0.0
+            for _ in range(TITER_FIT_ITERATIONS):
+                if not math.isfinite(titer):
+                    break
+                decays = [math.exp(-titer * x) for x in xs]
+                numerator = sum(x * e * (f - (1 - e)) for x, e, f in zip(xs, decays, fs))
+                jacobian_ss = sum((x * e) ** 2 for x, e in zip(xs, decays))
+                if not jacobian_ss:
+                    break
+                step = numerator / jacobian_ss
+                titer = max(titer + step, 0.0)
+                if abs(step) <= 1e-10 * max(titer, 1.0):
+                    break
+            if math.isfinite(titer):
+                decays = [math.exp(-titer * x) for x in xs]
+                rss = sum((f - (1 - e)) ** 2 for e, f in zip(decays, fs))
+                jacobian_ss = sum((x * e) ** 2 for x, e in zip(xs, decays))
+            results[key] = _fit_result(titer, rss, jacobian_ss, len(xs), total)
+        return results
+
+    index = np.fromiter((position[group] for group in groups), dtype=np.intp, count=len(groups))
+    cells = np.asarray(cells_at_transduction, dtype=float)
+    volumes = np.asarray(virus_volumes_ul, dtype=float)
+    fractions = np.asarray(fractions_infected, dtype=float)
+    size = len(keys)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (volumes / 1000.0) / cells
+        keep = (
+            np.isfinite(x) & (x > 0) & (fractions > min_fraction) & (fractions < max_fraction)
+        ).astype(float)
+        x = np.where(keep > 0, x, 0.0)
+        f = np.where(keep > 0, fractions, 0.0)
+
+        used = np.bincount(index, weights=keep, minlength=size)
+        totals = np.bincount(index, minlength=size)
+        sxx = np.bincount(index, weights=x * x, minlength=size)
+        sxy = np.bincount(index, weights=x * -np.log1p(-f), minlength=size)
+        titer = np.where(sxx > 0, sxy / sxx, np.nan)
+
+        for _ in range(TITER_FIT_ITERATIONS):
+            decay = np.exp(-titer[index] * x)
+            jacobian = x * decay * keep
+            numerator = np.bincount(index, weights=jacobian * (f - (1 - decay)), minlength=size)
+            jacobian_ss = np.bincount(index, weights=jacobian * jacobian, minlength=size)
+            step = np.where(jacobian_ss > 0, numerator / jacobian_ss, 0.0)
+            titer = np.maximum(titer + step, 0.0)
+            if not np.any(np.abs(step) > 1e-10 * np.maximum(titer, 1.0)):
+                break
+
+        decay = np.exp(-titer[index] * x)
+        residual = (f - (1 - decay)) * keep
+        rss = np.bincount(index, weights=residual * residual, minlength=size)
+        jacobian = x * decay * keep
+        jacobian_ss = np.bincount(index, weights=jacobian * jacobian, minlength=size)
+
+    return {
+        key: _fit_result(
+            float(titer[i]), float(rss[i]), float(jacobian_ss[i]), int(used[i]), int(totals[i])
+        )
+        for i, key in enumerate(keys)
+    }
+
+
 def round_titer_average(value: Optional[float]):
     if value in (None, 0):
         return 0 if value == 0 else None
@@ -0,0 +1,82 @@
+"""Cheap version tokens for conditional GETs on experiment resources.
+
+Each token hashes ``MAX(updated_at)`` and ``COUNT(*)`` of the tables a payload
+is built from, so an unchanged payload can be detected with one aggregate
+query instead of rebuilding the object graph.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from .database import db
+from .models import (
+    Experiment,
+    Harvest,
+    LentivirusPrep,
+    MediaChange,
+    TiterRun,
+    TiterSample,
+    Transfection,
+)
+
+PREP_STAGE_MODELS = (Transfection, MediaChange, Harvest, TiterRun)
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _aggregates(table, condition=None) -> list:
+    columns = []
+    for aggregate in (func.max(table.c.updated_at), func.count()):
+        statement = select(aggregate).select_from(table)
+        if condition is not None:
+            statement = statement.where(condition)
+        columns.append(statement.scalar_subquery())
+    return columns
+
+
+def collection_version(*scope) -> str:
+    """Token covering every experiment and child row; ``scope`` is mixed in."""
+    models = (Experiment, LentivirusPrep, *PREP_STAGE_MODELS, TiterSample)
+    columns = [column for model in models for column in _aggregates(model.__table__)]
+    row = db.session.execute(select(*columns)).one()
+    return _digest('experiments', scope, tuple(row))
+
+
+def experiment_version(experiment_id: int) -> Optional[str]:
+    """Token for one experiment and its children, or ``None`` if it does not exist."""
+    experiments = Experiment.__table__
+    preps = LentivirusPrep.__table__
+    runs = TiterRun.__table__
+    samples = TiterSample.__table__
+
+    prep_ids = select(preps.c.id).where(preps.c.experiment_id == experiment_id)
+    run_ids = select(runs.c.id).where(runs.c.prep_id.in_(prep_ids))
+    columns = [
+        select(experiments.c.updated_at)
+        .where(experiments.c.id == experiment_id)
+        .scalar_subquery(),
+        select(func.count())
+        .select_from(experiments)
+        .where(experiments.c.id == experiment_id)
+        .scalar_subquery(),
+        *_aggregates(preps, preps.c.experiment_id == experiment_id),
+    ]
+    for model in PREP_STAGE_MODELS:
+        table = model.__table__
+        columns.extend(_aggregates(table, table.c.prep_id.in_(prep_ids)))
+    columns.extend(_aggregates(samples, samples.c.titer_run_id.in_(run_ids)))
+
+    row = db.session.execute(select(*columns)).one()
+    if not row[1]:
+        return None
+    return _digest('experiment', experiment_id, tuple(row))
+
+
+def variant_version(version: str, *scope) -> str:
+    """Derive a token for a different rendering (e.g. a sparse fieldset) of ``version``."""
+    return _digest('variant', version, scope)